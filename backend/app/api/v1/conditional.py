@@ -0,0 +1,77 @@
+"""
+Conditional GET support: weak ETags derived from the table change counters.
+A request whose If-None-Match still matches gets a 304 before the endpoint runs.
+
+The counters only see this process's writes. A `marker` read from the database
+(e.g. row count and highest id) catches rows added or deleted by anyone else, and
+`refresh` bounds how long rows changed in place elsewhere can go unnoticed.
+"""
+import hashlib
+import secrets
+import time
+from typing import Any, Callable, Optional
+from fastapi import Depends, HTTPException, Request, Response
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app.db import versions
+from app.api.v1.endpoints.auth import get_db, oauth2_scheme
+
+Marker = Callable[[Request, Session], Any]
+
+# Change counters restart from zero with the process; this keeps old ETags from matching
+BOOT_ID = secrets.token_hex(4)
+
+def make_etag(request: Request, tables: tuple, refresh: Optional[float] = None, marker: Any = None) -> str:
+    """
+    ETag for the request's path and query at the current versions of `tables`.
+    With `refresh`, it also changes every `refresh` seconds, for responses that
+    depend on the time (e.g. trailing windows) or on writes made elsewhere.
+    """
+    parts = [request.url.path, request.url.query, *map(str, versions.current(*tables))]
+    if marker is not None:
+        parts.append(str(marker))
+    if refresh:
+        parts.append(str(int(time.time() // refresh)))
+    digest = hashlib.sha1("|".join(parts).encode()).hexdigest()[:16]
+    return f'W/"{BOOT_ID}-{digest}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison against an If-None-Match header."""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    opaque = etag.removeprefix("W/")
+    return "*" in candidates or any(tag.removeprefix("W/") == opaque for tag in candidates)
+
+def rows_marker(model, **filters) -> Marker:
+    """
+    Marker of the row count and highest id of `model`, optionally filtered on
+    columns by path parameters (column name -> path parameter name).
+    """
+    def marker(request: Request, db: Session):
+        query = db.query(func.count(model.id), func.max(model.id))
+        for name, parameter in filters.items():
+            column = getattr(model, name)
+            try:
+                # Path parameters arrive as strings, before the route validates them
+                value = column.type.python_type(request.path_params[parameter])
+            except ValueError:
+                return None
+            query = query.filter(column == value)
+        return tuple(query.one())
+    return marker
+
+def conditional(*tables: str, refresh: Optional[float] = None, marker: Optional[Marker] = None):
+    """
+    Route dependency adding an ETag to responses that read `tables`, and answering
+    304 Not Modified when the client's copy is current. A `refresh` of 0 disables it.
+    """
+    def check(request: Request, response: Response, db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
+        if refresh is not None and refresh <= 0:
+            return
+        etag = make_etag(request, tables, refresh, marker(request, db) if marker else None)
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            raise HTTPException(status_code=304, headers=headers)
+        response.headers.update(headers)
+    return Depends(check)
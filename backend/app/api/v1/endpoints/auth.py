@@ -1,12 +1,18 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Response, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
+from app.db import versions
 from app.db.base import SessionLocal
 from app.models import User
 from app.schemas import auth as schemas
-from app.core import security
+from app.core import config, security
+from app.core.cache import VersionedCache
+from app.core.throttle import SlidingWindowLimiter, client_address
+import math
 import re
-from typing import Optional
+import time
+from typing import Optional, Tuple
 
 router = APIRouter()
 
@@ -35,8 +41,45 @@ def get_token(request: Request, token_header: Optional[str] = Depends(oauth2_sch
         headers={"WWW-Authenticate": "Bearer"},
     )
 
-# Alias for other modules to use
-oauth2_scheme = get_token
+# Verified tokens and their users. Keyed on the users table version, so any
+# committed change to a user (password, deletion) drops every entry at once.
+principal_cache = VersionedCache(ttl=config.AUTH_CACHE_TTL_SECONDS, max_entries=config.AUTH_CACHE_MAX_ENTRIES)
+
+def _invalid_token() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+def authenticate(token: str, db: Session) -> schemas.User:
+    """
+    Resolves a token to its user, verifying the JWT and reading the user only
+    when the token isn't cached. Raises a 401 for invalid, expired or revoked tokens.
+    """
+    def verify() -> Tuple[schemas.User, float]:
+        payload = security.decode_access_token(token)
+        if payload is None or payload.get("sub") is None:
+            raise _invalid_token()
+        user = db.query(User).filter(User.username == payload["sub"]).first()
+        if user is None:
+            raise _invalid_token()
+        return schemas.User.model_validate(user), payload["exp"]
+
+    user, expires_at = principal_cache.get_or_compute(token, versions.current("users"), verify)
+    if expires_at <= time.time() or security.is_token_revoked(token):
+        principal_cache.discard(token)
+        raise _invalid_token()
+    return user
+
+def get_current_user(token: str = Depends(get_token), db: Session = Depends(get_db)) -> schemas.User:
+    return authenticate(token, db)
+
+def verified_token(token: str = Depends(get_token), user: schemas.User = Depends(get_current_user)) -> str:
+    return token
+
+# Alias for other modules to use: the request's token, once verified
+oauth2_scheme = verified_token
 
 def validate_password(password: str) -> bool:
     """
@@ -52,15 +95,55 @@ def validate_password(password: str) -> bool:
     if len(re.findall(r"\d", password)) < 2: return False
     return True
 
+# Failed login attempts per client IP and per username
+login_attempts_by_ip = SlidingWindowLimiter(config.LOGIN_MAX_ATTEMPTS_PER_IP, config.LOGIN_THROTTLE_WINDOW_SECONDS)
+login_attempts_by_username = SlidingWindowLimiter(config.LOGIN_MAX_ATTEMPTS_PER_USERNAME, config.LOGIN_THROTTLE_WINDOW_SECONDS)
+
+async def _hash_password_task(func, *args):
+    """Runs a bcrypt call on the password pool, answering 503 when it is saturated."""
+    try:
+        return await security.run_password_task(func, *args)
+    except security.PasswordHasherBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many logins in progress, try again shortly",
+            headers={"Retry-After": "1"},
+        )
+
 @router.post("/token", response_model=schemas.Token)
-def login_for_access_token(response: Response, form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == form_data.username).first()
-    if not user or not security.verify_password(form_data.password, user.password_hash):
+async def login_for_access_token(request: Request, response: Response, form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+    # Attempts are counted before the password is checked, so concurrent guesses can't exceed the limits
+    client_ip = client_address(request)
+    username = form_data.username.lower()
+    retry_after = login_attempts_by_ip.attempt(client_ip)
+    if not retry_after:
+        retry_after = login_attempts_by_username.attempt(username)
+        if retry_after:
+            login_attempts_by_ip.refund(client_ip)
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many login attempts, try again later",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+
+    try:
+        # Database work stays off the event loop, like the password check
+        user = await run_in_threadpool(_find_user, db, form_data.username)
+        verified = user is not None and await _hash_password_task(security.verify_password, form_data.password, user.password_hash)
+    except HTTPException:
+        # A busy pool is not a failed attempt
+        login_attempts_by_ip.refund(client_ip)
+        login_attempts_by_username.refund(username)
+        raise
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    login_attempts_by_ip.refund(client_ip)
+    login_attempts_by_username.reset(username)
     
     access_token = security.create_access_token(subject=user.username)
     
@@ -76,47 +159,44 @@ def login_for_access_token(response: Response, form_data: OAuth2PasswordRequestF
     
     return {"access_token": access_token, "token_type": "bearer"}
 
+def _find_user(db: Session, username: str) -> Optional[User]:
+    return db.query(User).filter(User.username == username).first()
+
 @router.post("/setup", response_model=schemas.User)
-def setup_admin(setup_data: schemas.SetupRequest, db: Session = Depends(get_db)):
+async def setup_admin(setup_data: schemas.SetupRequest, db: Session = Depends(get_db)):
     """
     Creates the first admin user. Fails if any user already exists.
     """
-    if db.query(User).count() > 0:
+    if await run_in_threadpool(db.query(User).count) > 0:
         raise HTTPException(status_code=400, detail="Setup already completed.")
 
     if not validate_password(setup_data.password):
         raise HTTPException(status_code=400, detail="Password does not meet complexity requirements.")
 
-    hashed_password = security.get_password_hash(setup_data.password)
+    hashed_password = await _hash_password_task(security.get_password_hash, setup_data.password)
+    return await run_in_threadpool(_create_admin, db, setup_data.username, hashed_password)
+
+def _create_admin(db: Session, username: str, password_hash: str) -> User:
     new_user = User(
-        username=setup_data.username,
-        password_hash=hashed_password,
+        username=username,
+        password_hash=password_hash,
         role="admin"
     )
     db.add(new_user)
     db.commit()
     db.refresh(new_user)
-    db.refresh(new_user)
     return new_user
 
 @router.post("/logout")
-def logout(response: Response):
+def logout(request: Request, response: Response, token_header: Optional[str] = Depends(oauth2_scheme_header)):
+    # Revoke the token too, or a copy of it would keep working until it expires
+    token = request.cookies.get("access_token") or token_header
+    if token:
+        security.revoke_access_token(token)
+        principal_cache.discard(token)
     response.delete_cookie("access_token")
     return {"message": "Logged out"}
 
 @router.get("/me", response_model=schemas.User)
-def read_users_me(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
-    # Decode token to get username
-    # This logic should ideally be in a dependency "get_current_user" but for now:
-    try:
-        payload = security.jwt.decode(token, security.SECRET_KEY, algorithms=[security.ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-    except security.JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
-        
-    user = db.query(User).filter(User.username == username).first()
-    if user is None:
-        raise HTTPException(status_code=401, detail="User not found")
+def read_users_me(user: schemas.User = Depends(get_current_user)):
     return user
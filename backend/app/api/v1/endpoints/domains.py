@@ -1,19 +1,90 @@
-from fastapi import APIRouter, Depends, HTTPException
+import json
+import time
+from collections import Counter
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import and_, not_
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional, Tuple, Type
+from app.core import config
+from app.core.ip_fetcher import IPFetcher
 from app.db.base import SessionLocal
+from app.db.dialects import escape_like, starts_with
 from app.models import Domain, Provider, IPHistory
 from app.schemas import resources as schemas
 from app.api.v1.endpoints.auth import get_db, oauth2_scheme
+from app.api.v1.conditional import conditional, rows_marker
+from app.api.v1.ndjson import is_ndjson, iter_ndjson, parse_json
+from app.api.v1.pagination import decode_id_cursor, id_cursor, older_than, paginate, set_next_link, timestamp_cursor
+from app.api.v1.responses import schema_columns, schema_list_response
 from app.services.ddns_service import DDNSService
-from app.services.scheduler import get_scheduler
+from app.services.history_sink import get_history_sink
+from app.services.jobs import JobQueueFull, get_job_registry
+from app.services.rollups import delete_domain_rollups
+from app.services.scheduler import get_scheduler, is_valid_cron
 
 router = APIRouter()
 
-@router.get("", response_model=List[schemas.Domain])
-async def read_domains(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
-    domains = db.query(Domain).offset(skip).limit(limit).all()
-    return domains
+@router.get("", response_model=List[schemas.Domain], dependencies=[conditional(
+    "domains", refresh=config.ETAG_REFRESH_SECONDS, marker=rows_marker(Domain)
+)])
+async def read_domains(
+    request: Request,
+    response: Response,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    provider_id: Optional[int] = None,
+    status: Optional[str] = None,
+    name: Optional[str] = None,
+    prefix: Optional[str] = None,
+    scheduled: Optional[bool] = None,
+    db: Session = Depends(get_db),
+    token: str = Depends(oauth2_scheme)
+):
+    """
+    List domains ordered by id, optionally filtered (see `_filter_domains`).
+    When more remain, the Link and X-Next-Cursor headers carry the cursor of the
+    next page; `skip` is kept for older clients.
+    """
+    query = db.query(*schema_columns(Domain, schemas.Domain)).order_by(Domain.id)
+    query = _filter_domains(db, query, provider_id, status, name, prefix, scheduled)
+    if cursor:
+        query = query.filter(Domain.id > decode_id_cursor(cursor))
+    else:
+        query = query.offset(skip)
+    domains, next_cursor = paginate(query.limit(limit + 1).all(), limit, id_cursor)
+    set_next_link(request, response, next_cursor)
+    return schema_list_response(schemas.Domain, domains, response)
+
+def _filter_domains(
+    db: Session,
+    query,
+    provider_id: Optional[int],
+    status: Optional[str],
+    name: Optional[str],
+    prefix: Optional[str],
+    scheduled: Optional[bool]
+):
+    """
+    Narrows a domain query to one provider, a last update status, names containing
+    `name` or starting with `prefix` (both case-insensitive), and domains with
+    (`scheduled=true`) or without a cron schedule.
+    """
+    if provider_id is not None:
+        query = query.filter(Domain.provider_id == provider_id)
+    if status is not None:
+        query = query.filter(Domain.last_update_status == status.upper())
+    if name:
+        query = query.filter(Domain.domain_name.ilike(f"%{escape_like(name)}%", escape="\\"))
+    if prefix:
+        query = query.filter(starts_with(db.get_bind(), Domain.domain_name, prefix))
+    if scheduled is not None:
+        has_schedule = and_(Domain.cron_schedule.is_not(None), Domain.cron_schedule != "")
+        query = query.filter(has_schedule if scheduled else not_(has_schedule))
+    return query
 
 @router.post("", response_model=schemas.Domain)
 async def create_domain(domain: schemas.DomainCreate, db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
@@ -39,22 +110,236 @@ async def create_domain(domain: schemas.DomainCreate, db: Session = Depends(get_
     
     return new_domain
 
-@router.put("/{domain_id}", response_model=schemas.Domain)
-async def update_domain(domain_id: int, domain_update: schemas.DomainUpdate, db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
-    db_domain = db.query(Domain).filter(Domain.id == domain_id).first()
-    if not db_domain:
-        raise HTTPException(status_code=404, detail="Domain not found")
-    
+@router.post("/bulk")
+async def create_domains_bulk(request: Request, db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
+    """
+    Create many domains from a JSON array, or one domain per line with
+    Content-Type application/x-ndjson. Every item is validated first; if any is
+    invalid nothing is created and the errors are returned per item (422).
+    Domains are inserted in one transaction and scheduled in one scheduler operation.
+    """
+    items = await _read_bulk_items(request)
+    creates, errors = _validate_items(items, schemas.DomainCreate)
+
+    provider_ids = {domain.provider_id for _, domain in creates}
+    known_providers = {row.id for row in db.query(Provider.id).filter(Provider.id.in_(provider_ids))}
+    for index, domain in creates:
+        if domain.provider_id not in known_providers:
+            errors.append({"index": index, "error": "Provider not found"})
+        if domain.cron_schedule and not is_valid_cron(domain.cron_schedule):
+            errors.append({"index": index, "error": f"Invalid cron expression: {domain.cron_schedule}"})
+    _raise_for_errors(errors)
+
+    new_domains = [
+        Domain(
+            provider_id=domain.provider_id,
+            domain_name=domain.domain_name,
+            external_id=domain.external_id,
+            config=domain.config,
+            cron_schedule=domain.cron_schedule
+        )
+        for _, domain in creates
+    ]
+    db.add_all(new_domains)
+    db.flush()
+    # Read the ids before committing, which would expire every object
+    ids = [domain.id for domain in new_domains]
+    db.commit()
+
+    schedules = {domain_id: domain.cron_schedule for domain_id, (_, domain) in zip(ids, creates) if domain.cron_schedule}
+    if schedules:
+        get_scheduler().add_schedules(schedules)
+
+    return {
+        "created": len(ids),
+        "results": [{"index": index, "id": domain_id, "status": "created"} for index, domain_id in enumerate(ids)]
+    }
+
+@router.put("/bulk")
+async def update_domains_bulk(request: Request, db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
+    """
+    Update many domains, given as a JSON array (or NDJSON) of updates with their `id`.
+    Validated and applied like `POST /bulk`: all in one transaction, or none.
+    """
+    items = await _read_bulk_items(request)
+    updates, errors = _validate_items(items, schemas.DomainBulkUpdate)
+
+    domains = {domain.id: domain for domain in db.query(Domain).filter(Domain.id.in_({update.id for _, update in updates}))}
+    seen = set()
+    for index, update in updates:
+        if update.id not in domains:
+            errors.append({"index": index, "error": "Domain not found"})
+        elif update.id in seen:
+            errors.append({"index": index, "error": f"Domain {update.id} is updated more than once"})
+        seen.add(update.id)
+        if update.cron_schedule and not is_valid_cron(update.cron_schedule):
+            errors.append({"index": index, "error": f"Invalid cron expression: {update.cron_schedule}"})
+    _raise_for_errors(errors)
+
+    schedules, unscheduled = {}, []
+    for _, update in updates:
+        _apply_domain_update(domains[update.id], update)
+        if update.cron_schedule:
+            schedules[update.id] = update.cron_schedule
+        elif update.cron_schedule is not None:
+            unscheduled.append(update.id)
+    db.commit()
+
+    scheduler = get_scheduler()
+    if schedules:
+        scheduler.add_schedules(schedules)
+    if unscheduled:
+        scheduler.remove_schedules(unscheduled)
+
+    return {
+        "updated": len(updates),
+        "results": [{"index": index, "id": update.id, "status": "updated"} for index, update in updates]
+    }
+
+@router.post("/bulk/delete")
+async def delete_domains_bulk(body: schemas.DomainBulkDelete, db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
+    """
+    Delete many domains and their history in one transaction.
+    If any id does not exist, nothing is deleted.
+    """
+    ids = list(dict.fromkeys(body.ids))
+    if len(ids) > config.DOMAINS_BULK_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {config.DOMAINS_BULK_MAX_ITEMS} domains per request")
+    existing = {row.id for row in db.query(Domain.id).filter(Domain.id.in_(ids))}
+    _raise_for_errors([
+        {"index": index, "error": "Domain not found"}
+        for index, domain_id in enumerate(body.ids) if domain_id not in existing
+    ])
+
+    db.query(IPHistory).filter(IPHistory.domain_id.in_(ids)).delete(synchronize_session=False)
+    delete_domain_rollups(db, ids)
+    db.query(Domain).filter(Domain.id.in_(ids)).delete(synchronize_session=False)
+    db.commit()
+    get_scheduler().remove_schedules(ids)
+
+    return {
+        "deleted": len(ids),
+        "results": [{"id": domain_id, "status": "deleted"} for domain_id in ids]
+    }
+
+async def _read_bulk_items(request: Request) -> List:
+    """
+    Items of a bulk request body. NDJSON bodies are parsed line by line as they
+    arrive; anything else must be a JSON array. Both are capped at DOMAINS_BULK_MAX_ITEMS.
+    """
+    too_many = HTTPException(status_code=413, detail=f"At most {config.DOMAINS_BULK_MAX_ITEMS} domains per request")
+    if is_ndjson(request):
+        items = []
+        async for _, item in iter_ndjson(request):
+            items.append(item)
+            if len(items) > config.DOMAINS_BULK_MAX_ITEMS:
+                raise too_many
+    else:
+        items = parse_json(await request.body(), "body")
+        if not isinstance(items, list):
+            raise HTTPException(status_code=400, detail="Expected a JSON array")
+    if len(items) > config.DOMAINS_BULK_MAX_ITEMS:
+        raise too_many
+    return items
+
+def _validate_items(items: List, schema: Type[BaseModel]) -> Tuple[List[Tuple[int, BaseModel]], List[dict]]:
+    """Validates each item against `schema`. Returns the (index, model) pairs and per-item errors."""
+    valid, errors = [], []
+    for index, item in enumerate(items):
+        try:
+            valid.append((index, schema.model_validate(item)))
+        except ValidationError as e:
+            message = "; ".join(f"{'.'.join(map(str, error['loc'])) or 'item'}: {error['msg']}" for error in e.errors())
+            errors.append({"index": index, "error": message})
+    return valid, errors
+
+def _raise_for_errors(errors: List[dict]):
+    if errors:
+        raise HTTPException(
+            status_code=422,
+            detail={"message": "No domains were changed", "errors": sorted(errors, key=lambda error: error["index"])}
+        )
+
+def _apply_domain_update(db_domain: Domain, domain_update: schemas.DomainUpdate):
     if domain_update.domain_name is not None:
         db_domain.domain_name = domain_update.domain_name
     if domain_update.external_id is not None:
         db_domain.external_id = domain_update.external_id
     if domain_update.config is not None:
         db_domain.config = domain_update.config
+    if domain_update.cron_schedule is not None:
+        db_domain.cron_schedule = domain_update.cron_schedule
+
+@router.post("/update_all")
+async def update_all_domains(
+    request: Request,
+    provider_id: Optional[int] = None,
+    status: Optional[str] = None,
+    name: Optional[str] = None,
+    prefix: Optional[str] = None,
+    scheduled: Optional[bool] = None,
+    force: bool = True,
+    db: Session = Depends(get_db),
+    token: str = Depends(oauth2_scheme)
+):
+    """
+    Update every domain of an enabled provider, optionally only those matching the
+    same filters as the domain list. The current IP is
+    fetched once and the updates run concurrently. Each domain's result is streamed
+    as an NDJSON line as soon as it completes (or as a Server-Sent Event when the
+    client accepts text/event-stream), followed by a summary.
+    Without `force`, domains already at the current IP are skipped.
+    """
+    query = db.query(Domain).join(Provider).filter(Provider.is_enabled == True)
+    query = _filter_domains(db, query, provider_id, status, name, prefix, scheduled)
+    domains = query.order_by(Domain.id).all()
+
+    try:
+        current_ip = await IPFetcher().get_current_ip()
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Could not determine the current IP: {e}")
+
+    sink = get_history_sink()
+    service = DDNSService(db, sink=sink)
+    stream_events = "text/event-stream" in request.headers.get("accept", "")
+
+    async def results():
+        started = time.perf_counter()
+        counts = Counter()
+        # Updates already started finish on their own sessions even if the client
+        # disconnects; their history is then written by the sink's periodic flush.
+        async for result in service.update_domains(domains, current_ip, force=force):
+            counts[result["status"]] += 1
+            yield _format_update_event("result", result, stream_events)
+        # Write the queued history and statuses before reporting completion
+        await run_in_threadpool(sink.flush)
+        yield _format_update_event("summary", {
+            "ip_address": current_ip,
+            "total": len(domains),
+            "succeeded": counts["SUCCESS"],
+            "failed": counts["FAILED"],
+            "unchanged": counts["UNCHANGED"],
+            "duration_ms": round((time.perf_counter() - started) * 1000, 3)
+        }, stream_events)
+
+    media_type = "text/event-stream" if stream_events else "application/x-ndjson"
+    return StreamingResponse(results(), media_type=media_type, headers={"Cache-Control": "no-cache"})
+
+def _format_update_event(event_type: str, data: dict, stream_events: bool) -> str:
+    if stream_events:
+        return f"event: {event_type}\ndata: {json.dumps(data)}\n\n"
+    return json.dumps({"type": event_type, **data}) + "\n"
+
+@router.put("/{domain_id}", response_model=schemas.Domain)
+async def update_domain(domain_id: int, domain_update: schemas.DomainUpdate, db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
+    db_domain = db.query(Domain).filter(Domain.id == domain_id).first()
+    if not db_domain:
+        raise HTTPException(status_code=404, detail="Domain not found")
+    
+    _apply_domain_update(db_domain, domain_update)
     
     # Update cron schedule
     if domain_update.cron_schedule is not None:
-        db_domain.cron_schedule = domain_update.cron_schedule
         scheduler = get_scheduler()
         if domain_update.cron_schedule:
             scheduler.add_schedule(db_domain.id, domain_update.cron_schedule)
@@ -65,10 +350,29 @@ async def update_domain(domain_id: int, domain_update: schemas.DomainUpdate, db:
     db.refresh(db_domain)
     return db_domain
 
-@router.get("/{domain_id}/history", response_model=List[schemas.IPHistory])
-async def read_domain_history(domain_id: int, limit: int = 20, db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
-    history = db.query(IPHistory).filter(IPHistory.domain_id == domain_id).order_by(IPHistory.timestamp.desc()).limit(limit).all()
-    return history
+@router.get("/{domain_id}/history", response_model=List[schemas.IPHistory], dependencies=[conditional(
+    "ip_history", refresh=config.ETAG_REFRESH_SECONDS, marker=rows_marker(IPHistory, domain_id="domain_id")
+)])
+async def read_domain_history(
+    domain_id: int,
+    request: Request,
+    response: Response,
+    limit: int = Query(20, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+    token: str = Depends(oauth2_scheme)
+):
+    """
+    Domain history, newest first, paged by (timestamp, id) cursors in the
+    Link and X-Next-Cursor headers.
+    """
+    query = db.query(*schema_columns(IPHistory, schemas.IPHistory)).filter(IPHistory.domain_id == domain_id)
+    if cursor:
+        query = query.filter(older_than(IPHistory.timestamp, IPHistory.id, cursor))
+    query = query.order_by(IPHistory.timestamp.desc(), IPHistory.id.desc()).limit(limit + 1)
+    history, next_cursor = paginate(query.all(), limit, timestamp_cursor)
+    set_next_link(request, response, next_cursor)
+    return schema_list_response(schemas.IPHistory, history, response)
 
 @router.delete("/{domain_id}")
 async def delete_domain(domain_id: int, db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
@@ -80,12 +384,27 @@ async def delete_domain(domain_id: int, db: Session = Depends(get_db), token: st
     scheduler = get_scheduler()
     scheduler.remove_schedule(domain_id)
     
+    delete_domain_rollups(db, [domain_id])
     db.delete(domain)
     db.commit()
     return {"message": "Domain deleted successfully"}
 
 @router.post("/{domain_id}/update_ip")
-async def update_domain_ip(domain_id: int, db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
+async def update_domain_ip(
+    domain_id: int,
+    response: Response,
+    run_async: bool = Query(False, alias="async"),
+    prefer: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+    token: str = Depends(oauth2_scheme)
+):
+    """
+    Update the domain's IP and wait for the result. With `?async=true` or
+    `Prefer: respond-async`, the update is queued on the scheduler instead and a
+    202 is returned with the job, whose status is at /api/v1/jobs/{id}.
+    """
+    if run_async or "respond-async" in (prefer or ""):
+        return _enqueue_update(domain_id, response, db)
     service = DDNSService(db)
     try:
         success = await service.update_domain_ip(domain_id)
@@ -97,3 +416,26 @@ async def update_domain_ip(domain_id: int, db: Session = Depends(get_db), token:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+def _enqueue_update(domain_id: int, response: Response, db: Session) -> dict:
+    domain = db.query(Domain).filter(Domain.id == domain_id).first()
+    if not domain:
+        raise HTTPException(status_code=404, detail="Domain not found")
+    if not domain.provider.is_enabled:
+        raise HTTPException(status_code=400, detail="Provider is disabled")
+
+    registry = get_job_registry()
+    try:
+        job, created = registry.create(domain_id)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    if created:
+        try:
+            get_scheduler().enqueue_update(job)
+        except Exception as e:
+            registry.discard(job)
+            raise HTTPException(status_code=503, detail=f"Could not queue the update: {e}")
+
+    response.status_code = status.HTTP_202_ACCEPTED
+    response.headers["Location"] = f"/api/v1/jobs/{job.id}"
+    return job.to_dict()
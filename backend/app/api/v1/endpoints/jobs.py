@@ -0,0 +1,23 @@
+from fastapi import APIRouter, Depends, HTTPException
+from app.api.v1.endpoints.auth import oauth2_scheme
+from app.services.jobs import get_job_registry
+
+router = APIRouter()
+
+@router.get("")
+def read_jobs(token: str = Depends(oauth2_scheme)):
+    """
+    List tracked update jobs, newest first.
+    """
+    return [job.to_dict() for job in get_job_registry().list()]
+
+@router.get("/{job_id}")
+def read_job(job_id: str, token: str = Depends(oauth2_scheme)):
+    """
+    Get the status of an update job: queued, running, succeeded or failed.
+    Finished jobs are forgotten once UPDATE_JOBS_MAX newer jobs have been created.
+    """
+    job = get_job_registry().get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
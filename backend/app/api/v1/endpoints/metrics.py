@@ -1,69 +1,122 @@
-from fastapi import APIRouter, Depends
+import functools
+import inspect
+import json
+import math
+import secrets
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from prometheus_client import CONTENT_TYPE_LATEST
 from sqlalchemy.orm import Session
-from sqlalchemy import func, Integer
+from sqlalchemy import and_, case, func, select, Integer
 from datetime import datetime, timedelta, UTC
+from app.core import config, telemetry
+from app.core.cache import VersionedCache
+from app.db import versions
+from app.db.dialects import truncate_timestamp
 from app.db.base import SessionLocal
-from app.models import Domain, Provider, IPHistory
-from app.api.v1.endpoints.auth import get_db, oauth2_scheme
+from app.models import Domain, Provider, IPHistory, DomainStatsHourly, ProviderStatsHourly, IPSeenHourly, IPChangesHourly
+from app.api.v1.endpoints.auth import authenticate, get_db, get_token, oauth2_scheme
+from app.api.v1.conditional import conditional
+from app.api.v1.pagination import older_than, paginate, timestamp_cursor
+from app.api.v1.responses import FastJSONResponse, with_headers_of
+from app.services.event_bus import Subscription, get_event_bus
+from app.services.rollups import bucket_start, window_start
 
 router = APIRouter()
 
-@router.get("/dashboard")
+# Idle activity streams send a comment this often to keep proxies from closing them
+SSE_KEEPALIVE_SECONDS = 15
+
+metrics_cache = VersionedCache(ttl=config.METRICS_CACHE_TTL_SECONDS)
+
+def cached(*tables: str):
+    """
+    Caches a metrics function's result for METRICS_CACHE_TTL_SECONDS, per function and
+    parameters. Writes committed to any of `tables` invalidate it immediately; the
+    rollup tables change together with ip_history.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            arguments = signature.bind(*args, **kwargs).arguments
+            params = tuple(sorted((name, value) for name, value in arguments.items() if name not in ("db", "token")))
+            return metrics_cache.get_or_compute(
+                (func.__name__, params),
+                versions.current(*tables),
+                lambda: func(*args, **kwargs)
+            )
+        return wrapper
+    return decorator
+
+def metrics_endpoint(path: str, *tables: str):
+    """
+    Registers a GET endpoint whose response is cached and served with an ETag,
+    both keyed on the change counters of `tables`. Results are rendered with
+    FastJSONResponse. Returns the cached function.
+    """
+    conditional_get = conditional(*tables, refresh=config.METRICS_CACHE_TTL_SECONDS)
+
+    def decorator(func):
+        endpoint = cached(*tables)(func)
+        router.get(path, response_class=FastJSONResponse, dependencies=[conditional_get])(_rendered(endpoint))
+        return endpoint
+    return decorator
+
+def _rendered(endpoint):
+    """
+    Wraps an endpoint to return its result as a FastJSONResponse, keeping the
+    headers set by dependencies (see `with_headers_of`).
+    """
+    signature = inspect.signature(endpoint)
+
+    @functools.wraps(endpoint)
+    def render(*args, response: Response, **kwargs):
+        return with_headers_of(FastJSONResponse(endpoint(*args, **kwargs)), response)
+    render.__signature__ = signature.replace(parameters=[
+        *signature.parameters.values(),
+        inspect.Parameter("response", inspect.Parameter.KEYWORD_ONLY, annotation=Response)
+    ])
+    return render
+
+def _rollup_totals(db: Session, since: datetime, provider_id: int = None):
+    """
+    Sums the hourly provider rollups from `since` onwards.
+    Returns (attempts, successes, failures).
+    """
+    query = db.query(
+        func.coalesce(func.sum(ProviderStatsHourly.attempts), 0),
+        func.coalesce(func.sum(ProviderStatsHourly.successes), 0),
+        func.coalesce(func.sum(ProviderStatsHourly.failures), 0)
+    ).filter(ProviderStatsHourly.bucket_start >= since)
+    if provider_id is not None:
+        query = query.filter(ProviderStatsHourly.provider_id == provider_id)
+    return query.one()
+
+@metrics_endpoint("/dashboard", "domains", "providers", "ip_history")
 def get_dashboard_metrics(
     db: Session = Depends(get_db),
     token: str = Depends(oauth2_scheme)
 ):
     """
     Get dashboard metrics including domain stats, success rates, and provider statistics.
+    Update counts come from the hourly rollups, so the 24h window is hour-aligned.
     """
-    # Total domains
-    total_domains = db.query(Domain).count()
-    
-    # Active domains (domains with enabled providers)
-    active_domains = db.query(Domain).join(Provider).filter(Provider.is_enabled == True).count()
-    
-    # Calculate 24h timeframe
-    now = datetime.now(UTC)
-    yesterday = now - timedelta(hours=24)
-    
-    # Updates in last 24h
-    updates_24h = db.query(IPHistory).filter(
-        IPHistory.timestamp >= yesterday
-    ).count()
-    
-    # Success/failure counts 24h
-    success_count_24h = db.query(IPHistory).filter(
-        IPHistory.timestamp >= yesterday,
-        IPHistory.status == "SUCCESS"
-    ).count()
-    
-    failed_updates_24h = db.query(IPHistory).filter(
-        IPHistory.timestamp >= yesterday,
-        IPHistory.status == "FAILED"
-    ).count()
-    
-    # Success rate calculation
-    if updates_24h > 0:
-        success_rate_24h = round((success_count_24h / updates_24h) * 100, 1)
-    else:
-        success_rate_24h = 0.0
-    
-    # Unique IPs in last 24h
-    unique_ips_24h = db.query(func.count(func.distinct(IPHistory.ip_address))).filter(
-        IPHistory.timestamp >= yesterday
-    ).scalar() or 0
-    
-    # Last update time (most recent across all domains)
-    last_update = db.query(IPHistory).order_by(IPHistory.timestamp.desc()).first()
-    last_update_time = last_update.timestamp.isoformat() if last_update else None
-    
-    # Provider statistics
+    # Domain counts per provider type; totals are summed from the same rows
     provider_stats = db.query(
         Provider.type,
         func.count(Domain.id).label('count'),
-        func.sum(func.cast(Provider.is_enabled, Integer)).label('active')
+        func.sum(func.cast(Provider.is_enabled, Integer)).label('active'),
+        func.sum(case((and_(Provider.is_enabled == True, Domain.id.isnot(None)), 1), else_=0)).label('active_domains')
     ).outerjoin(Domain).group_by(Provider.type).all()
     
+    total_domains = sum(stat.count or 0 for stat in provider_stats)
+    # Active domains (domains with enabled providers)
+    active_domains = sum(stat.active_domains or 0 for stat in provider_stats)
+    
     providers_stats = [
         {
             "type": stat.type,
@@ -73,24 +126,49 @@ def get_dashboard_metrics(
         for stat in provider_stats
     ]
     
+    # Update counts, unique IPs and last update time from the rollups, in one statement
+    yesterday = window_start(24)
+    unique_ips = select(func.count(func.distinct(IPSeenHourly.ip_address))).where(
+        IPSeenHourly.bucket_start >= yesterday
+    ).scalar_subquery()
+    # The most recent update is always in the latest bucket
+    latest_bucket = select(func.max(ProviderStatsHourly.bucket_start)).scalar_subquery()
+    last_update = select(func.max(ProviderStatsHourly.last_event_at)).where(
+        ProviderStatsHourly.bucket_start == latest_bucket
+    ).scalar_subquery()
+    updates_24h, success_count_24h, failed_updates_24h, unique_ips_24h, last_update = db.query(
+        func.coalesce(func.sum(ProviderStatsHourly.attempts), 0),
+        func.coalesce(func.sum(ProviderStatsHourly.successes), 0),
+        func.coalesce(func.sum(ProviderStatsHourly.failures), 0),
+        unique_ips,
+        last_update
+    ).filter(ProviderStatsHourly.bucket_start >= yesterday).one()
+    
+    # Success rate calculation
+    if updates_24h > 0:
+        success_rate_24h = round((success_count_24h / updates_24h) * 100, 1)
+    else:
+        success_rate_24h = 0.0
+    
     return {
         "total_domains": total_domains,
         "active_domains": active_domains,
         "success_rate_24h": success_rate_24h,
         "total_updates_24h": updates_24h,
         "failed_updates_24h": failed_updates_24h,
-        "unique_ips_24h": unique_ips_24h,
-        "last_update_time": last_update_time,
+        "unique_ips_24h": unique_ips_24h or 0,
+        "last_update_time": last_update.isoformat() if last_update else None,
         "providers_stats": providers_stats
     }
 
-@router.get("/response-time")
+@metrics_endpoint("/response-time", "ip_history")
 def get_response_time_metrics(
     db: Session = Depends(get_db),
     token: str = Depends(oauth2_scheme)
 ):
     """
-    Get average IP update response time metrics over different time periods.
+    Get IP update response time metrics over different time periods.
+    Times are in milliseconds; percentiles use the nearest-rank method.
     """
     now = datetime.now(UTC)
     
@@ -103,57 +181,84 @@ def get_response_time_metrics(
     
     result = {}
     for period_name, start_time in periods.items():
-        # Note: IPHistory doesn't have duration/response_time field
-        # This is a placeholder - in real implementation you'd add this field
-        updates = db.query(IPHistory).filter(
-            IPHistory.timestamp >= start_time
-        ).all()
+        stats = db.query(
+            func.count(IPHistory.id).label("count"),
+            func.count(IPHistory.duration_ms).label("samples"),
+            func.avg(IPHistory.duration_ms).label("avg_time"),
+            func.min(IPHistory.duration_ms).label("min_time"),
+            func.max(IPHistory.duration_ms).label("max_time"),
+            func.avg(IPHistory.ip_fetch_ms).label("ip_fetch"),
+            func.avg(IPHistory.decrypt_ms).label("decrypt"),
+            func.avg(IPHistory.provider_ms).label("provider_call"),
+            func.avg(IPHistory.db_write_ms).label("db_write")
+        ).filter(IPHistory.timestamp >= start_time).one()
         
         result[period_name] = {
-            "count": len(updates),
-            "avg_time": 0,  # Placeholder - would calculate from duration field
-            "min_time": 0,  # Placeholder
-            "max_time": 0   # Placeholder
+            "count": stats.count,
+            "samples": stats.samples,
+            "avg_time": _ms(stats.avg_time),
+            "min_time": _ms(stats.min_time),
+            "max_time": _ms(stats.max_time),
+            "p50_time": _duration_percentile(db, start_time, stats.samples, 0.50),
+            "p95_time": _duration_percentile(db, start_time, stats.samples, 0.95),
+            # Average time per stage
+            "breakdown": {
+                "ip_fetch": _ms(stats.ip_fetch),
+                "decrypt": _ms(stats.decrypt),
+                "provider_call": _ms(stats.provider_call),
+                "db_write": _ms(stats.db_write)
+            }
         }
     
     return result
 
-@router.get("/ip-changes")
+def _ms(value) -> float:
+    return round(float(value), 2) if value is not None else 0
+
+def _duration_percentile(db: Session, start_time: datetime, samples: int, fraction: float) -> float:
+    """
+    Nearest-rank percentile of update durations since `start_time`, selected in SQL.
+    """
+    if not samples:
+        return 0
+    rank = max(math.ceil(fraction * samples), 1)
+    value = db.query(IPHistory.duration_ms).filter(
+        IPHistory.timestamp >= start_time,
+        IPHistory.duration_ms.isnot(None)
+    ).order_by(IPHistory.duration_ms).offset(rank - 1).limit(1).scalar()
+    return _ms(value)
+
+@metrics_endpoint("/ip-changes", "domains", "ip_history")
 def get_ip_change_frequency(
     db: Session = Depends(get_db),
     token: str = Depends(oauth2_scheme)
 ):
     """
     Track IP address change frequency over time.
+    Changes are read from the hourly per-domain counters, so the week is hour-aligned.
     """
-    now = datetime.now(UTC)
-    week_ago = now - timedelta(days=7)
+    changes_by_domain = select(
+        IPChangesHourly.domain_id,
+        func.sum(IPChangesHourly.changes).label("changes")
+    ).where(
+        IPChangesHourly.bucket_start >= window_start(24 * 7)
+    ).group_by(IPChangesHourly.domain_id).subquery()
     
-    # Get all domains
-    domains = db.query(Domain).all()
+    rows = db.query(
+        Domain.id,
+        Domain.domain_name,
+        func.coalesce(changes_by_domain.c.changes, 0)
+    ).outerjoin(changes_by_domain, changes_by_domain.c.domain_id == Domain.id).order_by(Domain.id).all()
     
-    changes_per_domain = []
-    for domain in domains:
-        # Get IP changes for this domain in the last week
-        history = db.query(IPHistory).filter(
-            IPHistory.domain_id == domain.id,
-            IPHistory.timestamp >= week_ago
-        ).order_by(IPHistory.timestamp.asc()).all()
-        
-        # Count actual IP changes (when IP differs from previous)
-        changes = 0
-        prev_ip = None
-        for entry in history:
-            if prev_ip and prev_ip != entry.ip_address:
-                changes += 1
-            prev_ip = entry.ip_address
-        
-        changes_per_domain.append({
-            "domain_id": domain.id,
-            "domain_name": domain.domain_name,
+    changes_per_domain = [
+        {
+            "domain_id": domain_id,
+            "domain_name": domain_name,
             "changes_last_week": changes,
             "changes_per_day": round(changes / 7, 2) if changes > 0 else 0
-        })
+        }
+        for domain_id, domain_name, changes in rows
+    ]
     
     # Calculate totals
     total_changes = sum(d["changes_last_week"] for d in changes_per_domain)
@@ -164,57 +269,60 @@ def get_ip_change_frequency(
         "domains": changes_per_domain
     }
 
-@router.get("/provider-stats")
+@metrics_endpoint("/provider-stats", "domains", "providers", "ip_history")
 def get_provider_success_rates(
     db: Session = Depends(get_db),
     token: str = Depends(oauth2_scheme)
 ):
     """
     Get detailed success rate statistics per provider.
+    Computed in one grouped query over providers, their domain counts and the
+    hourly provider rollups; providers without domains are left out.
     """
-    now = datetime.now(UTC)
-    yesterday = now - timedelta(hours=24)
+    yesterday = window_start(24)
     
-    providers = db.query(Provider).all()
+    domain_counts = select(
+        Domain.provider_id,
+        func.count(Domain.id).label("total_domains")
+    ).group_by(Domain.provider_id).subquery()
+    
+    in_window = ProviderStatsHourly.bucket_start >= yesterday
+    rollups = select(
+        ProviderStatsHourly.provider_id,
+        func.sum(case((in_window, ProviderStatsHourly.attempts), else_=0)).label("updates"),
+        func.sum(case((in_window, ProviderStatsHourly.successes), else_=0)).label("successes"),
+        func.max(ProviderStatsHourly.last_event_at).label("last_update")
+    ).group_by(ProviderStatsHourly.provider_id).subquery()
+    
+    rows = db.query(
+        Provider.id,
+        Provider.name,
+        Provider.type,
+        Provider.is_enabled,
+        domain_counts.c.total_domains,
+        func.coalesce(rollups.c.updates, 0).label("updates"),
+        func.coalesce(rollups.c.successes, 0).label("successes"),
+        rollups.c.last_update
+    ).join(
+        domain_counts, domain_counts.c.provider_id == Provider.id
+    ).outerjoin(
+        rollups, rollups.c.provider_id == Provider.id
+    ).order_by(Provider.id).all()
     
     provider_details = []
-    for provider in providers:
-        # Get domains for this provider
-        domains = db.query(Domain).filter(Domain.provider_id == provider.id).all()
-        domain_ids = [d.id for d in domains]
-        
-        if not domain_ids:
-            continue
-        
-        # Get update history for these domains in last 24h
-        total_updates = db.query(IPHistory).filter(
-            IPHistory.domain_id.in_(domain_ids),
-            IPHistory.timestamp >= yesterday
-        ).count()
-        
-        successful_updates = db.query(IPHistory).filter(
-            IPHistory.domain_id.in_(domain_ids),
-            IPHistory.timestamp >= yesterday,
-            IPHistory.status == "SUCCESS"
-        ).count()
-        
-        # Get last update time
-        last_update = db.query(IPHistory).filter(
-            IPHistory.domain_id.in_(domain_ids)
-        ).order_by(IPHistory.timestamp.desc()).first()
-        
-        success_rate = round((successful_updates / total_updates) * 100, 1) if total_updates > 0 else 0
+    for row in rows:
+        success_rate = round((row.successes / row.updates) * 100, 1) if row.updates > 0 else 0
         
         provider_details.append({
-            "provider_id": provider.id,
-            "provider_name": provider.name,
-            "provider_type": provider.type,
-            "is_enabled": provider.is_enabled,
-            "total_domains": len(domains),
-            "updates_24h": total_updates,
-            "successful_updates_24h": successful_updates,
+            "provider_id": row.id,
+            "provider_name": row.name,
+            "provider_type": row.type,
+            "is_enabled": row.is_enabled,
+            "total_domains": row.total_domains,
+            "updates_24h": row.updates,
+            "successful_updates_24h": row.successes,
             "success_rate_24h": success_rate,
-            "last_update_time": last_update.timestamp.isoformat() if last_update else None
+            "last_update_time": row.last_update.isoformat() if row.last_update else None
         })
     
     return {
@@ -222,7 +330,90 @@ def get_provider_success_rates(
         "total_providers": len(provider_details)
     }
 
-@router.get("/uptime")
+# Longest series a single request may ask for
+MAX_SERIES_POINTS = 2000
+SERIES_STEPS = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+SERIES_DEFAULT_RANGES = {"hour": timedelta(hours=24), "day": timedelta(days=30)}
+
+@metrics_endpoint("/series", "domains", "ip_history")
+def get_update_series(
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    bucket: Literal["hour", "day"] = "hour",
+    domain_id: Optional[int] = None,
+    provider_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    token: str = Depends(oauth2_scheme)
+):
+    """
+    Updates, successes and failures per hour or day between `from` and `to`.
+    Bucketed in SQL from the hourly rollups and returned as zero-filled columns,
+    one entry per bucket. Defaults to the last 24 hours (hourly) or 30 days (daily).
+    """
+    step = SERIES_STEPS[bucket]
+    end = _as_utc(end) if end else datetime.now(UTC)
+    start = _as_utc(start) if start else end - SERIES_DEFAULT_RANGES[bucket]
+    if start > end:
+        raise HTTPException(status_code=400, detail="'from' must not be after 'to'")
+    first, last = _series_bucket(start, bucket), _series_bucket(end, bucket)
+    points = int((last - first) / step) + 1
+    if points > MAX_SERIES_POINTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Range spans {points} buckets; at most {MAX_SERIES_POINTS} are allowed"
+        )
+
+    # Per-provider rollups are much smaller, so use them unless a domain is selected
+    if domain_id is not None:
+        model = DomainStatsHourly
+        filters = [DomainStatsHourly.domain_id == domain_id]
+        if provider_id is not None:
+            filters.append(DomainStatsHourly.domain_id.in_(
+                select(Domain.id).where(Domain.provider_id == provider_id)
+            ))
+    else:
+        model = ProviderStatsHourly
+        filters = [ProviderStatsHourly.provider_id == provider_id] if provider_id is not None else []
+
+    # The rollups are already hourly
+    bucket_column = model.bucket_start if bucket == "hour" else truncate_timestamp(db.get_bind(), model.bucket_start, bucket)
+    rows = db.query(
+        bucket_column.label("bucket"),
+        func.sum(model.attempts).label("updates"),
+        func.sum(model.successes).label("successes"),
+        func.sum(model.failures).label("failures")
+    ).filter(
+        model.bucket_start >= first,
+        model.bucket_start < last + step,
+        *filters
+    ).group_by(bucket_column).all()
+    by_bucket = {row.bucket: row for row in rows}
+
+    series = {"timestamps": [], "updates": [], "successes": [], "failures": []}
+    for index in range(points):
+        timestamp = first + index * step
+        row = by_bucket.get(timestamp)
+        series["timestamps"].append(timestamp.isoformat())
+        series["updates"].append(row.updates if row else 0)
+        series["successes"].append(row.successes if row else 0)
+        series["failures"].append(row.failures if row else 0)
+
+    return {
+        "bucket": bucket,
+        "from": first.isoformat(),
+        "to": (last + step).isoformat(),
+        **series
+    }
+
+def _as_utc(value: datetime) -> datetime:
+    """Query timestamps without an offset are taken as UTC."""
+    return value.replace(tzinfo=UTC) if value.tzinfo is None else value.astimezone(UTC)
+
+def _series_bucket(timestamp: datetime, bucket: str) -> datetime:
+    floored = bucket_start(timestamp)
+    return floored.replace(hour=0) if bucket == "day" else floored
+
+@router.get("/uptime", dependencies=[conditional("ip_history", refresh=config.METRICS_CACHE_TTL_SECONDS)])
 def get_system_uptime(
     db: Session = Depends(get_db),
     token: str = Depends(oauth2_scheme)
@@ -230,30 +421,8 @@ def get_system_uptime(
     """
     Calculate system uptime and reliability metrics.
     """
-    now = datetime.now(UTC)
-    day_ago = now - timedelta(hours=24)
-    week_ago = now - timedelta(days=7)
-    
     # Calculate uptime based on successful updates vs total expected updates
-    # For 24h
-    total_24h = db.query(IPHistory).filter(
-        IPHistory.timestamp >= day_ago
-    ).count()
-    
-    success_24h = db.query(IPHistory).filter(
-        IPHistory.timestamp >= day_ago,
-        IPHistory.status == "SUCCESS"
-    ).count()
-    
-    # For 7 days
-    total_7d = db.query(IPHistory).filter(
-        IPHistory.timestamp >= week_ago
-    ).count()
-    
-    success_7d = db.query(IPHistory).filter(
-        IPHistory.timestamp >= week_ago,
-        IPHistory.status == "SUCCESS"
-    ).count()
+    total_24h, success_24h, total_7d, success_7d = _uptime_totals(db)
     
     uptime_24h = round((success_24h / total_24h) * 100, 2) if total_24h > 0 else 100
     uptime_7d = round((success_7d / total_7d) * 100, 2) if total_7d > 0 else 100
@@ -273,24 +442,38 @@ def get_system_uptime(
         "scheduler_status": "running" if scheduler_running else "stopped"
     }
 
-@router.get("/activity")
+@cached("ip_history")
+def _uptime_totals(db: Session):
+    """Update totals for the uptime windows; the scheduler status is always read live."""
+    total_24h, success_24h, _ = _rollup_totals(db, window_start(24))
+    total_7d, success_7d, _ = _rollup_totals(db, window_start(24 * 7))
+    return total_24h, success_24h, total_7d, success_7d
+
+@metrics_endpoint("/activity", "domains", "ip_history")
 def get_recent_activity(
     db: Session = Depends(get_db),
     token: str = Depends(oauth2_scheme),
-    limit: int = 20
+    limit: int = Query(20, ge=1, le=1000),
+    cursor: Optional[str] = None
 ):
     """
     Get recent activity timeline with detailed update information.
+    Pass `next_cursor` from a response as `cursor` to get the next, older page.
     """
     # Get recent updates with domain information
-    recent_updates = db.query(
+    query = db.query(
         IPHistory,
         Domain.domain_name
     ).join(
         Domain, IPHistory.domain_id == Domain.id
-    ).order_by(
-        IPHistory.timestamp.desc()
-    ).limit(limit).all()
+    )
+    if cursor:
+        query = query.filter(older_than(IPHistory.timestamp, IPHistory.id, cursor))
+    recent_updates, next_cursor = paginate(
+        query.order_by(IPHistory.timestamp.desc(), IPHistory.id.desc()).limit(limit + 1).all(),
+        limit,
+        lambda row: timestamp_cursor(row[0])
+    )
     
     activity = []
     for update, domain_name in recent_updates:
@@ -306,6 +489,77 @@ def get_recent_activity(
     
     return {
         "activity": activity,
-        "count": len(activity)
+        "count": len(activity),
+        "next_cursor": next_cursor
     }
 
+@router.get("/activity/stream")
+async def stream_activity(
+    request: Request,
+    token: str = Depends(oauth2_scheme),
+    last_event_id: Optional[str] = Header(None)
+):
+    """
+    Stream update events as they happen, using Server-Sent Events.
+    Clients reconnecting with a Last-Event-ID header first receive the buffered
+    events they missed (up to EVENT_BUFFER_SIZE); all of them if the id is from
+    before the server restarted.
+    """
+    subscription = get_event_bus().subscribe(last_event_id)
+    return StreamingResponse(
+        _sse_events(request, subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def _sse_events(request: Request, subscription: Subscription):
+    try:
+        for event in subscription.backlog:
+            yield _format_sse(event)
+        # A subscriber that fell behind is disconnected and resumes from the buffer
+        while not subscription.overflowed:
+            if await request.is_disconnected():
+                break
+            event = await subscription.get(timeout=SSE_KEEPALIVE_SECONDS)
+            yield _format_sse(event) if event else ": keepalive\n\n"
+    finally:
+        subscription.close()
+
+def _format_sse(event: dict) -> str:
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+
+@router.get("/cache")
+def get_cache_stats(token: str = Depends(oauth2_scheme)):
+    """
+    Get hit and miss counters of the metrics response cache.
+    """
+    return metrics_cache.stats()
+
+def verify_scrape_token(
+    request: Request,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(HTTPBearer(auto_error=False)),
+    db: Session = Depends(get_db)
+):
+    """
+    Accepts METRICS_SCRAPE_TOKEN as a bearer token when it is configured,
+    otherwise the same tokens as the other endpoints.
+    """
+    if not config.METRICS_SCRAPE_TOKEN:
+        token = get_token(request, credentials.credentials if credentials else None)
+        authenticate(token, db)
+        return token
+    if credentials and secrets.compare_digest(credentials.credentials, config.METRICS_SCRAPE_TOKEN):
+        return credentials.credentials
+    raise HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Not authenticated",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+@router.get("/prometheus")
+def get_prometheus_metrics(token: str = Depends(verify_scrape_token)):
+    """
+    Expose in-process counters and histograms in the Prometheus text format.
+    Served from memory, without database access.
+    """
+    return Response(content=telemetry.render(), media_type=CONTENT_TYPE_LATEST)
@@ -1,18 +1,42 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from app.db.base import SessionLocal
 from app.models import Provider, Domain
 from app.schemas import resources as schemas
-from app.core import security
+from app.core import config, security
 from app.api.v1.endpoints.auth import get_db, oauth2_scheme
+from app.api.v1.conditional import conditional, rows_marker
+from app.api.v1.pagination import decode_id_cursor, id_cursor, paginate, set_next_link
+from app.api.v1.responses import schema_columns, schema_list_response
+from app.services.rollups import delete_domain_rollups
 
 router = APIRouter()
 
-@router.get("", response_model=List[schemas.Provider])
-def read_providers(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
-    providers = db.query(Provider).offset(skip).limit(limit).all()
-    return providers
+@router.get("", response_model=List[schemas.Provider], dependencies=[conditional(
+    "providers", refresh=config.ETAG_REFRESH_SECONDS, marker=rows_marker(Provider)
+)])
+def read_providers(
+    request: Request,
+    response: Response,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+    token: str = Depends(oauth2_scheme)
+):
+    """
+    List providers ordered by id. When more remain, the Link and X-Next-Cursor
+    headers carry the cursor of the next page; `skip` is kept for older clients.
+    """
+    query = db.query(*schema_columns(Provider, schemas.Provider)).order_by(Provider.id)
+    if cursor:
+        query = query.filter(Provider.id > decode_id_cursor(cursor))
+    else:
+        query = query.offset(skip)
+    providers, next_cursor = paginate(query.limit(limit + 1).all(), limit, id_cursor)
+    set_next_link(request, response, next_cursor)
+    return schema_list_response(schemas.Provider, providers, response)
 
 @router.post("", response_model=schemas.Provider)
 def create_provider(provider: schemas.ProviderCreate, db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
@@ -44,6 +68,7 @@ def update_provider(provider_id: int, provider_update: schemas.ProviderUpdate, d
     if provider_update.is_enabled is not None:
         db_provider.is_enabled = provider_update.is_enabled
     if provider_update.credentials is not None:
+        security.forget_credentials(db_provider.credentials_encrypted)
         db_provider.credentials_encrypted = security.encrypt_credentials(provider_update.credentials)
         
     db.commit()
@@ -56,6 +81,8 @@ def delete_provider(provider_id: int, db: Session = Depends(get_db), token: str
     if not provider:
         raise HTTPException(status_code=404, detail="Provider not found")
     
+    security.forget_credentials(provider.credentials_encrypted)
+    delete_domain_rollups(db, [domain.id for domain in provider.domains])
     db.delete(provider)
     db.commit()
     return {"message": "Provider deleted successfully"}
@@ -1,7 +1,10 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from app.db.base import SessionLocal
 from app.models import User
+from app.api.v1.endpoints.auth import oauth2_scheme
+from app.services.key_rotation import get_key_rotation
+from app.services.scheduler import get_scheduler
 
 router = APIRouter()
 
@@ -22,3 +25,20 @@ def get_system_status(db: Session = Depends(get_db)):
         "initialized": user_count > 0,
         "version": "1.0.0"
     }
+
+@router.get("/key-rotation")
+def get_key_rotation_status(token: str = Depends(oauth2_scheme)):
+    """
+    Progress of re-encrypting provider credentials with ENCRYPTION_KEY.
+    """
+    return get_key_rotation().to_dict()
+
+@router.post("/key-rotation", status_code=status.HTTP_202_ACCEPTED)
+def start_key_rotation(token: str = Depends(oauth2_scheme)):
+    """
+    Re-encrypts provider credentials still under an old key in the background.
+    Credentials already under ENCRYPTION_KEY are skipped, so it is safe to repeat.
+    """
+    if not get_scheduler().start_key_rotation():
+        raise HTTPException(status_code=409, detail="A key rotation is already running")
+    return get_key_rotation().to_dict()
@@ -0,0 +1,276 @@
+import base64
+import json
+import os
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from cryptography.fernet import Fernet, InvalidToken
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+from app.core import config, security
+from app.models import Domain, Provider
+from app.schemas import resources as schemas
+from app.api.v1.endpoints.auth import get_db, oauth2_scheme
+from app.api.v1.ndjson import NDJSON_MEDIA_TYPE, iter_ndjson
+from app.api.v1.responses import dumps, schema_columns
+from app.services.scheduler import get_scheduler, is_valid_cron
+
+router = APIRouter()
+
+EXPORT_FORMAT = "ip-hop-export"
+EXPORT_VERSION = 1
+MIN_EXPORT_KEY_LENGTH = 12
+
+@router.get("/export")
+def export_configuration(
+    x_export_key: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+    token: str = Depends(oauth2_scheme)
+):
+    """
+    Stream providers and domains as NDJSON: a header line, the providers, the domains,
+    then a footer with the counts. Provider credentials are re-encrypted with a key
+    derived from the X-Export-Key passphrase. Domains are read in batches of
+    TRANSFER_BATCH_SIZE, so memory use doesn't grow with the number of domains.
+    """
+    passphrase = _require_export_key(x_export_key)
+    salt = os.urandom(16)
+    cipher = security.export_fernet(passphrase, salt)
+    _begin_snapshot(db)
+    exported_at = datetime.now(timezone.utc)
+
+    def lines():
+        yield _line("header", {
+            "format": EXPORT_FORMAT,
+            "version": EXPORT_VERSION,
+            "exported_at": exported_at.isoformat(),
+            "salt": base64.b64encode(salt).decode()
+        })
+        providers = 0
+        for provider in db.query(Provider).order_by(Provider.id):
+            credentials = json.dumps(security.decrypt_credentials(provider.credentials_encrypted))
+            yield _line("provider", {
+                "id": provider.id,
+                "name": provider.name,
+                "type": provider.type,
+                "is_enabled": provider.is_enabled,
+                "credentials": cipher.encrypt(credentials.encode()).decode()
+            })
+            providers += 1
+
+        domains, last_id = 0, 0
+        query = db.query(Domain.id, *schema_columns(Domain, schemas.DomainCreate)).order_by(Domain.id)
+        while True:
+            rows = query.filter(Domain.id > last_id).limit(config.TRANSFER_BATCH_SIZE).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            domains += len(rows)
+            yield b"".join(_line("domain", _without_id(row._asdict())) for row in rows)
+        yield _line("footer", {"providers": providers, "domains": domains})
+
+    filename = f"ip-hop-{exported_at:%Y%m%d-%H%M%S}.ndjson"
+    return StreamingResponse(lines(), media_type=NDJSON_MEDIA_TYPE, headers={
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        "Cache-Control": "no-store"
+    })
+
+@router.post("/import")
+async def import_configuration(
+    request: Request,
+    x_export_key: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+    token: str = Depends(oauth2_scheme)
+):
+    """
+    Import an export made by GET /export, read line by line as it arrives.
+    The upload is validated and staged in memory without touching the database, so
+    a slow upload holds no locks (on SQLite, the single writer lock). Once the footer
+    confirms the export is complete, everything is written in one short transaction:
+    providers are matched by name and domains by provider and name, matches are
+    updated and the rest created, TRANSFER_BATCH_SIZE domains at a time. Any invalid
+    line rejects the whole import (422). Schedules are reconciled afterwards.
+    """
+    passphrase = _require_export_key(x_export_key)
+    started = time.perf_counter()
+    importer = _Importer()
+    cipher, footer = None, None
+
+    async for line_number, item in iter_ndjson(request):
+        try:
+            kind = item.get("kind") if isinstance(item, dict) else None
+            if cipher is None:
+                cipher = await run_in_threadpool(_export_cipher, passphrase, item)
+            elif footer is not None:
+                raise ValueError("Unexpected data after the footer")
+            elif kind == "provider":
+                importer.add_provider(cipher, item)
+            elif kind == "domain":
+                importer.add_domain(item)
+            elif kind == "footer":
+                footer = item
+            else:
+                raise ValueError(f"Unknown line kind: {kind!r}")
+        except ValidationError as e:
+            _reject(line_number, "; ".join(f"{'.'.join(map(str, error['loc'])) or 'line'}: {error['msg']}" for error in e.errors()))
+        except ValueError as e:
+            _reject(line_number, str(e))
+
+    if cipher is None:
+        raise HTTPException(status_code=400, detail="The import is empty")
+    if footer is None or footer.get("providers") != len(importer.providers) or footer.get("domains") != importer.received:
+        raise HTTPException(status_code=422, detail={"message": "Nothing was imported", "error": "The export is incomplete"})
+
+    # Off the event loop, so scheduled updates keep running while it is written
+    await run_in_threadpool(importer.write, db)
+
+    scheduler = get_scheduler()
+    if importer.schedules:
+        scheduler.add_schedules(importer.schedules)
+    if importer.unscheduled:
+        scheduler.remove_schedules(importer.unscheduled)
+
+    counts = importer.counts
+    return {
+        "providers": {"created": counts["providers_created"], "updated": counts["providers_updated"]},
+        "domains": {"created": counts["domains_created"], "updated": counts["domains_updated"]},
+        "scheduled": len(importer.schedules),
+        "duration_ms": round((time.perf_counter() - started) * 1000, 3)
+    }
+
+class _Importer:
+    """
+    Stages the providers and domains of an import in memory as they are read, then
+    upserts them with `write` in one transaction.
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+        # Exported provider id -> the provider and its credentials encrypted with ENCRYPTION_KEY
+        self.providers: Dict[int, Tuple[schemas.ProviderTransfer, str]] = {}
+        self.received = 0
+        self.schedules: Dict[int, str] = {}
+        self.unscheduled: List[int] = []
+        # Domains by (provider name, domain name), as providers are matched by name; a later line wins
+        self._domains: Dict[Tuple[str, str], schemas.DomainCreate] = {}
+
+    def add_provider(self, cipher: Fernet, item: dict):
+        provider = schemas.ProviderTransfer.model_validate(item)
+        try:
+            credentials = json.loads(cipher.decrypt(provider.credentials.encode()))
+        except InvalidToken:
+            raise HTTPException(status_code=400, detail="X-Export-Key does not match the export")
+        self.providers[provider.id] = (provider, security.encrypt_credentials(credentials))
+
+    def add_domain(self, item: dict):
+        domain = schemas.DomainCreate.model_validate(item)
+        staged = self.providers.get(domain.provider_id)
+        if staged is None:
+            raise ValueError(f"Provider {domain.provider_id} is not in the export")
+        if domain.cron_schedule and not is_valid_cron(domain.cron_schedule):
+            raise ValueError(f"Invalid cron expression: {domain.cron_schedule}")
+        self._domains[(staged[0].name, domain.domain_name)] = domain
+        self.received += 1
+
+    def write(self, db: Session):
+        """Writes everything staged and commits; nothing is written if any of it fails."""
+        try:
+            provider_ids = {provider.name: self._write_provider(db, provider, encrypted) for provider, encrypted in self.providers.values()}
+            domains = list(self._domains.items())
+            for offset in range(0, len(domains), config.TRANSFER_BATCH_SIZE):
+                self._write_domains(db, {
+                    (provider_ids[provider_name], name): domain.model_copy(update={"provider_id": provider_ids[provider_name]})
+                    for (provider_name, name), domain in domains[offset:offset + config.TRANSFER_BATCH_SIZE]
+                })
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+    def _write_provider(self, db: Session, provider: schemas.ProviderTransfer, encrypted: str) -> int:
+        db_provider = db.query(Provider).filter(Provider.name == provider.name).first()
+        if db_provider:
+            db_provider.type = provider.type
+            db_provider.is_enabled = provider.is_enabled
+            security.forget_credentials(db_provider.credentials_encrypted)
+            db_provider.credentials_encrypted = encrypted
+            self.counts["providers_updated"] += 1
+        else:
+            db_provider = Provider(
+                name=provider.name,
+                type=provider.type,
+                is_enabled=provider.is_enabled,
+                credentials_encrypted=encrypted
+            )
+            db.add(db_provider)
+            self.counts["providers_created"] += 1
+        db.flush()
+        return db_provider.id
+
+    def _match(self, db: Session, batch: Dict[Tuple[int, str], schemas.DomainCreate]) -> Dict[Tuple[int, str], int]:
+        """Ids of the stored domains with the same provider and name as those in `batch`."""
+        rows = db.query(Domain.id, Domain.provider_id, Domain.domain_name).filter(
+            Domain.domain_name.in_({name for _, name in batch})
+        )
+        return {(row.provider_id, row.domain_name): row.id for row in rows if (row.provider_id, row.domain_name) in batch}
+
+    def _write_domains(self, db: Session, batch: Dict[Tuple[int, str], schemas.DomainCreate]):
+        """Writes a batch of domains: one query to match them, then bulk inserts and updates."""
+        existing = self._match(db, batch)
+        updated = [(existing[key], domain) for key, domain in batch.items() if key in existing]
+        created = [(key, domain) for key, domain in batch.items() if key not in existing]
+        if updated:
+            db.execute(update(Domain), [{"id": domain_id, **domain.model_dump()} for domain_id, domain in updated])
+        if created:
+            # A Core executemany; ORM bulk inserts fetch each new id, one row at a time on SQLite
+            db.execute(insert(Domain.__table__), [domain.model_dump() for _, domain in created])
+            inserted = self._match(db, dict(created))
+            created = [(inserted[key], domain) for key, domain in created]
+
+        for domain_id, domain in updated + created:
+            if domain.cron_schedule:
+                self.schedules[domain_id] = domain.cron_schedule
+            else:
+                self.unscheduled.append(domain_id)
+        self.counts["domains_updated"] += len(updated)
+        self.counts["domains_created"] += len(created)
+
+def _require_export_key(key: Optional[str]) -> str:
+    if not key or len(key) < MIN_EXPORT_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"An X-Export-Key of at least {MIN_EXPORT_KEY_LENGTH} characters is required")
+    return key
+
+def _export_cipher(passphrase: str, header) -> Fernet:
+    """The export key for an import, from its header line."""
+    if not isinstance(header, dict) or header.get("kind") != "header" or header.get("format") != EXPORT_FORMAT:
+        raise ValueError("Not an ip-hop export: the first line must be its header")
+    if header.get("version") != EXPORT_VERSION:
+        raise ValueError(f"Unsupported export version: {header.get('version')}")
+    try:
+        salt = base64.b64decode(header["salt"], validate=True)
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("Invalid export header salt")
+    return security.export_fernet(passphrase, salt)
+
+def _begin_snapshot(db: Session):
+    """
+    Reads the export in one repeatable-read transaction on PostgreSQL, so domains
+    read in later batches are consistent with the providers read first.
+    """
+    if db.get_bind().dialect.name == "postgresql" and not db.in_transaction():
+        db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+
+def _line(kind: str, data: dict) -> bytes:
+    return dumps({"kind": kind, **data}) + b"\n"
+
+def _without_id(row: dict) -> dict:
+    row.pop("id")
+    return row
+
+def _reject(line_number: int, error: str):
+    raise HTTPException(status_code=422, detail={"message": "Nothing was imported", "line": line_number, "error": error})
@@ -0,0 +1,33 @@
+"""
+Reading newline-delimited JSON request bodies as they arrive.
+"""
+import json
+from typing import Any, AsyncIterator, Tuple
+from fastapi import HTTPException, Request
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+def is_ndjson(request: Request) -> bool:
+    return request.headers.get("content-type", "").startswith(NDJSON_MEDIA_TYPE)
+
+def parse_json(data: bytes, where: str) -> Any:
+    """Parses JSON, raising a 400 that names `where` the data came from."""
+    try:
+        return json.loads(data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON in {where}: {e}")
+
+async def iter_ndjson(request: Request) -> AsyncIterator[Tuple[int, Any]]:
+    """
+    Yields (line number, value) for each non-blank line of the body, parsing
+    lines as their chunks arrive rather than reading the whole body first.
+    """
+    pending, line_number = b"", 0
+    async for chunk in request.stream():
+        *lines, pending = (pending + chunk).split(b"\n")
+        for line in lines:
+            line_number += 1
+            if line.strip():
+                yield line_number, parse_json(line, f"line {line_number}")
+    if pending.strip():
+        yield line_number + 1, parse_json(pending, f"line {line_number + 1}")
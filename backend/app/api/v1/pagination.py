@@ -0,0 +1,71 @@
+"""
+Keyset (cursor) pagination helpers.
+Cursors are opaque to clients: base64url-encoded JSON of the last row's sort key.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import List, Optional, Tuple
+from fastapi import HTTPException, Request, Response
+from sqlalchemy import and_, or_
+
+def encode_cursor(**key) -> str:
+    return base64.urlsafe_b64encode(json.dumps(key, separators=(",", ":")).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> dict:
+    """Returns the key stored in a cursor. Raises a 400 for malformed cursors."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(key, dict):
+            raise ValueError("cursor is not an object")
+        return key
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def id_cursor(row) -> str:
+    return encode_cursor(id=row.id)
+
+def decode_id_cursor(cursor: str) -> int:
+    key = decode_cursor(cursor)
+    if not isinstance(key.get("id"), int):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return key["id"]
+
+def timestamp_cursor(row) -> str:
+    return encode_cursor(ts=row.timestamp.isoformat(), id=row.id)
+
+def decode_timestamp_cursor(cursor: str) -> Tuple[datetime, int]:
+    key = decode_cursor(cursor)
+    try:
+        return datetime.fromisoformat(key["ts"]), int(key["id"])
+    except (KeyError, TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def older_than(timestamp_column, id_column, cursor: str):
+    """
+    Filter for rows after a (timestamp, id) cursor in newest-first order.
+    The plain `timestamp <=` bound lets indexes on the timestamp seek to the cursor,
+    so deep pages cost the same as the first one.
+    """
+    timestamp, row_id = decode_timestamp_cursor(cursor)
+    return and_(
+        timestamp_column <= timestamp,
+        or_(timestamp_column < timestamp, id_column < row_id)
+    )
+
+def paginate(rows: List, limit: int, make_cursor) -> Tuple[List, Optional[str]]:
+    """
+    Splits rows fetched with `limit + 1` into the page and the cursor of the next one
+    (None on the last page).
+    """
+    if len(rows) > limit:
+        page = rows[:limit]
+        return page, make_cursor(page[-1])
+    return rows, None
+
+def set_next_link(request: Request, response: Response, next_cursor: Optional[str]):
+    """Advertises the next page in the Link and X-Next-Cursor headers."""
+    if next_cursor:
+        response.headers["Link"] = f'<{request.url.include_query_params(cursor=next_cursor)}>; rel="next"'
+        response.headers["X-Next-Cursor"] = next_cursor
@@ -0,0 +1,64 @@
+"""
+Fast JSON rendering for endpoints that return plain dicts.
+FastAPI runs such results through `jsonable_encoder`, which walks every value in
+Python; for large metrics payloads that costs more than computing them.
+Dicts are rendered with orjson.
+Lists of schema rows are validated and serialized by pydantic in one pass.
+"""
+import functools
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, List
+import orjson
+from fastapi import Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+def _default(value: Any) -> Any:
+    # Aggregates come back as Decimal on PostgreSQL
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return jsonable_encoder(value)
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse for dicts and lists of JSON types, without `jsonable_encoder`."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+def with_headers_of(rendered: Response, response: Response) -> Response:
+    """
+    Copies the headers set on an endpoint's `response` parameter (by the endpoint
+    or its dependencies, e.g. ETag and Cache-Control) onto a response it returns,
+    since FastAPI only applies them to results it renders itself.
+    """
+    rendered.headers.raw.extend(response.headers.raw)
+    return rendered
+
+def schema_columns(model, schema) -> List:
+    """
+    The model columns behind a response schema's fields. List endpoints select
+    these and render the rows with `schema_list_response`, skipping ORM objects
+    and `from_attributes`.
+    """
+    return [getattr(model, field) for field in schema.model_fields]
+
+@functools.lru_cache(maxsize=None)
+def _list_adapter(schema) -> TypeAdapter:
+    return TypeAdapter(List[schema])
+
+def schema_list_response(schema, rows, response: Response) -> Response:
+    """
+    Renders rows selected with `schema_columns` as a JSON list of `schema`,
+    validated and dumped by a TypeAdapter rather than per item by FastAPI.
+    Headers set on `response` are kept (see `with_headers_of`).
+    """
+    adapter = _list_adapter(schema)
+    items = adapter.validate_python([row._asdict() for row in rows])
+    return with_headers_of(Response(adapter.dump_json(items), media_type="application/json"), response)
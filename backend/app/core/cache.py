@@ -0,0 +1,87 @@
+"""
+Small in-process cache for computed responses.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+class VersionedCache:
+    """
+    Caches values for `ttl` seconds, keyed on a version tuple as well as the key.
+    A value computed under older versions is never returned, so bumping a version
+    invalidates entries immediately; the TTL bounds staleness for everything else.
+
+    Concurrent misses on the same key wait for a single computation. With
+    `max_entries`, the least recently used entries are evicted beyond that many.
+    """
+
+    def __init__(self, ttl: float, max_entries: Optional[int] = None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Tuple[float, Hashable, Any]]" = OrderedDict()
+        self._key_locks: Dict[Hashable, threading.Lock] = {}
+
+    def get_or_compute(self, key: Hashable, version: Hashable, compute: Callable[[], Any]) -> Any:
+        """Returns the cached value for `key` at `version`, computing it if missing or expired."""
+        if self.ttl <= 0:
+            return compute()
+
+        found, value = self._lookup(key, version)
+        if found:
+            return value
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            # Another request may have computed it while we waited
+            found, value = self._lookup(key, version)
+            if found:
+                return value
+            try:
+                value = compute()
+            except BaseException:
+                with self._lock:
+                    self._key_locks.pop(key, None)
+                raise
+            # The entry is stored before the key lock goes, so later misses find one or the other
+            with self._lock:
+                self.misses += 1
+                self._entries[key] = (time.monotonic() + self.ttl, version, value)
+                self._entries.move_to_end(key)
+                if self.max_entries is not None:
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+                self._key_locks.pop(key, None)
+            return value
+
+    def discard(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "ttl_seconds": self.ttl,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def _lookup(self, key: Hashable, version: Hashable) -> Tuple[bool, Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[1] == version and entry[0] > time.monotonic():
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return True, entry[2]
+            return False, None
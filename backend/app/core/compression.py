@@ -0,0 +1,60 @@
+"""
+Response compression: Brotli when the client accepts it, gzip otherwise. Bodies
+under the minimum size are sent as is.
+"""
+import anyio.to_thread
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware, IdentityResponder
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+import brotli
+
+# Fast settings: API responses are compressed on every request
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+# Larger bodies are compressed in a worker thread so the event loop stays free
+THREAD_MINIMUM_SIZE = 128 * 1024
+
+class BrotliResponder(IdentityResponder):
+    content_encoding = "br"
+
+    def __init__(self, app: ASGIApp, minimum_size: int, quality: int, exclude_content_types: tuple):
+        super().__init__(app, minimum_size, exclude_content_types=exclude_content_types)
+        self.quality = quality
+        self._compressor = None
+
+    async def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        if len(body) >= THREAD_MINIMUM_SIZE:
+            return await anyio.to_thread.run_sync(self._compress_body, body, more_body)
+        return self._compress_body(body, more_body)
+
+    def _compress_body(self, body: bytes, more_body: bool) -> bytes:
+        if self._compressor is None:
+            self._compressor = brotli.Compressor(quality=self.quality)
+        data = self._compressor.process(body)
+        # Flush each streamed chunk so progress reaches the client
+        return data + (self._compressor.flush() if more_body else self._compressor.finish())
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Starlette's GZipMiddleware, preferring Brotli when the client accepts it.
+    Server-Sent Events and already encoded responses are left alone.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024):
+        super().__init__(app, minimum_size=minimum_size, compresslevel=GZIP_LEVEL, thread_minimum_size=THREAD_MINIMUM_SIZE)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and accepts_encoding(scope, "br"):
+            responder = BrotliResponder(self.app, self.minimum_size, BROTLI_QUALITY, self.exclude_content_types)
+            await responder(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+def accepts_encoding(scope: Scope, encoding: str) -> bool:
+    """Whether the request's Accept-Encoding lists `encoding` without q=0."""
+    for part in Headers(scope=scope).get("Accept-Encoding", "").split(","):
+        name, _, params = part.partition(";")
+        if name.strip().lower() == encoding:
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
@@ -1,7 +1,9 @@
 import httpx
 import logging
 import re
+import time
 from tenacity import retry, stop_after_attempt, wait_fixed, retry_if_exception_type
+from app.core import telemetry
 from app.core.exceptions import IPFetchError
 
 logger = logging.getLogger(__name__)
@@ -37,9 +39,15 @@ class IPFetcher:
         Fetches IP from a single URL with retries.
         Raises httpx.HTTPError on failure.
         """
-        response = await client.get(url, timeout=self.timeout)
-        response.raise_for_status()
-        return response.text.strip()
+        started = time.perf_counter()
+        result = "error"
+        try:
+            response = await client.get(url, timeout=self.timeout)
+            response.raise_for_status()
+            result = "success"
+            return response.text.strip()
+        finally:
+            telemetry.IP_FETCH_SECONDS.labels(telemetry.service_label(url), result).observe(time.perf_counter() - started)
 
     async def get_current_ip(self) -> str:
         """
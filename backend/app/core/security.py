@@ -1,11 +1,22 @@
 from datetime import datetime, timedelta, timezone
-from typing import Optional, Any, Union
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Any, Callable, Dict, Union
 from jose import jwt, JWTError
 import bcrypt
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+import asyncio
+import base64
+import copy
+import hashlib
+import secrets
 import os
 import json
+import threading
+import time
 from dotenv import load_dotenv
+from app.core import config
+from app.core.cache import VersionedCache
 
 # Load environment variables from .env file
 load_dotenv()
@@ -24,7 +35,37 @@ ENCRYPTION_KEY = os.getenv("ENCRYPTION_KEY")
 if not ENCRYPTION_KEY:
     raise ValueError("ENCRYPTION_KEY environment variable is not set. This is required to secure credentials.")
 
-fernet = Fernet(ENCRYPTION_KEY.encode())
+# Keys used before ENCRYPTION_KEY (comma-separated), still accepted for decryption
+# until every credential has been re-encrypted with the current key
+ENCRYPTION_OLD_KEYS = [key.strip() for key in os.getenv("ENCRYPTION_OLD_KEYS", "").split(",") if key.strip()]
+
+primary_fernet = Fernet(ENCRYPTION_KEY.encode())
+# Encrypts with ENCRYPTION_KEY, decrypts with any configured key
+fernet = MultiFernet([primary_fernet] + [Fernet(key.encode()) for key in ENCRYPTION_OLD_KEYS])
+
+# Decrypted credentials, keyed by a digest of their ciphertext
+credentials_cache = VersionedCache(ttl=config.CREDENTIALS_CACHE_TTL_SECONDS, max_entries=config.CREDENTIALS_CACHE_MAX_ENTRIES)
+
+class PasswordHasherBusy(Exception):
+    """Raised when the password hashing pool and its queue are full."""
+    pass
+
+# bcrypt is deliberately slow; running it on its own small pool keeps a burst of
+# logins from taking over the threadpool the rest of the API runs on
+_password_executor = ThreadPoolExecutor(max_workers=config.PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+_password_slots = threading.BoundedSemaphore(config.PASSWORD_HASH_WORKERS + config.PASSWORD_HASH_QUEUE_SIZE)
+
+async def run_password_task(func: Callable, *args) -> Any:
+    """
+    Runs a password hashing function on the password pool. Raises PasswordHasherBusy
+    instead of queueing when PASSWORD_HASH_QUEUE_SIZE tasks are already waiting.
+    """
+    if not _password_slots.acquire(blocking=False):
+        raise PasswordHasherBusy()
+    future = _password_executor.submit(func, *args)
+    # Freed when the hash finishes, even if the request was cancelled meanwhile
+    future.add_done_callback(lambda _: _password_slots.release())
+    return await asyncio.wrap_future(future)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
@@ -39,17 +80,41 @@ def create_access_token(subject: Union[str, Any], expires_delta: Optional[timede
     else:
         expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     
-    to_encode = {"sub": str(subject), "exp": expire}
+    # jti keeps tokens issued in the same second distinct, so revoking one spares the others
+    to_encode = {"sub": str(subject), "exp": expire, "jti": secrets.token_hex(8)}
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 def decode_access_token(token: str) -> Optional[dict]:
-    """Decode and verify JWT token. Returns None if invalid/expired."""
+    """Decode and verify JWT token. Returns None if invalid/expired/revoked."""
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
     except JWTError:
         return None
+    if is_token_revoked(token):
+        return None
+    return payload
+
+# Tokens ended by logout, mapped to their expiry; kept in memory until they'd expire anyway
+_revoked_tokens: Dict[str, float] = {}
+_revoked_lock = threading.Lock()
+
+def revoke_access_token(token: str):
+    """Rejects a token from now on, e.g. after logout. Invalid tokens are ignored."""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return
+    now = time.time()
+    with _revoked_lock:
+        for revoked, expires_at in list(_revoked_tokens.items()):
+            if expires_at <= now:
+                del _revoked_tokens[revoked]
+        _revoked_tokens[token] = payload.get("exp", now)
+
+def is_token_revoked(token: str) -> bool:
+    with _revoked_lock:
+        return token in _revoked_tokens
 
 def encrypt_credentials(credentials: dict) -> str:
     """Encrypts a dictionary of credentials to a string."""
@@ -57,7 +122,44 @@ def encrypt_credentials(credentials: dict) -> str:
     return fernet.encrypt(json_str.encode()).decode()
 
 def decrypt_credentials(encrypted_str: str) -> dict:
-    """Decrypts a string back to a credentials dictionary."""
+    """
+    Decrypts a string back to a credentials dictionary. Results are cached unless
+    CREDENTIALS_CACHE_ENABLED is off; each caller gets its own copy.
+    """
+    if not config.CREDENTIALS_CACHE_ENABLED:
+        return _decrypt_credentials(encrypted_str)
+    credentials = credentials_cache.get_or_compute(
+        _credentials_digest(encrypted_str), None, lambda: _decrypt_credentials(encrypted_str)
+    )
+    return copy.deepcopy(credentials)
+
+def forget_credentials(encrypted_str: str):
+    """Drops cached credentials, e.g. once they are replaced or deleted."""
+    credentials_cache.discard(_credentials_digest(encrypted_str))
+
+def needs_reencryption(encrypted_str: str) -> bool:
+    """Whether credentials are encrypted with a key other than ENCRYPTION_KEY."""
+    try:
+        primary_fernet.decrypt(encrypted_str.encode())
+        return False
+    except InvalidToken:
+        return True
+
+def reencrypt_credentials(encrypted_str: str) -> str:
+    """
+    Re-encrypts credentials with ENCRYPTION_KEY. Raises InvalidToken if no
+    configured key can decrypt them.
+    """
+    return fernet.rotate(encrypted_str.encode()).decode()
+
+def _decrypt_credentials(encrypted_str: str) -> dict:
     json_str = fernet.decrypt(encrypted_str.encode()).decode()
     return json.loads(json_str)
 
+def _credentials_digest(encrypted_str: str) -> str:
+    return hashlib.sha256(encrypted_str.encode()).hexdigest()
+
+def export_fernet(passphrase: str, salt: bytes) -> Fernet:
+    """Fernet keyed from a passphrase, for credentials in configuration exports."""
+    key = Scrypt(salt=salt, length=32, n=2**15, r=8, p=1).derive(passphrase.encode())
+    return Fernet(base64.urlsafe_b64encode(key))
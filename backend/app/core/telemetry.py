@@ -0,0 +1,86 @@
+"""
+Prometheus instruments, exposed at /api/v1/metrics/prometheus.
+They live in their own registry and are updated in memory as work happens,
+so rendering them never touches the database.
+"""
+import time
+from urllib.parse import urlparse
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+registry = CollectorRegistry()
+
+# Network calls take from milliseconds to the request timeouts
+NETWORK_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+UPDATES = Counter(
+    "iphop_updates", "DNS record updates by provider type and status",
+    ["provider", "status"], registry=registry
+)
+UPDATES_JOINED = Counter(
+    "iphop_updates_joined", "Update requests that joined an update of the same domain already in progress",
+    registry=registry
+)
+PROVIDER_CALL_SECONDS = Histogram(
+    "iphop_provider_call_seconds", "Duration of DNS provider update calls",
+    ["provider"], buckets=NETWORK_BUCKETS, registry=registry
+)
+IP_FETCH_SECONDS = Histogram(
+    "iphop_ip_fetch_seconds", "Duration of WAN IP lookups per service and attempt",
+    ["service", "result"], buckets=NETWORK_BUCKETS, registry=registry
+)
+SCHEDULER_LAG_SECONDS = Histogram(
+    "iphop_scheduler_job_lag_seconds", "Delay between a job's scheduled and actual start",
+    ["job"], buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 15, 60), registry=registry
+)
+SCHEDULER_MISSED = Counter(
+    "iphop_scheduler_jobs_missed", "Job runs skipped because they started too late",
+    ["job"], registry=registry
+)
+DB_QUERY_SECONDS = Histogram(
+    "iphop_db_query_seconds", "Duration of database statements",
+    ["operation"], buckets=DB_BUCKETS, registry=registry
+)
+HISTORY_QUEUE_DEPTH = Gauge(
+    "iphop_history_queue_depth", "History entries waiting to be written", registry=registry
+)
+SCHEDULED_JOBS = Gauge(
+    "iphop_scheduled_jobs", "Jobs registered with the scheduler", registry=registry
+)
+
+def render() -> bytes:
+    """Returns all instruments in the Prometheus text format."""
+    return generate_latest(registry)
+
+def service_label(url: str) -> str:
+    """Host name of an IP lookup service, used as its label."""
+    return urlparse(url).hostname or url
+
+def job_label(job_id: str) -> str:
+    """Groups per-domain and per-request jobs under one label each to keep cardinality bounded."""
+    if job_id.startswith("domain_"):
+        return "domain_update"
+    if job_id.startswith("update_"):
+        return "requested_update"
+    return job_id
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _observe_query_time(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    words = statement.split(None, 1)
+    operation = words[0].upper() if words else "OTHER"
+    if operation not in ("SELECT", "INSERT", "UPDATE", "DELETE"):
+        operation = "OTHER"
+    DB_QUERY_SECONDS.labels(operation).observe(time.perf_counter() - started)
+
+@event.listens_for(Engine, "handle_error")
+def _discard_query_timer(exception_context):
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("query_started"):
+        connection.info["query_started"].pop()
@@ -0,0 +1,97 @@
+"""
+In-memory sliding-window rate limiting, e.g. for login attempts.
+"""
+import ipaddress
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Hashable, List, Optional, Union
+from starlette.requests import Request
+from app.core import config
+
+Network = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+def parse_networks(values: List[str]) -> List[Network]:
+    return [ipaddress.ip_network(value, strict=False) for value in values]
+
+# Proxies whose forwarded client address is believed
+trusted_proxies = parse_networks(config.TRUSTED_PROXIES)
+
+def _ip(value: str) -> Optional[Union[ipaddress.IPv4Address, ipaddress.IPv6Address]]:
+    try:
+        return ipaddress.ip_address(value.strip())
+    except ValueError:
+        return None
+
+def _trusted(address) -> bool:
+    return address is not None and any(address in network for network in trusted_proxies)
+
+def client_address(request: Request) -> str:
+    """
+    The address of the client behind any trusted proxies. The forwarded chain is
+    read from the right, skipping trusted proxies, so clients can't spoof it by
+    sending the header themselves.
+    """
+    peer = request.client.host if request.client else "unknown"
+    if not _trusted(_ip(peer)):
+        return peer
+    forwarded = [hop.strip() for hop in request.headers.get(config.CLIENT_IP_HEADER, "").split(",") if hop.strip()]
+    for hop in reversed(forwarded):
+        address = _ip(hop)
+        if address is None:
+            # Unparseable from here on: attribute the request to the last hop we trust
+            break
+        if not _trusted(address):
+            return str(address)
+        peer = str(address)
+    return peer
+
+class SlidingWindowLimiter:
+    """
+    Allows at most `limit` attempts per key within any `window` seconds.
+    At most `max_keys` keys are tracked; the least recently attempted are forgotten first.
+    """
+
+    def __init__(self, limit: int, window: float, max_keys: int = 10000):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._attempts: "OrderedDict[Hashable, Deque[float]]" = OrderedDict()
+
+    def attempt(self, key: Hashable) -> float:
+        """
+        Records an attempt for `key` if it is allowed and returns 0; otherwise
+        records nothing and returns the seconds until the next attempt is allowed.
+        """
+        if self.limit <= 0:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            attempts = self._attempts.get(key)
+            if attempts is None:
+                attempts = self._attempts[key] = deque()
+                while len(self._attempts) > self.max_keys:
+                    self._attempts.popitem(last=False)
+            self._attempts.move_to_end(key)
+            while attempts and attempts[0] <= now - self.window:
+                attempts.popleft()
+            if len(attempts) >= self.limit:
+                return attempts[0] + self.window - now
+            attempts.append(now)
+            return 0
+
+    def refund(self, key: Hashable):
+        """Removes the latest attempt for `key`, e.g. once it turned out to succeed."""
+        with self._lock:
+            attempts = self._attempts.get(key)
+            if attempts:
+                attempts.pop()
+
+    def reset(self, key: Hashable):
+        with self._lock:
+            self._attempts.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._attempts.clear()
@@ -1,18 +1,63 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateColumn, CreateIndex
 from sqlalchemy.orm import sessionmaker, declarative_base
-import os
+from app.core import config
 
-# Get the backend directory (two levels up from app/db)
-BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+def normalize_database_url(url: str) -> str:
+    """
+    Maps plain postgres URLs onto the psycopg (v3) driver shipped in requirements.txt.
+    """
+    for prefix in ("postgres://", "postgresql://"):
+        if url.startswith(prefix):
+            return "postgresql+psycopg://" + url[len(prefix):]
+    return url
 
-# Database path in backend/database/
-DB_PATH = os.path.join(BACKEND_DIR, "database", "ip_hop.db")
+def create_db_engine(url: str) -> Engine:
+    """
+    Creates an engine for SQLite or a pooled one for PostgreSQL.
+    """
+    url = normalize_database_url(url)
+    if url.startswith("sqlite"):
+        return create_engine(url, connect_args={"check_same_thread": False})
+    return create_engine(
+        url,
+        pool_size=config.DB_POOL_SIZE,
+        max_overflow=config.DB_MAX_OVERFLOW,
+        pool_timeout=config.DB_POOL_TIMEOUT,
+        pool_recycle=config.DB_POOL_RECYCLE,
+        pool_pre_ping=True
+    )
 
-SQLALCHEMY_DATABASE_URL = f"sqlite:///{DB_PATH}"
+SQLALCHEMY_DATABASE_URL = normalize_database_url(config.DATABASE_URL)
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+engine = create_db_engine(SQLALCHEMY_DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-Base = declarative_base()
\ No newline at end of file
+Base = declarative_base()
+
+
+def init_db():
+    """
+    Creates missing tables, nullable columns and indexes. Safe to run on every
+    startup, so schema additions reach databases created by earlier versions.
+    """
+    import app.models  # noqa: F401 - registers models on Base.metadata
+
+    Base.metadata.create_all(bind=engine)
+
+    inspector = inspect(engine)
+    preparer = engine.dialect.identifier_preparer
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing and column.nullable:
+                    ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                    connection.exec_driver_sql(f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {ddl}")
+
+    # IF NOT EXISTS rather than checkfirst: SQLite doesn't reflect expression indexes
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                connection.execute(CreateIndex(index, if_not_exists=True))
@@ -0,0 +1,50 @@
+"""
+Helpers for the few statements whose SQL differs between SQLite and PostgreSQL.
+"""
+from sqlalchemy import Table, and_, func, type_coerce
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection
+from app.db.types import UTCDateTime
+
+def upsert(connection: Connection, table: Table):
+    """Returns an INSERT construct supporting ON CONFLICT for the connection's dialect."""
+    name = connection.dialect.name
+    if name == "postgresql":
+        return postgresql.insert(table)
+    if name == "sqlite":
+        return sqlite.insert(table)
+    raise NotImplementedError(f"Upsert is not supported on {name}")
+
+def greatest(connection: Connection, *values):
+    """Row-wise maximum of the given expressions."""
+    if connection.dialect.name == "sqlite":
+        # SQLite's multi-argument max() is a scalar function
+        return func.max(*values)
+    return func.greatest(*values)
+
+def truncate_timestamp(connection: Connection, column, unit: str):
+    """Floors a UTC timestamp column to the start of its `unit` ("hour" or "day")."""
+    if connection.dialect.name == "sqlite":
+        formats = {"hour": "%Y-%m-%d %H:00:00", "day": "%Y-%m-%d 00:00:00"}
+        truncated = func.strftime(formats[unit], column)
+    else:
+        # Truncate in UTC rather than the session time zone
+        truncated = func.date_trunc(unit, func.timezone("UTC", column))
+    return type_coerce(truncated, UTCDateTime())
+
+def escape_like(value: str) -> str:
+    """Escapes LIKE wildcards in `value`, for patterns using escape="\\"."""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def starts_with(connection: Connection, column, prefix: str):
+    """
+    Case-insensitive prefix match written so it can use an index on lower(column).
+    """
+    lowered = func.lower(column)
+    if connection.dialect.name == "sqlite":
+        # SQLite's lower() only folds ASCII, and LIKE can't use an expression
+        # index, so match the range of keys sharing the prefix instead
+        prefix = "".join(char.lower() if char.isascii() else char for char in prefix)
+        return and_(lowered >= prefix, lowered < prefix[:-1] + chr(ord(prefix[-1]) + 1))
+    # PostgreSQL plans prefix LIKEs as a range scan on a text_pattern_ops index
+    return lowered.like(f"{escape_like(prefix.lower())}%", escape="\\")
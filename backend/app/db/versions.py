@@ -0,0 +1,52 @@
+"""
+In-process change counters per table, bumped when a session commits writes.
+Caches key their entries on these versions so any committed change invalidates them.
+Counters only see writes made by this process; caches pair them with a TTL.
+"""
+import threading
+from collections import defaultdict
+from typing import Dict, Tuple
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+_versions: Dict[str, int] = defaultdict(int)
+_lock = threading.Lock()
+
+def bump(*tables: str):
+    """Marks the given tables as changed."""
+    with _lock:
+        for table in tables:
+            _versions[table] += 1
+
+def current(*tables: str) -> Tuple[int, ...]:
+    """Returns the current version of each table, in order."""
+    with _lock:
+        return tuple(_versions[table] for table in tables)
+
+def _pending(session: Session) -> set:
+    return session.info.setdefault("changed_tables", set())
+
+@event.listens_for(Session, "after_flush")
+def _track_flushed_tables(session: Session, flush_context):
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        table = getattr(obj, "__tablename__", None)
+        if table:
+            _pending(session).add(table)
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_bulk_statements(orm_execute_state):
+    # Bulk INSERT/UPDATE/DELETE statements bypass the unit of work
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, "table", None)
+        if table is not None:
+            _pending(orm_execute_state.session).add(table.name)
+
+@event.listens_for(Session, "after_commit")
+def _bump_committed_tables(session: Session):
+    tables = session.info.pop("changed_tables", None)
+    if tables:
+        bump(*tables)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back_tables(session: Session):
+    session.info.pop("changed_tables", None)
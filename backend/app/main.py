@@ -1,19 +1,30 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
-from app.api.v1.endpoints import auth, providers, domains, system, metrics
+from app.api.v1.endpoints import auth, providers, domains, system, metrics, jobs, transfer
+from app.core import config, telemetry
+from app.core.compression import CompressionMiddleware
+from app.db.base import init_db
+from app.services.history_sink import get_history_sink
 from app.services.scheduler import get_scheduler
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
+    init_db()
+    get_history_sink().replay_spool()
     from app.services.scheduler import get_scheduler
     scheduler = get_scheduler()
     scheduler.load_all_schedules()
+    scheduler.add_maintenance_jobs()
+    # Queue depths are read from memory when scraped
+    telemetry.HISTORY_QUEUE_DEPTH.set_function(lambda: get_history_sink().depth)
+    telemetry.SCHEDULED_JOBS.set_function(lambda: len(scheduler.scheduler.get_jobs()))
     yield
     # Shutdown
     if scheduler.scheduler.running:
         scheduler.shutdown()
+    get_history_sink().close()
 
 app = FastAPI(title="ip-hop API", version="1.0.0", lifespan=lifespan)
 
@@ -29,6 +40,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if config.COMPRESSION_MINIMUM_SIZE > 0:
+    app.add_middleware(CompressionMiddleware, minimum_size=config.COMPRESSION_MINIMUM_SIZE)
 
 # API V1 Router
 app.include_router(auth.router, prefix="/api/v1/auth", tags=["auth"])
@@ -36,6 +49,8 @@ app.include_router(providers.router, prefix="/api/v1/providers", tags=["provider
 app.include_router(domains.router, prefix="/api/v1/domains", tags=["domains"])
 app.include_router(system.router, prefix="/api/v1/system", tags=["system"])
 app.include_router(metrics.router, prefix="/api/v1/metrics", tags=["metrics"])
+app.include_router(jobs.router, prefix="/api/v1/jobs", tags=["jobs"])
+app.include_router(transfer.router, prefix="/api/v1", tags=["transfer"])
 
 @app.get("/")
 def read_root():
@@ -1 +1 @@
-from .all_models import User, Provider, Domain, IPHistory
+from .all_models import User, Provider, Domain, IPHistory, DomainStatsHourly, ProviderStatsHourly, IPSeenHourly, IPChangesHourly
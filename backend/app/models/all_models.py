@@ -1,7 +1,12 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Text, JSON
+from datetime import datetime, timezone
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Text, Float, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.db.base import Base
+from app.db.types import JSONType, UTCDateTime
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
 
 class User(Base):
     __tablename__ = "users"
@@ -10,7 +15,7 @@ class User(Base):
     username = Column(String, unique=True, index=True, nullable=False)
     password_hash = Column(String, nullable=False)
     role = Column(String, default="user") # admin, user
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(UTCDateTime(), server_default=func.now())
 
 class Provider(Base):
     __tablename__ = "providers"
@@ -27,10 +32,10 @@ class Domain(Base):
     __tablename__ = "domains"
 
     id = Column(Integer, primary_key=True, index=True)
-    provider_id = Column(Integer, ForeignKey("providers.id"), nullable=False)
+    provider_id = Column(Integer, ForeignKey("providers.id"), nullable=False, index=True)
     domain_name = Column(String, index=True, nullable=False)
     external_id = Column(String, nullable=True) # Zone ID or Record ID
-    config = Column(JSON, default={}) # Extra config like proxied: true
+    config = Column(JSONType, default={}) # Extra config like proxied: true
     last_known_ip = Column(String, nullable=True)
     last_update_status = Column(String, nullable=True) # SUCCESS, FAILED
     cron_schedule = Column(String, nullable=True) # Cron expression for auto-updates
@@ -38,14 +43,96 @@ class Domain(Base):
     provider = relationship("Provider", back_populates="domains")
     history = relationship("IPHistory", back_populates="domain", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # Serves case-insensitive name prefix search (app.db.dialects.starts_with)
+        Index(
+            "ix_domains_domain_name_lower",
+            func.lower(domain_name).label("domain_name_lower"),
+            postgresql_ops={"domain_name_lower": "text_pattern_ops"}
+        ),
+    )
+
 class IPHistory(Base):
     __tablename__ = "ip_history"
 
     id = Column(Integer, primary_key=True, index=True)
     domain_id = Column(Integer, ForeignKey("domains.id"), nullable=False)
     ip_address = Column(String, nullable=False)
-    timestamp = Column(DateTime(timezone=True), server_default=func.now())
+    timestamp = Column(UTCDateTime(), default=utcnow, server_default=func.now())
     status = Column(String, nullable=False) # SUCCESS, FAILED
     message = Column(Text, nullable=True)
+    # Update timings in milliseconds; NULL for stages the update did not reach
+    duration_ms = Column(Float, nullable=True) # Whole update, up to the DB write
+    ip_fetch_ms = Column(Float, nullable=True)
+    decrypt_ms = Column(Float, nullable=True)
+    provider_ms = Column(Float, nullable=True)
+    db_write_ms = Column(Float, nullable=True) # Domain status write up to its flush (a batch's share per domain when buffered)
 
     domain = relationship("Domain", back_populates="history")
+
+    __table_args__ = (
+        # Serves per-domain history reads and retention pruning
+        Index("ix_ip_history_domain_id_timestamp", "domain_id", "timestamp"),
+        # Serves time-window metrics and the global activity feed
+        Index("ix_ip_history_timestamp_id", "timestamp", "id"),
+    )
+
+# Hourly rollups of ip_history, maintained as history is written (app/services/rollups.py)
+class DomainStatsHourly(Base):
+    __tablename__ = "domain_stats_hourly"
+
+    domain_id = Column(Integer, primary_key=True)
+    bucket_start = Column(UTCDateTime(), primary_key=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    successes = Column(Integer, nullable=False, default=0)
+    failures = Column(Integer, nullable=False, default=0)
+    distinct_ips = Column(Integer, nullable=False, default=0)
+    latency_ms_sum = Column(Integer, nullable=False, default=0)
+    latency_samples = Column(Integer, nullable=False, default=0)
+    last_event_at = Column(UTCDateTime(), nullable=True)
+
+    __table_args__ = (
+        Index("ix_domain_stats_hourly_bucket_start", "bucket_start"),
+    )
+
+class ProviderStatsHourly(Base):
+    __tablename__ = "provider_stats_hourly"
+
+    provider_id = Column(Integer, primary_key=True)
+    bucket_start = Column(UTCDateTime(), primary_key=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    successes = Column(Integer, nullable=False, default=0)
+    failures = Column(Integer, nullable=False, default=0)
+    distinct_ips = Column(Integer, nullable=False, default=0)
+    latency_ms_sum = Column(Integer, nullable=False, default=0)
+    latency_samples = Column(Integer, nullable=False, default=0)
+    last_event_at = Column(UTCDateTime(), nullable=True)
+
+    __table_args__ = (
+        Index("ix_provider_stats_hourly_bucket_start", "bucket_start"),
+    )
+
+class IPSeenHourly(Base):
+    """IPs reported per domain and hour; backs the distinct IP counts of the rollups."""
+    __tablename__ = "ip_seen_hourly"
+
+    bucket_start = Column(UTCDateTime(), primary_key=True)
+    domain_id = Column(Integer, primary_key=True)
+    ip_address = Column(String, primary_key=True)
+    provider_id = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index("ix_ip_seen_hourly_provider", "bucket_start", "provider_id", "ip_address"),
+    )
+
+class IPChangesHourly(Base):
+    """IP address changes per domain and hour. Only hours with a change have a row."""
+    __tablename__ = "ip_changes_hourly"
+
+    domain_id = Column(Integer, primary_key=True)
+    bucket_start = Column(UTCDateTime(), primary_key=True)
+    changes = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ix_ip_changes_hourly_bucket_start", "bucket_start"),
+    )
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, ConfigDict
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from datetime import datetime
 
 # Provider Schemas
@@ -22,6 +22,10 @@ class Provider(ProviderBase):
     
     model_config = ConfigDict(from_attributes=True)
 
+class ProviderTransfer(ProviderBase):
+    id: int
+    credentials: str # Encrypted under the export key
+
 # Domain Schemas
 class DomainBase(BaseModel):
     domain_name: str
@@ -38,6 +42,12 @@ class DomainUpdate(BaseModel):
     config: Optional[Dict[str, Any]] = None
     cron_schedule: Optional[str] = None
 
+class DomainBulkUpdate(DomainUpdate):
+    id: int
+
+class DomainBulkDelete(BaseModel):
+    ids: List[int]
+
 class Domain(DomainBase):
     id: int
     provider_id: int
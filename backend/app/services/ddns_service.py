@@ -1,25 +1,89 @@
+import asyncio
 import logging
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import AsyncIterator, Callable, Dict, List, Optional
 from sqlalchemy.orm import Session
 from app.models import Domain, Provider, IPHistory
-from app.core import security
+from app.core import config, security, telemetry
 from app.core.ip_fetcher import IPFetcher
+from app.db.base import SessionLocal
 from app.schemas.providers import DomainConfig
 from app.providers.dynu import DynuProvider
 from app.providers.cloudflare import CloudflareProvider
 from app.providers.duckdns import DuckDNSProvider
 from app.providers.noip import NoIPProvider
+from app.services.event_bus import get_event_bus
+from app.services.history_sink import HistorySink, get_history_sink
 
 logger = logging.getLogger(__name__)
 
+# Updates in progress, by domain id. Concurrent updates of a domain join the
+# running one instead of calling the provider again.
+_in_flight: Dict[int, asyncio.Future] = {}
+
+@contextmanager
+def _timed(timings: Dict[str, float], key: str):
+    """Stores the elapsed time of the block, in milliseconds, under `key`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[key] = round((time.perf_counter() - start) * 1000, 3)
+
 class DDNSService:
     
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, sink: Optional[HistorySink] = None, session_factory: Optional[Callable[[], Session]] = None):
+        """
+        With a `sink`, history rows and domain status changes are queued for a
+        bulk write instead of being committed by each update. Concurrent updates
+        open their own sessions from `session_factory`.
+        """
         self.db = db
+        self.sink = sink
+        self.session_factory = session_factory or SessionLocal
 
-    async def update_domain_ip(self, domain_id: int) -> bool:
+    async def update_domain_ip(self, domain_id: int, current_ip: Optional[str] = None) -> bool:
         """
         Triggers an immediate IP update for a specific domain.
+        Stage timings (IP fetch, credential decrypt, provider call, DB write) are
+        stored on the history row. When the caller already knows the `current_ip`,
+        it is used instead of fetching it.
+
+        If the domain is already being updated (e.g. a manual update during a
+        scheduled one), this waits for that update and returns its result, or
+        raises its error, without updating the provider a second time.
         """
+        running = _in_flight.get(domain_id)
+        if running is not None:
+            telemetry.UPDATES_JOINED.inc()
+            logger.info(f"Domain {domain_id} is already being updated, waiting for that update")
+            # Shielded so a caller giving up does not cancel the update it joined
+            return await asyncio.shield(running)
+
+        future = asyncio.get_running_loop().create_future()
+        # The error is re-raised to this caller; joiners are optional
+        future.add_done_callback(lambda done: done.cancelled() or done.exception())
+        _in_flight[domain_id] = future
+        try:
+            result = await self._update_domain_ip(domain_id, current_ip)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            del _in_flight[domain_id]
+
+    async def _update_domain_ip(self, domain_id: int, current_ip: Optional[str]) -> bool:
+        started = time.perf_counter()
+        timings: Dict[str, float] = {}
+
         domain = self.db.query(Domain).filter(Domain.id == domain_id).first()
         if not domain:
             raise ValueError("Domain not found")
@@ -29,16 +93,19 @@ class DDNSService:
              raise ValueError("Provider is disabled")
 
         # 1. Fetch Current IP
-        fetcher = IPFetcher()
-        try:
-            current_ip = await fetcher.get_current_ip()
-        except Exception as e:
-            self._log_history(domain.id, "0.0.0.0", "FAILED", f"IP Fetch Error: {e}")
-            raise e
+        if current_ip is None:
+            fetcher = IPFetcher()
+            try:
+                with _timed(timings, "ip_fetch_ms"):
+                    current_ip = await fetcher.get_current_ip()
+            except Exception as e:
+                self._record_result(domain, "0.0.0.0", "FAILED", f"IP Fetch Error: {e}", started, timings, update_status=False)
+                raise e
 
         # 2. Decrypt Credentials
         try:
-            creds = security.decrypt_credentials(provider.credentials_encrypted)
+            with _timed(timings, "decrypt_ms"):
+                creds = security.decrypt_credentials(provider.credentials_encrypted)
             
             provider_instance = None
             if provider.type == "dynu":
@@ -65,51 +132,134 @@ class DDNSService:
             )
             
             # 4. Update
-            success = await provider_instance.update_record(current_ip, d_config)
+            with _timed(timings, "provider_ms"):
+                success = await provider_instance.update_record(current_ip, d_config)
+            telemetry.PROVIDER_CALL_SECONDS.labels(provider.type).observe(timings["provider_ms"] / 1000)
             
             if success:
-                self._log_history(domain.id, current_ip, "SUCCESS", "Updated successfully")
-                domain.last_known_ip = current_ip
-                domain.last_update_status = "SUCCESS"
-                self.db.commit()
-                self._cleanup_old_history(domain.id)  # Retention policy
+                self._record_result(domain, current_ip, "SUCCESS", "Updated successfully", started, timings)
                 return True
             else:
-                self._log_history(domain.id, current_ip, "FAILED", "Provider rejected update")
-                domain.last_update_status = "FAILED"
-                self.db.commit()
+                self._record_result(domain, current_ip, "FAILED", "Provider rejected update", started, timings)
                 return False
 
         except Exception as e:
             logger.error(f"Update failed: {e}")
-            self._log_history(domain.id, current_ip, "FAILED", str(e))
-            domain.last_update_status = "FAILED"
-            self.db.commit()
+            self._record_result(domain, current_ip, "FAILED", str(e), started, timings)
             raise e
 
-    def _log_history(self, domain_id: int, ip: str, status: str, message: str):
-        history = IPHistory(
-            domain_id=domain_id,
-            ip_address=ip,
-            status=status,
-            message=message
-        )
-        self.db.add(history)
-    
-    def _cleanup_old_history(self, domain_id: int):
+    async def update_domains(self, domains: List[Domain], current_ip: str, force: bool = True) -> AsyncIterator[dict]:
         """
-        Keep only the last 20 IP history records for a domain.
+        Updates `domains` to `current_ip` concurrently and yields each result as it
+        completes. At most UPDATE_ALL_CONCURRENCY updates run at once, and at most
+        UPDATE_ALL_PROVIDER_CONCURRENCY per provider. Unless `force` is set, domains
+        already at `current_ip` are reported UNCHANGED without calling the provider.
+
+        Each update runs on its own session, so updates already started finish
+        even if the caller stops iterating (e.g. the client disconnects) and this
+        service's session is closed. Their history is written in bulk by the sink,
+        which is required.
         """
-        # Get all history for domain, ordered by timestamp DESC
-        all_history = self.db.query(IPHistory).filter(
-            IPHistory.domain_id == domain_id
-        ).order_by(IPHistory.timestamp.desc()).all()
-        
-        # If more than 20, delete the oldest ones
-        if len(all_history) > 20:
-            records_to_delete = all_history[20:]
-            for record in records_to_delete:
-                self.db.delete(record)
-            self.db.commit()
-            logger.info(f"Cleaned up {len(records_to_delete)} old history records for domain {domain_id}")
+        if self.sink is None:
+            raise ValueError("Concurrent updates need a history sink")
+        overall = asyncio.Semaphore(config.UPDATE_ALL_CONCURRENCY)
+        per_provider = defaultdict(lambda: asyncio.Semaphore(config.UPDATE_ALL_PROVIDER_CONCURRENCY))
+
+        async def update(domain_id: int, domain_name: str, provider_id: int, last_known_ip: Optional[str]) -> dict:
+            result = {"domain_id": domain_id, "domain_name": domain_name, "ip_address": current_ip}
+            if not force and last_known_ip == current_ip:
+                return {**result, "status": "UNCHANGED", "message": "IP unchanged", "duration_ms": 0}
+            # Provider slot first, so waiting on a busy provider doesn't hold an overall slot
+            async with per_provider[provider_id], overall:
+                started = time.perf_counter()
+                db = self.session_factory()
+                try:
+                    if await DDNSService(db, sink=self.sink).update_domain_ip(domain_id, current_ip=current_ip):
+                        status, message = "SUCCESS", "Updated successfully"
+                    else:
+                        status, message = "FAILED", "Provider rejected update"
+                except Exception as e:
+                    status, message = "FAILED", str(e)
+                finally:
+                    db.close()
+                duration_ms = round((time.perf_counter() - started) * 1000, 3)
+            return {**result, "status": status, "message": message, "duration_ms": duration_ms}
 
+        tasks = [
+            asyncio.ensure_future(update(
+                domain.id,
+                domain.domain_name,
+                domain.provider_id,
+                self.sink.pending_ip(domain.id) or domain.last_known_ip
+            ))
+            for domain in domains
+        ]
+        for completed in asyncio.as_completed(tasks):
+            yield await completed
+
+    def _record_result(
+        self,
+        domain: Domain,
+        ip: str,
+        status: str,
+        message: str,
+        started: float,
+        timings: Dict[str, float],
+        update_status: bool = True
+    ):
+        """
+        Records a history row and, unless `update_status` is False, the domain's new
+        status (and IP on success). Written through in one commit, or queued on the sink.
+        The update is published on the event bus for live activity streams once it
+        is committed.
+        duration_ms covers the update up to this point; db_write_ms is the time taken
+        to write the domain status change, up to its flush.
+        """
+        last_known_ip = ip if status == "SUCCESS" else None
+        last_update_status = status if update_status else None
+        timings["duration_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        telemetry.UPDATES.labels(domain.provider.type, status).inc()
+        event = {
+            "domain_id": domain.id,
+            "domain_name": domain.domain_name,
+            "ip_address": ip,
+            "status": status,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "message": message
+        }
+
+        sink = self.sink
+        if sink is None:
+            # Results of earlier updates still queued are written first, so they can't
+            # overwrite this one later; if they can't be written now, it queues behind them
+            queued = get_history_sink()
+            if queued.has_pending(domain.id):
+                queued.flush()
+                if queued.has_pending(domain.id):
+                    sink = queued
+        if sink is not None:
+            sink.record(
+                domain.id, ip, status, message,
+                last_update_status=last_update_status,
+                last_known_ip=last_known_ip,
+                timings=timings,
+                event=event
+            )
+            return
+
+        if last_update_status:
+            with _timed(timings, "db_write_ms"):
+                domain.last_update_status = last_update_status
+                if last_known_ip:
+                    domain.last_known_ip = last_known_ip
+                self.db.flush()
+
+        self.db.add(IPHistory(
+            domain_id=domain.id,
+            ip_address=ip,
+            status=status,
+            message=message,
+            **timings
+        ))
+        self.db.commit()
+        get_event_bus().publish("update", event)
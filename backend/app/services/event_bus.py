@@ -0,0 +1,116 @@
+import asyncio
+import itertools
+import logging
+import secrets
+import threading
+from collections import deque
+from typing import Deque, List, Optional
+from app.core import config
+
+logger = logging.getLogger(__name__)
+
+class Subscription:
+    """
+    A subscriber's queue of events. Iterate with `get`; `overflowed` is set when the
+    subscriber fell too far behind and events were dropped, so it should reconnect.
+    """
+
+    def __init__(self, bus: "EventBus", loop: asyncio.AbstractEventLoop, backlog: List[dict], max_pending: int):
+        self.bus = bus
+        self.backlog = backlog
+        self.overflowed = False
+        self._loop = loop
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[dict]:
+        """Next event, or None if none arrived within `timeout` seconds."""
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+    def _deliver(self, event: dict):
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+class EventBus:
+    """
+    In-process publish/subscribe for update events.
+
+    The last `buffer_size` events are kept in a ring buffer so a subscriber that
+    reconnects with the id of the last event it saw receives what it missed.
+    Ids are "<boot id>-<sequence>": sequences restart with the process, so an id
+    from an earlier boot gets the whole buffer rather than skipping events.
+    Publishing is thread-safe; subscribers are asyncio consumers.
+    """
+
+    def __init__(self, buffer_size: int = config.EVENT_BUFFER_SIZE, max_pending: int = 1000):
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self.boot_id = secrets.token_hex(4)
+        self._sequence = itertools.count(1)
+        self._buffer: Deque[dict] = deque(maxlen=buffer_size)
+        self._subscribers: List[Subscription] = []
+
+    def publish(self, event_type: str, data: dict) -> dict:
+        """Assigns the event an id, buffers it and hands it to every subscriber."""
+        with self._lock:
+            sequence = next(self._sequence)
+            event = {"id": f"{self.boot_id}-{sequence}", "sequence": sequence, "type": event_type, "data": data}
+            self._buffer.append(event)
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            try:
+                subscription._loop.call_soon_threadsafe(subscription._deliver, event)
+            except RuntimeError:
+                # Event loop already closed
+                self.unsubscribe(subscription)
+        return event
+
+    def subscribe(self, last_event_id: Optional[str] = None) -> Subscription:
+        """
+        Registers a subscriber on the running event loop. With `last_event_id`,
+        buffered events after it are returned in `Subscription.backlog`.
+        """
+        loop = asyncio.get_running_loop()
+        after = self._resume_after(last_event_id)
+        with self._lock:
+            backlog = [event for event in self._buffer if after is not None and event["sequence"] > after]
+            subscription = Subscription(self, loop, backlog, self.max_pending)
+            self._subscribers.append(subscription)
+        return subscription
+
+    def _resume_after(self, last_event_id: Optional[str]) -> Optional[int]:
+        """Sequence a subscriber has seen up to; 0 for ids this process didn't issue."""
+        if not last_event_id:
+            return None
+        boot_id, _, sequence = last_event_id.rpartition("-")
+        if boot_id != self.boot_id or not sequence.isdigit():
+            return 0
+        return int(sequence)
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+# Global event bus instance
+event_bus: Optional[EventBus] = None
+
+def get_event_bus() -> EventBus:
+    """
+    Get the global event bus instance.
+    """
+    global event_bus
+    if event_bus is None:
+        event_bus = EventBus()
+    return event_bus
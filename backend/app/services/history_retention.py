@@ -0,0 +1,96 @@
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional, Tuple
+from sqlalchemy import delete, func, or_, select
+from sqlalchemy.orm import Session
+from app.core import config
+from app.models import Domain, IPHistory
+
+logger = logging.getLogger(__name__)
+
+RetentionPolicy = Tuple[int, int]
+
+def get_retention_policy(domain_config: Optional[dict]) -> RetentionPolicy:
+    """
+    Resolves the (max_records, max_age_days) policy for a domain.
+    Values from the domain config override the global defaults; 0 disables a limit.
+    Values that aren't non-negative integers fall back to the defaults, so one
+    misconfigured domain doesn't stop the others from being pruned.
+    """
+    domain_config = domain_config if isinstance(domain_config, dict) else {}
+    return (
+        _limit(domain_config, "history_max_records", config.HISTORY_MAX_RECORDS),
+        _limit(domain_config, "history_max_age_days", config.HISTORY_MAX_AGE_DAYS)
+    )
+
+def _limit(domain_config: dict, key: str, default: int) -> int:
+    value = domain_config.get(key, default)
+    try:
+        limit = int(value or 0)
+    except (TypeError, ValueError):
+        limit = -1
+    if limit < 0:
+        logger.warning(f"Ignoring invalid {key} {value!r}, using {default}")
+        return default
+    return limit
+
+def _delete_expired(db: Session, domain_ids: Iterable[int], policy: RetentionPolicy) -> int:
+    """
+    Deletes history rows outside the policy for the given domains in a single statement.
+    """
+    max_records, max_age_days = policy
+    if not max_records and not max_age_days:
+        return 0
+
+    ranked = select(
+        IPHistory.id,
+        IPHistory.timestamp,
+        func.row_number().over(
+            partition_by=IPHistory.domain_id,
+            order_by=(IPHistory.timestamp.desc(), IPHistory.id.desc())
+        ).label("position")
+    ).where(IPHistory.domain_id.in_(list(domain_ids))).subquery()
+
+    conditions = []
+    if max_records:
+        conditions.append(ranked.c.position > max_records)
+    if max_age_days:
+        cutoff = datetime.now(timezone.utc) - timedelta(days=max_age_days)
+        conditions.append(ranked.c.timestamp < cutoff)
+
+    stmt = delete(IPHistory).where(
+        IPHistory.id.in_(select(ranked.c.id).where(or_(*conditions)))
+    ).execution_options(synchronize_session=False)
+    return db.execute(stmt).rowcount or 0
+
+def prune_history(db: Session, batch_size: Optional[int] = None) -> int:
+    """
+    Applies the retention policy to all domains.
+    Domains are processed in batches of `batch_size`; each batch issues one DELETE
+    per distinct policy and is committed on its own to keep transactions short.
+    Returns the number of deleted rows.
+    """
+    batch_size = batch_size or config.HISTORY_RETENTION_BATCH_SIZE
+    deleted = 0
+    last_id = 0
+
+    while True:
+        batch = db.query(Domain.id, Domain.config).filter(
+            Domain.id > last_id
+        ).order_by(Domain.id).limit(batch_size).all()
+        if not batch:
+            break
+        last_id = batch[-1].id
+
+        by_policy = defaultdict(list)
+        for domain_id, domain_config in batch:
+            by_policy[get_retention_policy(domain_config)].append(domain_id)
+
+        for policy, domain_ids in by_policy.items():
+            deleted += _delete_expired(db, domain_ids, policy)
+        db.commit()
+
+    if deleted:
+        logger.info(f"History retention removed {deleted} records")
+    return deleted
@@ -0,0 +1,263 @@
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+from sqlalchemy import bindparam, insert, select, update
+from sqlalchemy.orm import Session
+from app.core import config
+from app.db.base import SessionLocal
+from app.models import Domain, IPHistory
+from app.services.event_bus import get_event_bus
+from app.services.rollups import apply_history
+
+logger = logging.getLogger(__name__)
+
+TIMING_FIELDS = ("duration_ms", "ip_fetch_ms", "decrypt_ms", "provider_ms")
+
+class HistorySink:
+    """
+    Buffers IP history rows and domain status changes in memory and writes them
+    in bulk, at most `flush_size` entries per transaction.
+
+    Every entry is appended to a journal file before it is queued, and the journal
+    is cut down to the entries still queued once a flush has written what it can. Entries left in the journal by
+    a crash are written by `replay_spool` on the next startup. Entries' events are
+    published on the event bus once they are committed.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        flush_size: int = config.HISTORY_FLUSH_SIZE,
+        spool_path: Optional[str] = config.HISTORY_SPOOL_PATH
+    ):
+        self.session_factory = session_factory
+        self.flush_size = flush_size
+        self.spool_path = spool_path or None
+        self._lock = threading.RLock()
+        self._pending: List[dict] = []
+        self._domain_state: Dict[int, dict] = {}
+        self._spool = None
+
+    def record(
+        self,
+        domain_id: int,
+        ip_address: str,
+        status: str,
+        message: Optional[str] = None,
+        last_update_status: Optional[str] = None,
+        last_known_ip: Optional[str] = None,
+        timings: Optional[Dict[str, float]] = None,
+        event: Optional[dict] = None
+    ):
+        """
+        Queues a history row and the matching domain status change.
+        `timings` holds the update's stage timings (see IPHistory), and `event`
+        the update event to publish once the row is written.
+        Flushes immediately once `flush_size` entries are pending.
+        """
+        entry = {
+            "domain_id": domain_id,
+            "ip_address": ip_address,
+            "status": status,
+            "message": message,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "last_update_status": last_update_status,
+            "last_known_ip": last_known_ip,
+            **{key: (timings or {}).get(key) for key in TIMING_FIELDS},
+            "event": event,
+        }
+        with self._lock:
+            self._write_spool(entry)
+            self._enqueue(entry)
+            if len(self._pending) >= self.flush_size:
+                self.flush()
+
+    def pending_ip(self, domain_id: int) -> Optional[str]:
+        """Returns the queued last_known_ip for a domain, if it has not been written yet."""
+        with self._lock:
+            return self._domain_state.get(domain_id, {}).get("last_known_ip")
+
+    def has_pending(self, domain_id: int) -> bool:
+        """Whether any entry for the domain is waiting to be written."""
+        with self._lock:
+            return domain_id in self._domain_state
+
+    @property
+    def depth(self) -> int:
+        """Number of history entries waiting to be written."""
+        return len(self._pending)
+
+    def flush(self) -> int:
+        """
+        Writes the pending entries in order, in transactions of at most `flush_size`
+        entries, each dequeued once committed. If one fails, it and the entries
+        after it stay queued (and journaled) for the next flush.
+        Returns the number of history rows written.
+        """
+        with self._lock:
+            if not self._pending:
+                return 0
+
+            flushed = 0
+            while self._pending:
+                chunk = self._pending[:max(self.flush_size, 1)]
+                db = self.session_factory()
+                try:
+                    written = self._write(db, chunk, _domain_state(chunk))
+                    db.commit()
+                except Exception as e:
+                    db.rollback()
+                    logger.error(f"History flush failed, keeping {len(self._pending)} entries queued: {e}")
+                    break
+                finally:
+                    db.close()
+
+                self._pending = self._pending[len(chunk):]
+                for entry in written:
+                    if entry.get("event"):
+                        get_event_bus().publish("update", entry["event"])
+                flushed += len(written)
+
+            self._domain_state = _domain_state(self._pending)
+            self._rewrite_spool(self._pending)
+            if flushed:
+                logger.debug(f"Flushed {flushed} history entries")
+            return flushed
+
+    def replay_spool(self) -> int:
+        """
+        Queues entries journaled before a crash and writes them.
+        Called on application startup.
+        """
+        if not self.spool_path or not os.path.exists(self.spool_path):
+            return 0
+
+        replayed = 0
+        with self._lock:
+            with open(self.spool_path, "r", encoding="utf-8") as spool:
+                for line in spool:
+                    try:
+                        self._enqueue(json.loads(line))
+                        replayed += 1
+                    except json.JSONDecodeError:
+                        # A torn final line from a crash mid-write
+                        logger.warning("Skipping unreadable history journal entry")
+            if replayed:
+                logger.info(f"Replaying {replayed} journaled history entries")
+            self.flush()
+        return replayed
+
+    def close(self):
+        """
+        Flushes pending entries and releases the journal.
+        Called on application shutdown.
+        """
+        with self._lock:
+            self.flush()
+            if self._spool:
+                self._spool.close()
+                self._spool = None
+
+    def _enqueue(self, entry: dict):
+        self._pending.append(entry)
+        _apply_state(self._domain_state, entry)
+
+    def _write(self, db: Session, entries: List[dict], domain_state: Dict[int, dict]) -> List[dict]:
+        """Writes the entries whose domain still exists and returns them."""
+        # Drop entries for domains deleted while they were queued
+        domain_ids = {entry["domain_id"] for entry in entries}
+        existing = set(db.scalars(select(Domain.id).where(Domain.id.in_(domain_ids))))
+
+        # Domain status first, so its duration can be stored with the history rows
+        started = time.perf_counter()
+        updated = 0
+        domains = Domain.__table__
+        # One executemany per column set: status only, or status and IP
+        for columns in (("last_update_status",), ("last_update_status", "last_known_ip")):
+            params = [
+                {"b_id": domain_id, **{column: state[column] for column in columns}}
+                for domain_id, state in domain_state.items()
+                if domain_id in existing and set(state) == set(columns)
+            ]
+            if params:
+                stmt = update(domains).where(domains.c.id == bindparam("b_id")).values(
+                    {column: bindparam(column) for column in columns}
+                )
+                db.execute(stmt, params)
+                updated += len(params)
+        # The batch's share per domain status change
+        db_write_ms = round((time.perf_counter() - started) * 1000 / max(updated, 1), 3)
+
+        written = [entry for entry in entries if entry["domain_id"] in existing]
+        rows = [
+            {
+                "domain_id": entry["domain_id"],
+                "ip_address": entry["ip_address"],
+                "status": entry["status"],
+                "message": entry["message"],
+                "timestamp": datetime.fromisoformat(entry["timestamp"]),
+                **{key: entry.get(key) for key in TIMING_FIELDS},
+                "db_write_ms": db_write_ms if entry.get("last_update_status") else None,
+            }
+            for entry in written
+        ]
+        if rows:
+            db.execute(insert(IPHistory), rows)
+            apply_history(db.connection(), rows)
+        return written
+
+    def _write_spool(self, entry: dict):
+        if not self.spool_path:
+            return
+        try:
+            if self._spool is None:
+                self._spool = open(self.spool_path, "a", encoding="utf-8")
+            self._spool.write(json.dumps(entry) + "\n")
+            self._spool.flush()
+        except OSError as e:
+            logger.warning(f"Cannot write history journal {self.spool_path}: {e}")
+
+    def _rewrite_spool(self, entries: List[dict]):
+        """Cuts the journal down to `entries`, the ones still queued."""
+        if not self.spool_path:
+            return
+        try:
+            if self._spool is None:
+                self._spool = open(self.spool_path, "a", encoding="utf-8")
+            self._spool.seek(0)
+            self._spool.truncate()
+            if entries:
+                self._spool.writelines(json.dumps(entry) + "\n" for entry in entries)
+                self._spool.flush()
+        except OSError as e:
+            logger.warning(f"Cannot rewrite history journal {self.spool_path}: {e}")
+
+def _apply_state(domain_state: Dict[int, dict], entry: dict):
+    """Merges an entry's status change into the latest known state of its domain."""
+    state = domain_state.setdefault(entry["domain_id"], {})
+    if entry.get("last_update_status"):
+        state["last_update_status"] = entry["last_update_status"]
+    if entry.get("last_known_ip"):
+        state["last_known_ip"] = entry["last_known_ip"]
+
+def _domain_state(entries: List[dict]) -> Dict[int, dict]:
+    domain_state: Dict[int, dict] = {}
+    for entry in entries:
+        _apply_state(domain_state, entry)
+    return domain_state
+
+# Global history sink instance
+history_sink: Optional[HistorySink] = None
+
+def get_history_sink() -> HistorySink:
+    """
+    Get the global history sink instance.
+    """
+    global history_sink
+    if history_sink is None:
+        history_sink = HistorySink()
+    return history_sink
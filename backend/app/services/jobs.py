@@ -0,0 +1,115 @@
+import logging
+import secrets
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+from app.core import config
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+ACTIVE_STATES = (QUEUED, RUNNING)
+
+class JobQueueFull(Exception):
+    """Raised when every tracked job is still active and no more can be accepted."""
+    pass
+
+class UpdateJob:
+    """
+    State of an update requested through the API and run by the scheduler.
+    """
+
+    def __init__(self, domain_id: int):
+        self.id = secrets.token_hex(8)
+        self.domain_id = domain_id
+        self.status = QUEUED
+        self.message: Optional[str] = None
+        self.created_at = datetime.now(timezone.utc)
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+
+    @property
+    def active(self) -> bool:
+        return self.status in ACTIVE_STATES
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "domain_id": self.domain_id,
+            "status": self.status,
+            "message": self.message,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None
+        }
+
+class JobRegistry:
+    """
+    In-memory registry of update jobs, bounded to `max_jobs`.
+
+    When full, the oldest finished job is forgotten to make room; if every job is
+    still queued or running, new jobs are refused with JobQueueFull. A domain has at
+    most one active job: requesting another returns the one already queued or running.
+    """
+
+    def __init__(self, max_jobs: int = config.UPDATE_JOBS_MAX):
+        self.max_jobs = max_jobs
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, UpdateJob]" = OrderedDict()
+
+    def create(self, domain_id: int) -> Tuple[UpdateJob, bool]:
+        """
+        Returns (job, created): the domain's active job if it has one, else a new
+        queued job.
+        """
+        with self._lock:
+            for job in self._jobs.values():
+                if job.domain_id == domain_id and job.active:
+                    return job, False
+            if len(self._jobs) >= self.max_jobs:
+                finished = next((job_id for job_id, job in self._jobs.items() if not job.active), None)
+                if finished is None:
+                    raise JobQueueFull(f"{self.max_jobs} update jobs are already in progress")
+                del self._jobs[finished]
+            job = UpdateJob(domain_id)
+            self._jobs[job.id] = job
+            return job, True
+
+    def get(self, job_id: str) -> Optional[UpdateJob]:
+        return self._jobs.get(job_id)
+
+    def list(self) -> List[UpdateJob]:
+        """Tracked jobs, newest first."""
+        with self._lock:
+            return list(reversed(self._jobs.values()))
+
+    def start(self, job: UpdateJob):
+        job.status = RUNNING
+        job.started_at = datetime.now(timezone.utc)
+
+    def finish(self, job: UpdateJob, succeeded: bool, message: str):
+        job.status = SUCCEEDED if succeeded else FAILED
+        job.message = message
+        job.finished_at = datetime.now(timezone.utc)
+        logger.info(f"Update job {job.id} for domain {job.domain_id} {job.status}: {message}")
+
+    def discard(self, job: UpdateJob):
+        """Forgets a job that could not be scheduled."""
+        with self._lock:
+            self._jobs.pop(job.id, None)
+
+# Global job registry instance
+job_registry: Optional[JobRegistry] = None
+
+def get_job_registry() -> JobRegistry:
+    """
+    Get the global job registry instance.
+    """
+    global job_registry
+    if job_registry is None:
+        job_registry = JobRegistry()
+    return job_registry
@@ -0,0 +1,145 @@
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Optional
+from cryptography.fernet import InvalidToken
+from sqlalchemy import and_, bindparam, update
+from sqlalchemy.orm import Session
+from app.core import config, security
+from app.db.base import SessionLocal
+from app.models import Provider
+
+logger = logging.getLogger(__name__)
+
+IDLE = "idle"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+class KeyRotation:
+    """
+    Progress of re-encrypting provider credentials with ENCRYPTION_KEY.
+    Only one rotation runs at a time: `begin` refuses to start another.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.status = IDLE
+        self.total = 0
+        self.processed = 0
+        self.reencrypted = 0
+        # Credentials no configured key can decrypt; they are left as they are
+        self.failed = 0
+        self.last_id = 0
+        self.error: Optional[str] = None
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+
+    @property
+    def running(self) -> bool:
+        return self.status == RUNNING
+
+    def begin(self) -> bool:
+        """Resets the progress and marks the rotation running, unless it already is."""
+        with self._lock:
+            if self.running:
+                return False
+            self._reset()
+            self.status = RUNNING
+            self.started_at = datetime.now(timezone.utc)
+            return True
+
+    def finish(self, error: Optional[str] = None):
+        self.status = FAILED if error else COMPLETED
+        self.error = error
+        self.finished_at = datetime.now(timezone.utc)
+
+    def to_dict(self) -> dict:
+        return {
+            "status": self.status,
+            "total": self.total,
+            "processed": self.processed,
+            "reencrypted": self.reencrypted,
+            "failed": self.failed,
+            "error": self.error,
+            "old_keys": len(security.ENCRYPTION_OLD_KEYS),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None
+        }
+
+def reencrypt_providers(db: Session, rotation: KeyRotation, batch_size: Optional[int] = None) -> KeyRotation:
+    """
+    Re-encrypts every provider's credentials that aren't under ENCRYPTION_KEY yet.
+
+    Providers are read by id in batches of `batch_size` and each batch is committed
+    on its own, so rows are only locked briefly. A row is only rewritten if its
+    credentials haven't changed since they were read, so concurrent edits win.
+    Credentials already under the current key are skipped, which makes running it
+    again after an interruption pick up where it stopped.
+    """
+    batch_size = batch_size or config.KEY_ROTATION_BATCH_SIZE
+    rotation.total = db.query(Provider).count()
+    db.rollback()
+    # Compare-and-swap on the ciphertext read in this batch
+    stmt = update(Provider.__table__).where(and_(
+        Provider.__table__.c.id == bindparam("row_id"),
+        Provider.__table__.c.credentials_encrypted == bindparam("old")
+    )).values(credentials_encrypted=bindparam("new"))
+
+    while True:
+        rows = db.query(Provider.id, Provider.credentials_encrypted).filter(
+            Provider.id > rotation.last_id
+        ).order_by(Provider.id).limit(batch_size).all()
+        if not rows:
+            break
+
+        changes = []
+        for row in rows:
+            if not security.needs_reencryption(row.credentials_encrypted):
+                continue
+            try:
+                reencrypted = security.reencrypt_credentials(row.credentials_encrypted)
+            except InvalidToken:
+                rotation.failed += 1
+                logger.warning(f"Credentials of provider {row.id} can't be decrypted with any configured key")
+                continue
+            changes.append({"row_id": row.id, "old": row.credentials_encrypted, "new": reencrypted})
+        if changes:
+            rotation.reencrypted += db.execute(stmt, changes).rowcount or 0
+        db.commit()
+        for change in changes:
+            security.forget_credentials(change["old"])
+
+        rotation.last_id = rows[-1].id
+        rotation.processed += len(rows)
+
+    logger.info(f"Key rotation re-encrypted {rotation.reencrypted} of {rotation.processed} providers ({rotation.failed} failed)")
+    return rotation
+
+def run_key_rotation(rotation: Optional[KeyRotation] = None):
+    """
+    Background task re-encrypting provider credentials; `rotation` must have begun.
+    """
+    rotation = rotation or get_key_rotation()
+    db = SessionLocal()
+    try:
+        reencrypt_providers(db, rotation)
+        rotation.finish()
+    except Exception as e:
+        logger.error(f"Key rotation failed: {e}")
+        db.rollback()
+        rotation.finish(str(e))
+    finally:
+        db.close()
+
+# Global rotation progress
+key_rotation: Optional[KeyRotation] = None
+
+def get_key_rotation() -> KeyRotation:
+    global key_rotation
+    if key_rotation is None:
+        key_rotation = KeyRotation()
+    return key_rotation
@@ -0,0 +1,311 @@
+import logging
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import case, delete, event, func, literal, select, tuple_
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+from app.core import config
+from app.db.dialects import greatest, upsert
+from app.models import Domain, IPHistory, DomainStatsHourly, ProviderStatsHourly, IPSeenHourly, IPChangesHourly
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_MODELS = (DomainStatsHourly, ProviderStatsHourly, IPSeenHourly, IPChangesHourly)
+# Domains per query when reading history around a batch
+SPAN_QUERY_CHUNK = 500
+COUNTERS = ("attempts", "successes", "failures", "distinct_ips", "latency_ms_sum", "latency_samples")
+
+def as_utc(timestamp: datetime) -> datetime:
+    """Converts a timestamp to UTC. Naive values are taken as UTC."""
+    if timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.astimezone(timezone.utc)
+
+def bucket_start(timestamp: datetime) -> datetime:
+    """Floors a timestamp to the start of its UTC hour. Naive values are taken as UTC."""
+    return as_utc(timestamp).replace(minute=0, second=0, microsecond=0)
+
+def window_start(hours: int) -> datetime:
+    """
+    First bucket of a trailing window. Rollup windows are hour-aligned, so
+    "last 24h" covers the current partial hour plus the 24 hours before it.
+    """
+    return bucket_start(datetime.now(timezone.utc) - timedelta(hours=hours))
+
+def apply_history(connection: Connection, entries: List[dict], previous_ips: Optional[Dict[int, str]] = None):
+    """
+    Adds history entries to the hourly rollups.
+    Each entry needs domain_id, ip_address, status and timestamp; duration_ms is optional.
+    Runs on the caller's connection so rollups commit together with the history rows.
+
+    IP changes are counted by timestamp against the neighbouring ip_history rows (see
+    `_count_ip_changes_in_history`), so entries may arrive out of order. `previous_ips`
+    is for walking all of history in time order instead: it maps domain ids to the IP
+    recorded before the entries and is updated in place.
+    """
+    if not entries:
+        return
+
+    domain_ids = {entry["domain_id"] for entry in entries}
+    timestamps = [as_utc(entry.get("timestamp") or datetime.now(timezone.utc)) for entry in entries]
+    columns = [Domain.id, Domain.provider_id]
+    spans: Dict[int, Tuple[datetime, datetime]] = {}
+    if previous_ips is None:
+        for entry, timestamp in zip(entries, timestamps):
+            first, last = spans.get(entry["domain_id"], (timestamp, timestamp))
+            spans[entry["domain_id"]] = (min(first, timestamp), max(last, timestamp))
+        columns.extend(_neighbour_columns(spans))
+    domain_rows = connection.execute(select(*columns).where(Domain.id.in_(domain_ids))).all()
+    provider_of = {row[0]: row[1] for row in domain_rows}
+
+    events = []
+    for entry, timestamp in zip(entries, timestamps):
+        provider_id = provider_of.get(entry["domain_id"])
+        if provider_id is None:
+            continue
+        events.append((entry, provider_id, bucket_start(timestamp), timestamp))
+    if not events:
+        return
+
+    new_domain_ips, new_provider_ips = _register_seen_ips(connection, events)
+
+    domain_stats: Dict[tuple, dict] = defaultdict(_empty_stats)
+    provider_stats: Dict[tuple, dict] = defaultdict(_empty_stats)
+    for entry, provider_id, bucket, timestamp in events:
+        success = entry["status"] == "SUCCESS"
+        latency = entry.get("duration_ms")
+        for stats in (domain_stats[(entry["domain_id"], bucket)], provider_stats[(provider_id, bucket)]):
+            stats["attempts"] += 1
+            stats["successes"] += 1 if success else 0
+            stats["failures"] += 0 if success else 1
+            if latency is not None:
+                stats["latency_ms_sum"] += round(latency)
+                stats["latency_samples"] += 1
+            if stats["last_event_at"] is None or timestamp > stats["last_event_at"]:
+                stats["last_event_at"] = timestamp
+
+    for bucket, domain_id, _ in new_domain_ips:
+        domain_stats[(domain_id, bucket)]["distinct_ips"] += 1
+    for bucket, provider_id, _ in new_provider_ips:
+        provider_stats[(provider_id, bucket)]["distinct_ips"] += 1
+
+    _upsert_stats(connection, DomainStatsHourly, "domain_id", domain_stats)
+    _upsert_stats(connection, ProviderStatsHourly, "provider_id", provider_stats)
+    if previous_ips is None:
+        neighbours = {row[0]: tuple(row[2:]) for row in domain_rows}
+        changes = _count_ip_changes_in_history(connection, events, spans, neighbours)
+    else:
+        changes = _count_ip_changes(events, previous_ips)
+    _upsert_stats(connection, IPChangesHourly, "domain_id", changes, ("changes",))
+
+def _empty_stats() -> dict:
+    return {**{counter: 0 for counter in COUNTERS}, "last_event_at": None}
+
+def _neighbour_columns(spans: Dict[int, Tuple[datetime, datetime]]) -> list:
+    """
+    Columns for a select over Domain with each domain's latest IP before its span,
+    and the IP and timestamp of its first row after the span.
+    """
+    timestamp_type = IPHistory.timestamp.type
+    first = case(*((Domain.id == domain_id, literal(start, timestamp_type)) for domain_id, (start, _) in spans.items()))
+    last = case(*((Domain.id == domain_id, literal(end, timestamp_type)) for domain_id, (_, end) in spans.items()))
+    before = select(IPHistory.ip_address).where(
+        IPHistory.domain_id == Domain.id, IPHistory.timestamp < first
+    ).order_by(IPHistory.timestamp.desc(), IPHistory.id.desc()).limit(1)
+    after = select(IPHistory.ip_address, IPHistory.timestamp).where(
+        IPHistory.domain_id == Domain.id, IPHistory.timestamp > last
+    ).order_by(IPHistory.timestamp, IPHistory.id).limit(1)
+    return [
+        before.scalar_subquery(),
+        after.with_only_columns(IPHistory.ip_address).scalar_subquery(),
+        after.with_only_columns(IPHistory.timestamp).scalar_subquery()
+    ]
+
+def _count_ip_changes_in_history(connection: Connection, events: list, spans: Dict[int, tuple], neighbours: Dict[int, tuple]) -> Dict[tuple, dict]:
+    """
+    Counts the IP transitions the entries add to each domain's history, ordered by
+    timestamp rather than by arrival. The domain's rows across the entries' span,
+    with the row before and after it, are counted with and without the entries: an
+    entry arriving late adds its own transitions and removes the one it splits.
+    """
+    batch = defaultdict(list)
+    for entry, _, _, timestamp in events:
+        batch[entry["domain_id"]].append((timestamp, entry["ip_address"]))
+    # One condition per domain would nest too deep for SQLite on large batches, so
+    # rows are read over the batch's overall span and trimmed to each domain's here
+    start = min(spans[domain_id][0] for domain_id in batch)
+    end = max(spans[domain_id][1] for domain_id in batch)
+    domain_ids = list(batch)
+    existing = defaultdict(list)
+    for offset in range(0, len(domain_ids), SPAN_QUERY_CHUNK):
+        rows = connection.execute(
+            select(IPHistory.domain_id, IPHistory.timestamp, IPHistory.ip_address).where(
+                IPHistory.domain_id.in_(domain_ids[offset:offset + SPAN_QUERY_CHUNK]),
+                IPHistory.timestamp.between(start, end)
+            ).order_by(IPHistory.domain_id, IPHistory.timestamp, IPHistory.id)
+        )
+        for domain_id, timestamp, ip in rows:
+            timestamp = as_utc(timestamp)
+            first, last = spans[domain_id]
+            if first <= timestamp <= last:
+                existing[domain_id].append((timestamp, ip))
+
+    totals: Dict[tuple, int] = defaultdict(int)
+    for domain_id, added in batch.items():
+        # The entries are usually written already; leave them out of the old timeline
+        unmatched = Counter(added)
+        before = []
+        for row in existing[domain_id]:
+            if unmatched[row]:
+                unmatched[row] -= 1
+            else:
+                before.append(row)
+        after = sorted(before + added, key=lambda row: row[0])
+
+        previous_ip, next_ip, next_timestamp = neighbours.get(domain_id, (None, None, None))
+        head = [(None, previous_ip)] if previous_ip else []
+        tail = [(as_utc(next_timestamp), next_ip)] if next_ip else []
+        for sign, timeline in ((1, head + after + tail), (-1, head + before + tail)):
+            for (_, previous), (timestamp, ip) in zip(timeline, timeline[1:]):
+                if previous != ip:
+                    totals[(domain_id, bucket_start(timestamp))] += sign
+    return {key: {"changes": count} for key, count in totals.items() if count}
+
+def _count_ip_changes(events: list, previous_ips: Dict[int, str]) -> Dict[tuple, dict]:
+    """Counts IP transitions per domain and hour, walking each domain's entries in time order."""
+    ordered = sorted(events, key=lambda event: (event[0]["domain_id"], event[3]))
+    changes: Dict[tuple, dict] = {}
+    for entry, _, bucket, _ in ordered:
+        domain_id, ip = entry["domain_id"], entry["ip_address"]
+        previous = previous_ips.get(domain_id)
+        if previous and previous != ip:
+            changes.setdefault((domain_id, bucket), {"changes": 0})["changes"] += 1
+        previous_ips[domain_id] = ip
+    return changes
+
+def _register_seen_ips(connection: Connection, events: list):
+    """
+    Records (hour, domain, ip) tuples and returns the ones that are new per domain
+    and per provider, which is what the distinct IP counters need.
+    """
+    seen = IPSeenHourly.__table__
+    domain_keys = {(bucket, entry["domain_id"], entry["ip_address"]) for entry, _, bucket, _ in events}
+    provider_keys = {(bucket, provider_id, entry["ip_address"]) for entry, provider_id, bucket, _ in events}
+    provider_of = {entry["domain_id"]: provider_id for entry, provider_id, _, _ in events}
+
+    known_domain_keys = {
+        (bucket_start(bucket), domain_id, ip)
+        for bucket, domain_id, ip in connection.execute(
+            select(seen.c.bucket_start, seen.c.domain_id, seen.c.ip_address).where(
+                tuple_(seen.c.bucket_start, seen.c.domain_id, seen.c.ip_address).in_(list(domain_keys))
+            )
+        )
+    }
+    known_provider_keys = {
+        (bucket_start(bucket), provider_id, ip)
+        for bucket, provider_id, ip in connection.execute(
+            select(seen.c.bucket_start, seen.c.provider_id, seen.c.ip_address).where(
+                tuple_(seen.c.bucket_start, seen.c.provider_id, seen.c.ip_address).in_(list(provider_keys))
+            ).distinct()
+        )
+    }
+
+    new_domain_keys = domain_keys - known_domain_keys
+    if new_domain_keys:
+        connection.execute(seen.insert(), [
+            {"bucket_start": bucket, "domain_id": domain_id, "ip_address": ip, "provider_id": provider_of[domain_id]}
+            for bucket, domain_id, ip in new_domain_keys
+        ])
+    return new_domain_keys, provider_keys - known_provider_keys
+
+def _upsert_stats(connection: Connection, model, key_column: str, stats: Dict[tuple, dict], counters: tuple = COUNTERS):
+    if not stats:
+        return
+    table = model.__table__
+    stmt = upsert(connection, table)
+    set_ = {counter: table.c[counter] + stmt.excluded[counter] for counter in counters}
+    if "last_event_at" in table.c:
+        set_["last_event_at"] = greatest(
+            connection,
+            func.coalesce(table.c.last_event_at, stmt.excluded.last_event_at),
+            stmt.excluded.last_event_at
+        )
+    stmt = stmt.on_conflict_do_update(index_elements=[key_column, "bucket_start"], set_=set_)
+    connection.execute(stmt, [
+        {key_column: key, "bucket_start": bucket, **values}
+        for (key, bucket), values in stats.items()
+    ])
+
+@event.listens_for(Session, "after_flush")
+def _rollup_new_history(session: Session, flush_context):
+    """Keeps rollups in step with history rows added through the ORM."""
+    entries = [
+        {
+            "domain_id": obj.domain_id,
+            "ip_address": obj.ip_address,
+            "status": obj.status,
+            "timestamp": obj.timestamp,
+            "duration_ms": obj.duration_ms,
+        }
+        for obj in session.new
+        if isinstance(obj, IPHistory)
+    ]
+    if entries:
+        apply_history(session.connection(), entries)
+
+def rebuild_rollups(db: Session, batch_size: int = 5000) -> int:
+    """
+    Recomputes all rollups from ip_history, in batches of `batch_size` rows.
+    Runs in one transaction; returns the number of history rows processed.
+    """
+    for model in ROLLUP_MODELS:
+        db.execute(delete(model))
+
+    processed = 0
+    # Walks history per domain in time order, carrying each domain's last IP across batches
+    order = (IPHistory.domain_id, IPHistory.timestamp, IPHistory.id)
+    previous_ips: Dict[int, str] = {}
+    last_key = None
+    connection = db.connection()
+    while True:
+        query = select(
+            IPHistory.id, IPHistory.domain_id, IPHistory.ip_address,
+            IPHistory.status, IPHistory.timestamp, IPHistory.duration_ms
+        ).order_by(*order).limit(batch_size)
+        if last_key is not None:
+            query = query.where(tuple_(*order) > tuple_(*(
+                literal(value, column.type) for value, column in zip(last_key, order)
+            )))
+        batch = db.execute(query).all()
+        if not batch:
+            break
+        last_key = (batch[-1].domain_id, batch[-1].timestamp, batch[-1].id)
+        apply_history(connection, [row._asdict() for row in batch], previous_ips)
+        processed += len(batch)
+
+    db.commit()
+    logger.info(f"Rebuilt rollups from {processed} history records")
+    return processed
+
+def delete_domain_rollups(db: Session, domain_ids: List[int]):
+    """
+    Deletes the per-domain rollups of domains being deleted, in the caller's
+    transaction. Provider rollups are kept, like the provider's totals.
+    """
+    if not domain_ids:
+        return
+    for model in (DomainStatsHourly, IPSeenHourly, IPChangesHourly):
+        db.execute(delete(model).where(model.domain_id.in_(domain_ids)))
+
+def prune_rollups(db: Session, retention_days: Optional[int] = None) -> int:
+    """
+    Deletes rollup buckets older than the retention period. Returns deleted rows.
+    """
+    retention_days = retention_days or config.ROLLUP_RETENTION_DAYS
+    cutoff = window_start(retention_days * 24)
+    deleted = 0
+    for model in ROLLUP_MODELS:
+        deleted += db.execute(delete(model).where(model.bucket_start < cutoff)).rowcount or 0
+    db.commit()
+    return deleted
@@ -1,12 +1,23 @@
+import functools
 import logging
-from typing import Optional
+from typing import Dict, Iterable, Optional
+from datetime import datetime, timezone
+from apscheduler.events import EVENT_JOB_MISSED, EVENT_JOB_SUBMITTED
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.schedulers.base import STATE_RUNNING
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from croniter import croniter
 from sqlalchemy.orm import Session
+from app.core import config, security, telemetry
 from app.db.base import SessionLocal
 from app.models import Domain
 from app.services.ddns_service import DDNSService
+from app.services.history_retention import prune_history
+from app.services.history_sink import get_history_sink
+from app.services.jobs import UpdateJob, get_job_registry
+from app.services.key_rotation import get_key_rotation, run_key_rotation
+from app.services.rollups import prune_rollups
 
 logger = logging.getLogger(__name__)
 
@@ -14,10 +25,18 @@ class SchedulerService:
     """
     Manages automatic IP update scheduling for domains with cron expressions.
     Uses AsyncIOScheduler for compatibility with FastAPI's async runtime.
+
+    With SCHEDULER_ENABLED off, domain schedules and periodic maintenance are
+    left to the one instance that has it on; this one only runs its own
+    history flushes and the updates queued through it.
     """
     
     def __init__(self):
+        self.enabled = config.SCHEDULER_ENABLED
+        # Cron expression of each scheduled domain, to reconcile with the database
+        self._crons: Dict[int, str] = {}
         self.scheduler = AsyncIOScheduler()
+        self.scheduler.add_listener(self._observe_job_event, EVENT_JOB_SUBMITTED | EVENT_JOB_MISSED)
         self.scheduler.start()
         logger.info("AsyncIOScheduler started")
     
@@ -26,6 +45,9 @@ class SchedulerService:
         Load all domains with cron schedules and create jobs.
         Called on application startup.
         """
+        if not self.enabled:
+            logger.info("Scheduling is disabled on this instance (SCHEDULER_ENABLED=false)")
+            return
         db = SessionLocal()
         try:
             domains = db.query(Domain).filter(Domain.cron_schedule.isnot(None)).all()
@@ -36,6 +58,45 @@ class SchedulerService:
         finally:
             db.close()
     
+    def add_maintenance_jobs(self):
+        """
+        Register periodic housekeeping jobs (history flush, retention and schedule
+        sync), and re-encrypt credentials when old encryption keys are configured.
+        Only the history flush runs with SCHEDULER_ENABLED off, since every
+        instance buffers its own history.
+        Called on application startup.
+        """
+        self.scheduler.add_job(
+            func=self._flush_history,
+            trigger=IntervalTrigger(seconds=config.HISTORY_FLUSH_INTERVAL_SECONDS),
+            id="history_flush",
+            replace_existing=True,
+            coalesce=True,
+            max_instances=1
+        )
+        if not self.enabled:
+            return
+        if config.SCHEDULE_SYNC_INTERVAL_SECONDS > 0:
+            self.scheduler.add_job(
+                func=self.sync_schedules,
+                trigger=IntervalTrigger(seconds=config.SCHEDULE_SYNC_INTERVAL_SECONDS),
+                id="schedule_sync",
+                replace_existing=True,
+                coalesce=True,
+                max_instances=1
+            )
+        self.scheduler.add_job(
+            func=self._prune_history,
+            trigger=IntervalTrigger(minutes=config.HISTORY_RETENTION_INTERVAL_MINUTES),
+            id="history_retention",
+            replace_existing=True,
+            coalesce=True,
+            max_instances=1
+        )
+        logger.info(f"Added history retention job every {config.HISTORY_RETENTION_INTERVAL_MINUTES} minutes")
+        if security.ENCRYPTION_OLD_KEYS:
+            self.start_key_rotation()
+
     def add_schedule(self, domain_id: int, cron_expression: str):
         """
         Add or update a scheduled job for a domain.
@@ -52,14 +113,71 @@ class SchedulerService:
             logger.info(f"Removed old schedule for domain {domain_id}")
         
         # Add new job
+        return self._add_domain_job(domain_id, cron_expression)
+
+    def add_schedules(self, schedules: Dict[int, str]) -> Dict[int, bool]:
+        """
+        Add or update scheduled jobs for many domains, mapped to their cron expressions.
+        Job processing is paused meanwhile, so the scheduler recomputes its next
+        wakeup once rather than after every job.
+        """
+        results = {}
+        # Domains usually share a handful of expressions; triggers are immutable
+        triggers = {}
+        pause = self.scheduler.state == STATE_RUNNING
+        if pause:
+            self.scheduler.pause()
+        try:
+            for domain_id, cron_expression in schedules.items():
+                if not self._validate_cron(cron_expression):
+                    logger.error(f"Invalid cron expression for domain {domain_id}: {cron_expression}")
+                    results[domain_id] = False
+                    continue
+                if cron_expression not in triggers:
+                    try:
+                        triggers[cron_expression] = CronTrigger.from_crontab(cron_expression)
+                    except ValueError as e:
+                        logger.error(f"Failed to add schedule for domain {domain_id}: {e}")
+                        results[domain_id] = False
+                        continue
+                results[domain_id] = self._add_domain_job(domain_id, cron_expression, triggers[cron_expression])
+        finally:
+            if pause:
+                self.scheduler.resume()
+        return results
+
+    def sync_schedules(self):
+        """
+        Reconcile domain jobs with the cron schedules stored in the database, so
+        schedules changed through other instances or scripts are picked up.
+        """
+        db = SessionLocal()
+        try:
+            rows = db.query(Domain.id, Domain.cron_schedule).filter(Domain.cron_schedule.isnot(None)).all()
+        finally:
+            db.close()
+        # Cleared ("") and invalid schedules count as removed
+        stored = {domain_id: cron for domain_id, cron in rows if is_valid_cron(cron)}
+        changed = {domain_id: cron for domain_id, cron in stored.items() if self._crons.get(domain_id) != cron}
+        removed = [domain_id for domain_id in list(self._crons) if domain_id not in stored]
+        if changed:
+            self.add_schedules(changed)
+        if removed:
+            self.remove_schedules(removed)
+
+    def _add_domain_job(self, domain_id: int, cron_expression: str, trigger: Optional[CronTrigger] = None) -> bool:
+        if not self.enabled:
+            # The scheduling instance picks it up from the database
+            return True
         try:
             self.scheduler.add_job(
                 func=self._check_and_update_domain,
-                trigger=CronTrigger.from_crontab(cron_expression),
-                id=job_id,
+                trigger=trigger or CronTrigger.from_crontab(cron_expression),
+                id=f"domain_{domain_id}",
                 args=[domain_id],
                 replace_existing=True
             )
+            self._crons[domain_id] = cron_expression
             logger.info(f"Added schedule for domain {domain_id}: {cron_expression}")
             return True
         except Exception as e:
@@ -71,12 +189,75 @@ class SchedulerService:
         Remove a scheduled job for a domain.
         """
         job_id = f"domain_{domain_id}"
+        self._crons.pop(domain_id, None)
         if self.scheduler.get_job(job_id):
             self.scheduler.remove_job(job_id)
             logger.info(f"Removed schedule for domain {domain_id}")
             return True
         return False
+
+    def remove_schedules(self, domain_ids: Iterable[int]) -> int:
+        """
+        Remove the scheduled jobs of many domains. Returns how many were removed.
+        """
+        removed = 0
+        for domain_id in domain_ids:
+            job_id = f"domain_{domain_id}"
+            self._crons.pop(domain_id, None)
+            if self.scheduler.get_job(job_id):
+                self.scheduler.remove_job(job_id)
+                removed += 1
+        if removed:
+            logger.info(f"Removed {removed} domain schedules")
+        return removed
     
+    def enqueue_update(self, job: UpdateJob):
+        """
+        Run an update job as soon as possible, on the same executor as scheduled updates.
+        """
+        self.scheduler.add_job(
+            func=self._run_update_job,
+            id=f"update_{job.id}",
+            args=[job],
+            misfire_grace_time=None
+        )
+
+    def start_key_rotation(self) -> bool:
+        """
+        Re-encrypt provider credentials with ENCRYPTION_KEY in the background.
+        Returns False if a rotation is already running.
+        """
+        rotation = get_key_rotation()
+        if not rotation.begin():
+            return False
+        self.scheduler.add_job(
+            func=run_key_rotation,
+            id="key_rotation",
+            args=[rotation],
+            replace_existing=True,
+            misfire_grace_time=None
+        )
+        logger.info(f"Started re-encrypting credentials ({len(security.ENCRYPTION_OLD_KEYS)} old keys)")
+        return True
+
+    async def _run_update_job(self, job: UpdateJob):
+        """
+        Background task running an update requested through the API.
+        """
+        registry = get_job_registry()
+        registry.start(job)
+        db = SessionLocal()
+        try:
+            service = DDNSService(db)
+            if await service.update_domain_ip(job.domain_id):
+                registry.finish(job, True, "IP updated successfully")
+            else:
+                registry.finish(job, False, "Update failed")
+        except Exception as e:
+            registry.finish(job, False, str(e))
+        finally:
+            db.close()
+
     async def _check_and_update_domain(self, domain_id: int):
         """
         Background task to check and update IP for a domain.
@@ -96,7 +277,8 @@ class SchedulerService:
                 return
             
             # Get current IP
-            service = DDNSService(db)
+            sink = get_history_sink()
+            service = DDNSService(db, sink=sink)
             from app.core.ip_fetcher import IPFetcher
             fetcher = IPFetcher()
             
@@ -106,13 +288,14 @@ class SchedulerService:
                 logger.error(f"Failed to fetch IP for domain {domain.domain_name}: {e}")
                 return
             
-            # Compare with last known IP
-            if current_ip == domain.last_known_ip:
+            # Compare with last known IP (including a change not yet flushed)
+            last_known_ip = sink.pending_ip(domain_id) or domain.last_known_ip
+            if current_ip == last_known_ip:
                 logger.info(f"No IP change detected for {domain.domain_name} (still {current_ip})")
                 return
             
             # IP changed, trigger update
-            logger.info(f"IP changed for {domain.domain_name}: {domain.last_known_ip} -> {current_ip}")
+            logger.info(f"IP changed for {domain.domain_name}: {last_known_ip} -> {current_ip}")
             try:
                 await service.update_domain_ip(domain_id)
                 logger.info(f"Successfully updated {domain.domain_name} to {current_ip}")
@@ -122,15 +305,42 @@ class SchedulerService:
         finally:
             db.close()
     
+    def _flush_history(self):
+        """
+        Background task writing buffered history entries.
+        """
+        get_history_sink().flush()
+
+    def _prune_history(self):
+        """
+        Background task applying the history and rollup retention policies.
+        """
+        db = SessionLocal()
+        try:
+            prune_history(db)
+            prune_rollups(db)
+        except Exception as e:
+            logger.error(f"History retention failed: {e}")
+        finally:
+            db.close()
+
+    def _observe_job_event(self, event):
+        """
+        Records how late jobs start, and runs that were missed altogether.
+        """
+        job = telemetry.job_label(event.job_id)
+        if event.code == EVENT_JOB_MISSED:
+            telemetry.SCHEDULER_MISSED.labels(job).inc()
+            return
+        now = datetime.now(timezone.utc)
+        for run_time in event.scheduled_run_times:
+            telemetry.SCHEDULER_LAG_SECONDS.labels(job).observe(max((now - run_time).total_seconds(), 0))
+
     def _validate_cron(self, cron_expression: str) -> bool:
         """
         Validate a cron expression.
         """
-        try:
-            croniter(cron_expression)
-            return True
-        except Exception:
-            return False
+        return is_valid_cron(cron_expression)
     
     def shutdown(self):
         """
@@ -139,6 +349,17 @@ class SchedulerService:
         self.scheduler.shutdown()
         logger.info("AsyncIOScheduler shutdown")
 
+@functools.lru_cache(maxsize=256)
+def is_valid_cron(cron_expression: str) -> bool:
+    """
+    Check whether a cron expression can be scheduled.
+    """
+    try:
+        croniter(cron_expression)
+        return True
+    except Exception:
+        return False
+
 # Global scheduler instance
 scheduler_service: Optional[SchedulerService] = None
 
@@ -0,0 +1,22 @@
+"""
+Rebuild the hourly metrics rollups from the IP history table.
+Run from backend/scripts/ directory after upgrading, or to repair drift.
+"""
+import sys
+import os
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db.base import SessionLocal, init_db
+from app.services.rollups import rebuild_rollups
+
+if __name__ == "__main__":
+    init_db()
+    print("Rebuilding metrics rollups...")
+    db = SessionLocal()
+    try:
+        processed = rebuild_rollups(db)
+    finally:
+        db.close()
+    print(f"Rollups rebuilt from {processed} history records.")
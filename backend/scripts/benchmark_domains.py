@@ -0,0 +1,88 @@
+"""
+Benchmark creating domains one request at a time against the bulk endpoint.
+Run from backend/scripts/ directory: `python benchmark_domains.py [--domains N]`.
+Both run through the API against a fresh in-memory SQLite database, with a live scheduler.
+"""
+import argparse
+import asyncio
+import sys
+import os
+import time
+from datetime import datetime, timezone
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db.base import Base
+from app.main import app
+from app.models import Provider
+from app.api.v1.endpoints.auth import get_current_user, get_db
+from app.schemas.auth import User as Principal
+from app.services import scheduler as scheduler_module
+
+HEADERS = {"Authorization": "Bearer benchmark"}
+# Requests are made as this user, without logging in
+PRINCIPAL = Principal(id=1, username="benchmark", role="admin", created_at=datetime.now(timezone.utc))
+
+def fresh_database():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    provider = Provider(name="Benchmark", type="cloudflare", credentials_encrypted="x", is_enabled=True)
+    db.add(provider)
+    db.commit()
+    return engine, db, provider.id
+
+def payload(provider_id: int, count: int, cron: str) -> list:
+    return [
+        {"provider_id": provider_id, "domain_name": f"d{i}.example.com", "config": {}, "cron_schedule": cron}
+        for i in range(count)
+    ]
+
+async def one_by_one(client, items):
+    for item in items:
+        response = await client.post("/api/v1/domains", json=item, headers=HEADERS)
+        response.raise_for_status()
+
+async def bulk(client, items):
+    response = await client.post("/api/v1/domains/bulk", json=items, headers=HEADERS)
+    response.raise_for_status()
+
+async def measure(create, count: int, cron: str) -> float:
+    """Seconds taken by `create` for `count` domains on a fresh database and scheduler."""
+    engine, db, provider_id = fresh_database()
+    app.dependency_overrides[get_db] = lambda: db
+    app.dependency_overrides[get_current_user] = lambda: PRINCIPAL
+    # The scheduler has to be created on the running event loop
+    scheduler_module.scheduler_service = scheduler_module.SchedulerService()
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            started = time.perf_counter()
+            await create(client, payload(provider_id, count, cron))
+            elapsed = time.perf_counter() - started
+        assert len(scheduler_module.scheduler_service.scheduler.get_jobs()) == (count if cron else 0)
+        return elapsed
+    finally:
+        scheduler_module.scheduler_service.shutdown()
+        scheduler_module.scheduler_service = None
+        app.dependency_overrides.clear()
+        db.close()
+        engine.dispose()
+
+async def main(args):
+    cron = "" if args.no_schedule else "*/5 * * * *"
+    for name, create in (("one by one", one_by_one), ("bulk", bulk)):
+        elapsed = await measure(create, args.domains, cron)
+        print(f"{name:<12} {args.domains:>6} domains {elapsed * 1000:10.1f} ms  {args.domains / elapsed:10.0f} domains/s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--domains", type=int, default=2000)
+    parser.add_argument("--no-schedule", action="store_true", help="create domains without cron schedules")
+    asyncio.run(main(parser.parse_args()))
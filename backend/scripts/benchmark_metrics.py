@@ -0,0 +1,102 @@
+"""
+Benchmark the metrics queries against a seeded in-memory SQLite database.
+Run from backend/scripts/ directory: `python benchmark_metrics.py [name ...]`.
+Exits with status 1 when a query is slower than its budget, so it can guard regressions.
+"""
+import argparse
+import sys
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db.base import Base
+from app.models import Provider, Domain, IPHistory
+from app.api.v1.endpoints import metrics
+from app.services.rollups import rebuild_rollups
+
+# name: (endpoint, providers, domains, budget in ms)
+# Budgets cover the whole endpoint including building the response;
+# listing 5,000 domains alone takes about 10 ms.
+BENCHMARKS = {
+    "ip-changes": (metrics.get_ip_change_frequency, 200, 5000, 40),
+    "provider-stats": (metrics.get_provider_success_rates, 200, 10000, 25),
+}
+
+def seed(db, providers: int, domains: int, history: int, change_every: int):
+    """
+    Creates providers, domains spread across them and `history` rows per domain over
+    the last week, with a new IP every `change_every` updates.
+    """
+    db.execute(insert(Provider), [
+        {"id": i + 1, "name": f"Provider {i}", "type": "cloudflare", "credentials_encrypted": "x", "is_enabled": i % 10 != 0}
+        for i in range(providers)
+    ])
+    db.execute(insert(Domain), [
+        {"id": i + 1, "provider_id": i % providers + 1, "domain_name": f"d{i}.example.com", "config": {}}
+        for i in range(domains)
+    ])
+    now = datetime.now(timezone.utc)
+    step = timedelta(days=7) / history
+    rows = [
+        {
+            "domain_id": domain_id,
+            "ip_address": f"10.0.{domain_id % 250}.{n // change_every % 250}",
+            "status": "FAILED" if n % 17 == 0 else "SUCCESS",
+            "timestamp": now - step * n,
+            "duration_ms": 100.0 + n % 50,
+        }
+        for domain_id in range(1, domains + 1)
+        for n in range(history)
+    ]
+    for start in range(0, len(rows), 10000):
+        db.execute(insert(IPHistory), rows[start:start + 10000])
+    db.commit()
+    rebuild_rollups(db)
+
+def run(name: str, endpoint, db, repeat: int) -> float:
+    """Returns the best of `repeat` runs in milliseconds, bypassing the response cache."""
+    endpoint = getattr(endpoint, "__wrapped__", endpoint)
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        endpoint(db=db, token="benchmark")
+        best = min(best, (time.perf_counter() - started) * 1000)
+    return best
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("names", nargs="*", metavar="name", help=f"benchmarks to run: {', '.join(BENCHMARKS)} (default: all)")
+    parser.add_argument("--history", type=int, default=20, help="history rows per domain")
+    parser.add_argument("--change-every", type=int, default=10, help="updates per IP change")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply the budgets, e.g. on slow machines")
+    args = parser.parse_args()
+    unknown = set(args.names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmark: {', '.join(sorted(unknown))}")
+
+    slow = []
+    for name in args.names or BENCHMARKS:
+        endpoint, providers, domains, budget_ms = BENCHMARKS[name]
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine)()
+        seed(db, providers, domains, args.history, args.change_every)
+
+        elapsed = run(name, endpoint, db, args.repeat)
+        budget = budget_ms * args.scale
+        status = "ok" if elapsed <= budget else "SLOW"
+        print(f"{name:<16} {providers:>5} providers {domains:>6} domains {elapsed:8.2f} ms  (budget {budget:.0f} ms)  {status}")
+        if elapsed > budget:
+            slow.append(name)
+        db.close()
+        engine.dispose()
+
+    sys.exit(1 if slow else 0)
@@ -0,0 +1,91 @@
+"""
+Benchmark rendering and compressing large API responses.
+Run from backend/scripts/ directory: `python benchmark_serialization.py [--domains N]`.
+Requests go through the API against a seeded in-memory SQLite database, with
+each response encoding.
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import os
+import time
+from datetime import datetime, timezone
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db.base import Base
+from app.main import app
+from app.models import Provider, Domain, IPHistory
+from app.api.v1.endpoints.auth import get_current_user, get_db
+from app.schemas.auth import User as Principal
+
+HEADERS = {"Authorization": "Bearer benchmark"}
+# Requests are made as this user, without logging in
+PRINCIPAL = Principal(id=1, username="benchmark", role="admin", created_at=datetime.now(timezone.utc))
+PATHS = ("/api/v1/domains?limit=1000", "/api/v1/metrics/ip-changes")
+ENCODINGS = ("identity", "gzip", "br")
+
+def seed(count: int):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    provider = Provider(name="Benchmark", type="cloudflare", credentials_encrypted="x", is_enabled=True)
+    db.add(provider)
+    db.commit()
+    db.execute(insert(Domain), [
+        {
+            "provider_id": provider.id,
+            "domain_name": f"host{i}.example.com",
+            "external_id": str(i),
+            "config": {"proxied": False, "ttl": 300},
+            "cron_schedule": "*/5 * * * *",
+            "last_known_ip": f"10.{i // 256 % 256}.{i % 256}.1"
+        }
+        for i in range(count)
+    ])
+    domain_ids = [domain_id for (domain_id,) in db.query(Domain.id)]
+    db.execute(insert(IPHistory), [
+        {"domain_id": domain_id, "ip_address": f"10.0.{n}.1", "status": "SUCCESS"}
+        for domain_id in domain_ids for n in range(2)
+    ])
+    db.commit()
+    return engine, db
+
+async def measure(client, path: str, encoding: str, runs: int):
+    """Median milliseconds and body size for `path` requested with `encoding`."""
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        response = await client.get(path, headers={**HEADERS, "Accept-Encoding": encoding})
+        timings.append(time.perf_counter() - started)
+        response.raise_for_status()
+    return statistics.median(timings) * 1000, response.num_bytes_downloaded
+
+async def main(args):
+    engine, db = seed(args.domains)
+    app.dependency_overrides[get_db] = lambda: db
+    app.dependency_overrides[get_current_user] = lambda: PRINCIPAL
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            for path in PATHS:
+                for encoding in ENCODINGS:
+                    elapsed, size = await measure(client, path, encoding, args.runs)
+                    print(f"{path:<36} {encoding:<9} {elapsed:8.1f} ms {size / 1024:10.1f} KiB")
+    finally:
+        app.dependency_overrides.clear()
+        db.close()
+        engine.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--domains", type=int, default=5000)
+    parser.add_argument("--runs", type=int, default=10)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,99 @@
+"""
+Benchmark exporting a configuration and importing it into an empty database.
+Run from backend/scripts/ directory: `python benchmark_transfer.py [--domains N]`.
+Both run through the API against in-memory SQLite databases, with a live scheduler.
+"""
+import argparse
+import asyncio
+import sys
+import os
+import time
+from datetime import datetime, timezone
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.core import security
+from app.db.base import Base
+from app.main import app
+from app.models import Provider, Domain
+from app.api.v1.endpoints.auth import get_current_user, get_db
+from app.schemas.auth import User as Principal
+from app.services import scheduler as scheduler_module
+
+HEADERS = {"Authorization": "Bearer benchmark", "X-Export-Key": "benchmark passphrase"}
+# Requests are made as this user, without logging in
+PRINCIPAL = Principal(id=1, username="benchmark", role="admin", created_at=datetime.now(timezone.utc))
+
+def database(domains: int = 0):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    if domains:
+        providers = [
+            Provider(name=f"Provider {i}", type="cloudflare", credentials_encrypted=security.encrypt_credentials({"token": str(i)}))
+            for i in range(10)
+        ]
+        db.add_all(providers)
+        db.flush()
+        db.execute(insert(Domain), [
+            {
+                "provider_id": providers[i % 10].id,
+                "domain_name": f"host{i}.example.com",
+                "external_id": str(i),
+                "config": {"proxied": False},
+                "cron_schedule": "*/5 * * * *" if i % 2 else None
+            }
+            for i in range(domains)
+        ])
+        db.commit()
+    return engine, db
+
+async def measure(db, request):
+    app.dependency_overrides[get_db] = lambda: db
+    app.dependency_overrides[get_current_user] = lambda: PRINCIPAL
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+            started = time.perf_counter()
+            response = await request(client)
+            elapsed = time.perf_counter() - started
+        response.raise_for_status()
+        return elapsed, response
+    finally:
+        app.dependency_overrides.clear()
+
+async def main(args):
+    source_engine, source = database(args.domains)
+    elapsed, response = await measure(source, lambda client: client.get("/api/v1/export", headers=HEADERS))
+    body = response.content
+    print(f"export {args.domains:>7} domains {elapsed * 1000:10.1f} ms  {len(body) / 1024 / 1024:8.1f} MiB")
+    source.close()
+    source_engine.dispose()
+
+    target_engine, target = database()
+    # The scheduler has to be created on the running event loop
+    scheduler_module.scheduler_service = scheduler_module.SchedulerService()
+    try:
+        elapsed, response = await measure(target, lambda client: client.post(
+            "/api/v1/import",
+            headers={**HEADERS, "Content-Type": "application/x-ndjson"},
+            content=body
+        ))
+        assert target.query(Domain).count() == args.domains
+        print(f"import {args.domains:>7} domains {elapsed * 1000:10.1f} ms  {response.json()['scheduled']:8} scheduled")
+    finally:
+        scheduler_module.scheduler_service.shutdown()
+        scheduler_module.scheduler_service = None
+        target.close()
+        target_engine.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--domains", type=int, default=50000)
+    asyncio.run(main(parser.parse_args()))
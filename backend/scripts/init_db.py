@@ -8,10 +8,9 @@ import os
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from app.db.base import Base, engine
-from app.models.all_models import *
+from app.db.base import init_db
 
 if __name__ == "__main__":
     print("Creating database tables...")
-    Base.metadata.create_all(bind=engine)
+    init_db()
     print("Database initialized successfully!")
@@ -2,6 +2,8 @@
 Pytest configuration and shared fixtures for backend tests.
 Provides test database, client, and authentication utilities.
 """
+import os
+import tempfile
 import pytest
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, Session
@@ -9,19 +11,32 @@ from fastapi.testclient import TestClient
 from sqlalchemy.pool import StaticPool
 from unittest.mock import Mock
 
-from app.db.base import Base
+# The app's own engine and history journal (used by its lifespan and by services
+# opening sessions themselves) must not touch files in the source tree
+_scratch_dir = tempfile.mkdtemp(prefix="ip_hop_tests_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_scratch_dir, 'ip_hop.db')}"
+os.environ["HISTORY_SPOOL_PATH"] = os.path.join(_scratch_dir, "history_spool.jsonl")
+
+from app.db import versions
+from app.db.base import Base, create_db_engine
 from app.main import app
+from app.api.v1.endpoints import auth
 from app.api.v1.endpoints.auth import get_db
 from app.services.scheduler import get_scheduler
 
-# Use in-memory SQLite for testing
-SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+# Use in-memory SQLite for testing, or the database in TEST_DATABASE_URL
+# (e.g. postgresql://postgres@localhost/ip_hop_test) to run against PostgreSQL.
+# Tables are dropped after every test, so never point it at real data.
+SQLALCHEMY_DATABASE_URL = os.getenv("TEST_DATABASE_URL", "sqlite:///:memory:")
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False},
-    poolclass=StaticPool
-)
+if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
+    engine = create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+else:
+    engine = create_db_engine(SQLALCHEMY_DATABASE_URL)
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
@@ -35,6 +50,14 @@ def db() -> Session:
     finally:
         db.close()
         Base.metadata.drop_all(bind=engine)
+        # Dropping tables is a change too; keeps cached responses from leaking between tests
+        versions.bump(*Base.metadata.tables)
+
+
+@pytest.fixture(scope="function")
+def session_factory(db: Session):
+    """Session factory bound to the test database, for services that open their own sessions."""
+    return TestingSessionLocal
 
 
 @pytest.fixture(scope="function")
@@ -62,6 +85,9 @@ def client(db: Session, mock_scheduler):
 
     app.dependency_overrides[get_db] = override_get_db
     app.dependency_overrides[get_scheduler] = override_get_scheduler
+    # Every test logs in from the same client
+    auth.login_attempts_by_ip.clear()
+    auth.login_attempts_by_username.clear()
     
     with TestClient(app) as c:
         yield c
@@ -90,6 +90,81 @@ class TestAuthLogin:
         )
         assert response.status_code == 401
 
+    def test_login_throttled_per_username(self, client: TestClient, admin_user: dict, monkeypatch):
+        """Test that repeated failures for a username are refused before checking the password."""
+        from app.api.v1.endpoints import auth
+
+        monkeypatch.setattr(auth.login_attempts_by_username, "limit", 2)
+        wrong = {"username": admin_user["username"], "password": "WrongPassword123!"}
+        for _ in range(2):
+            assert client.post("/api/v1/auth/token", data=wrong).status_code == 401
+
+        response = client.post("/api/v1/auth/token", data=admin_user)
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) > 0
+        # Usernames are throttled case-insensitively, other usernames are not
+        assert client.post("/api/v1/auth/token", data={**wrong, "username": "ADMIN"}).status_code == 429
+        assert client.post("/api/v1/auth/token", data={**wrong, "username": "other"}).status_code == 401
+
+    def test_login_successes_not_throttled(self, client: TestClient, admin_user: dict, monkeypatch):
+        """Test that successful logins don't use up the attempt limits."""
+        from app.api.v1.endpoints import auth
+
+        monkeypatch.setattr(auth.login_attempts_by_ip, "limit", 2)
+        monkeypatch.setattr(auth.login_attempts_by_username, "limit", 2)
+        for _ in range(4):
+            assert client.post("/api/v1/auth/token", data=admin_user).status_code == 200
+
+    def test_login_throttled_per_ip(self, client: TestClient, monkeypatch):
+        """Test that one client can't spread guesses over many usernames."""
+        from app.api.v1.endpoints import auth
+
+        monkeypatch.setattr(auth.login_attempts_by_ip, "limit", 3)
+        for i in range(3):
+            assert client.post("/api/v1/auth/token", data={"username": f"user{i}", "password": "x"}).status_code == 401
+        assert client.post("/api/v1/auth/token", data={"username": "user9", "password": "x"}).status_code == 429
+
+    def test_login_throttled_per_forwarded_ip(self, client: TestClient, monkeypatch):
+        """Test that clients behind a trusted proxy are throttled by their forwarded address."""
+        from app.main import app
+        from app.api.v1.endpoints import auth
+
+        monkeypatch.setattr(auth.login_attempts_by_ip, "limit", 2)
+        proxied = TestClient(app, client=("127.0.0.1", 50000))
+        first = {"X-Forwarded-For": "203.0.113.5"}
+        for i in range(2):
+            assert proxied.post("/api/v1/auth/token", data={"username": f"user{i}", "password": "x"}, headers=first).status_code == 401
+        assert proxied.post("/api/v1/auth/token", data={"username": "user9", "password": "x"}, headers=first).status_code == 429
+        # Another client behind the same proxy has its own bucket, even if it
+        # prepends a spoofed address to the chain
+        second = {"X-Forwarded-For": "203.0.113.5, 198.51.100.7"}
+        assert proxied.post("/api/v1/auth/token", data={"username": "user9", "password": "x"}, headers=second).status_code == 401
+
+    def test_login_ignores_forwarded_ip_from_untrusted_peer(self, client: TestClient, monkeypatch):
+        """Test that clients can't pick their own bucket by sending the header directly."""
+        from app.api.v1.endpoints import auth
+
+        monkeypatch.setattr(auth.login_attempts_by_ip, "limit", 2)
+        for i in range(2):
+            headers = {"X-Forwarded-For": f"203.0.113.{i}"}
+            assert client.post("/api/v1/auth/token", data={"username": f"user{i}", "password": "x"}, headers=headers).status_code == 401
+        headers = {"X-Forwarded-For": "203.0.113.9"}
+        assert client.post("/api/v1/auth/token", data={"username": "user9", "password": "x"}, headers=headers).status_code == 429
+
+    def test_login_password_pool_full(self, client: TestClient, admin_user: dict, monkeypatch):
+        """Test that logins are refused with 503 rather than queued when hashing is saturated."""
+        import threading
+        from app.core import security
+
+        monkeypatch.setattr(security, "_password_slots", threading.BoundedSemaphore(1))
+        security._password_slots.acquire()
+        response = client.post("/api/v1/auth/token", data=admin_user)
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+
+        security._password_slots.release()
+        assert client.post("/api/v1/auth/token", data=admin_user).status_code == 200
+
     def test_login_missing_credentials(self, client: TestClient):
         """Test login with missing credentials."""
         response = client.post("/api/v1/auth/token", data={})
@@ -120,6 +195,38 @@ class TestAuthMe:
         # Either 401 or 403 acceptable for invalid token
         assert response.status_code in [401, 403]
 
+    def test_auth_me_cached(self, client: TestClient, auth_headers: dict, db):
+        """Test that a verified token is not looked up again."""
+        from sqlalchemy import event
+
+        assert client.get("/api/v1/auth/me", headers=auth_headers).status_code == 200
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.get_bind(), "before_cursor_execute", listener)
+        try:
+            assert client.get("/api/v1/auth/me", headers=auth_headers).status_code == 200
+            assert client.get("/api/v1/jobs", headers=auth_headers).status_code == 200
+        finally:
+            event.remove(db.get_bind(), "before_cursor_execute", listener)
+        assert not any("FROM users" in statement for statement in statements)
+
+    def test_user_changes_invalidate_cache(self, client: TestClient, auth_headers: dict, db):
+        """Test that deleting a user rejects its cached tokens."""
+        from app.models import User
+
+        assert client.get("/api/v1/auth/me", headers=auth_headers).status_code == 200
+        db.query(User).delete()
+        db.commit()
+        client.cookies.clear()
+        assert client.get("/api/v1/auth/me", headers=auth_headers).status_code == 401
+
+    def test_endpoints_reject_invalid_token(self, client: TestClient, auth_headers: dict):
+        """Test that resource endpoints verify the token rather than only requiring one."""
+        client.cookies.clear()
+        assert client.get("/api/v1/domains", headers=auth_headers).status_code == 200
+        response = client.get("/api/v1/domains", headers={"Authorization": "Bearer invalid_token"})
+        assert response.status_code == 401
+
 
 class TestAuthLogout:
     """Test logout functionality."""
@@ -135,3 +242,11 @@ class TestAuthLogout:
         response = client.post("/api/v1/auth/logout")
         # May return 401 or 200 depending on implementation
         assert response.status_code in [200, 401]
+
+    def test_logout_revokes_token(self, client: TestClient, auth_headers: dict):
+        """Test that a token stops working after logout, even if a copy is kept."""
+        assert client.get("/api/v1/auth/me", headers=auth_headers).status_code == 200
+        assert client.post("/api/v1/auth/logout", headers=auth_headers).status_code == 200
+        client.cookies.clear()
+        assert client.get("/api/v1/auth/me", headers=auth_headers).status_code == 401
+        assert client.get("/api/v1/domains", headers=auth_headers).status_code == 401
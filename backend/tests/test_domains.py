@@ -4,6 +4,7 @@ Tests CRUD operations, history, and manual IP updates.
 """
 import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy import text
 
 
 @pytest.fixture
@@ -141,6 +142,160 @@ class TestDomainRead:
         assert response.status_code == 200
         assert len(response.json()) == 2
 
+    def test_get_domains_with_cursor(self, client: TestClient, auth_headers: dict, test_provider: int):
+        """Test walking the domain list with next-page cursors."""
+        for i in range(5):
+            client.post(
+                "/api/v1/domains",
+                headers=auth_headers,
+                json={"provider_id": test_provider, "domain_name": f"c{i}.com", "external_id": str(i), "config": {}}
+            )
+
+        names = []
+        response = client.get("/api/v1/domains?limit=2", headers=auth_headers)
+        while True:
+            names += [d["domain_name"] for d in response.json()]
+            if "X-Next-Cursor" not in response.headers:
+                break
+            assert 'rel="next"' in response.headers["Link"]
+            response = client.get(f"/api/v1/domains?limit=2&cursor={response.headers['X-Next-Cursor']}", headers=auth_headers)
+
+        assert names == [f"c{i}.com" for i in range(5)]
+        assert "Link" not in response.headers
+
+    def test_get_domains_conditional(self, client: TestClient, auth_headers: dict, test_provider: int, db):
+        """Test that an unchanged list is answered with 304 without reading the domains."""
+        from sqlalchemy import event
+
+        client.post(
+            "/api/v1/domains",
+            headers=auth_headers,
+            json={"provider_id": test_provider, "domain_name": "etag.com", "external_id": "1", "config": {}}
+        )
+        first = client.get("/api/v1/domains", headers=auth_headers)
+        etag = first.headers["ETag"]
+        assert etag.startswith('W/"')
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.get_bind(), "before_cursor_execute", listener)
+        try:
+            cached = client.get("/api/v1/domains", headers={**auth_headers, "If-None-Match": etag})
+        finally:
+            event.remove(db.get_bind(), "before_cursor_execute", listener)
+        assert cached.status_code == 304
+        assert cached.content == b""
+        assert cached.headers["ETag"] == etag
+        # Only the row count marker is read
+        assert [statement for statement in statements if "FROM domains" in statement] == [
+            next(statement for statement in statements if "count(domains.id)" in statement)
+        ]
+
+        # Other parameters and later changes get a different ETag
+        assert client.get("/api/v1/domains?limit=5", headers=auth_headers).headers["ETag"] != etag
+        client.post(
+            "/api/v1/domains",
+            headers=auth_headers,
+            json={"provider_id": test_provider, "domain_name": "etag2.com", "external_id": "2", "config": {}}
+        )
+        changed = client.get("/api/v1/domains", headers={**auth_headers, "If-None-Match": etag})
+        assert changed.status_code == 200
+        assert len(changed.json()) == 2
+
+    def test_conditional_get_sees_other_writers(self, client: TestClient, auth_headers: dict, test_provider: int, db):
+        """Test that rows written outside this process's sessions change the ETag."""
+        from sqlalchemy import insert
+        from app.models import Domain
+
+        etag = client.get("/api/v1/domains", headers=auth_headers).headers["ETag"]
+        # A plain connection, as another replica or a script would write
+        with db.get_bind().connect() as connection:
+            connection.execute(insert(Domain.__table__).values(provider_id=test_provider, domain_name="elsewhere.com", config={}))
+            connection.commit()
+
+        response = client.get("/api/v1/domains", headers={**auth_headers, "If-None-Match": etag})
+        assert response.status_code == 200
+        assert [domain["domain_name"] for domain in response.json()] == ["elsewhere.com"]
+
+    def test_conditional_get_requires_authentication(self, client: TestClient, auth_headers: dict):
+        """Test that a matching ETag does not bypass authentication."""
+        etag = client.get("/api/v1/domains", headers=auth_headers).headers["ETag"]
+        client.cookies.clear()
+        assert client.get("/api/v1/domains", headers={"If-None-Match": etag}).status_code == 401
+
+    def test_get_domains_filtered(self, client: TestClient, auth_headers: dict, test_provider: int, db):
+        """Test filtering the list by name, prefix, schedule, status and provider."""
+        from app.models import Domain
+
+        for name, cron in (("Home.example.com", "*/5 * * * *"), ("home-lab.net", None), ("office.home.org", ""), ("h_me.io", None)):
+            client.post(
+                "/api/v1/domains",
+                headers=auth_headers,
+                json={"provider_id": test_provider, "domain_name": name, "config": {}, "cron_schedule": cron}
+            )
+        db.query(Domain).filter(Domain.domain_name == "home-lab.net").update({"last_update_status": "FAILED"})
+        db.commit()
+
+        def names(query: str) -> list:
+            response = client.get(f"/api/v1/domains?{query}", headers=auth_headers)
+            assert response.status_code == 200
+            return sorted(d["domain_name"] for d in response.json())
+
+        assert names("name=HOME") == ["Home.example.com", "home-lab.net", "office.home.org"]
+        assert names("prefix=home") == ["Home.example.com", "home-lab.net"]
+        assert names("prefix=HOME-") == ["home-lab.net"]
+        # LIKE wildcards in the search are matched literally
+        assert names("prefix=h_") == ["h_me.io"]
+        assert names("name=_") == ["h_me.io"]
+        assert names("scheduled=true") == ["Home.example.com"]
+        assert names("scheduled=false&prefix=home") == ["home-lab.net"]
+        assert names("status=failed") == ["home-lab.net"]
+        assert names(f"provider_id={test_provider}&name=example") == ["Home.example.com"]
+        assert names(f"provider_id={test_provider + 1}") == []
+
+    def test_get_domains_filtered_with_cursor(self, client: TestClient, auth_headers: dict, test_provider: int):
+        """Test that filters carry over to the next-page cursor link."""
+        for i in range(5):
+            for prefix in ("keep", "skip"):
+                client.post(
+                    "/api/v1/domains",
+                    headers=auth_headers,
+                    json={"provider_id": test_provider, "domain_name": f"{prefix}{i}.com", "config": {}}
+                )
+
+        names = []
+        response = client.get("/api/v1/domains?prefix=keep&limit=2", headers=auth_headers)
+        while True:
+            names += [d["domain_name"] for d in response.json()]
+            if "Link" not in response.headers:
+                break
+            next_url = response.headers["Link"].split(";")[0].strip("<>")
+            response = client.get(next_url, headers=auth_headers)
+
+        assert names == [f"keep{i}.com" for i in range(5)]
+
+    def test_prefix_search_uses_index(self, db):
+        """Test that prefix search can be answered from the lower(domain_name) index."""
+        from sqlalchemy import select
+        from app.db.dialects import starts_with
+        from app.models import Domain
+
+        statement = select(Domain.id).where(starts_with(db.get_bind(), Domain.domain_name, "Home"))
+        compiled = statement.compile(db.get_bind(), compile_kwargs={"literal_binds": True})
+        if db.get_bind().dialect.name == "sqlite":
+            plan = db.execute(text(f"EXPLAIN QUERY PLAN {compiled}")).all()
+        else:
+            # The test tables are too small for the planner to prefer an index by itself
+            db.execute(text("SET LOCAL enable_seqscan = off"))
+            plan = db.execute(text(f"EXPLAIN {compiled}")).all()
+            db.rollback()
+        assert "ix_domains_domain_name_lower" in " ".join(str(row) for row in plan)
+
+    def test_get_domains_invalid_cursor(self, client: TestClient, auth_headers: dict):
+        """Test that malformed cursors are rejected."""
+        response = client.get("/api/v1/domains?cursor=not-a-cursor", headers=auth_headers)
+        assert response.status_code == 400
+
     def test_get_domains_unauthenticated(self, client: TestClient):
         """Test getting domains without authentication."""
         response = client.get("/api/v1/domains")
@@ -197,21 +352,27 @@ class TestDomainUpdate:
 class TestDomainDelete:
     """Test domain deletion."""
 
-    def test_delete_domain_success(self, client: TestClient, auth_headers: dict, test_provider: int):
+    def test_delete_domain_success(self, client: TestClient, auth_headers: dict, test_provider: int, db):
         """Test successful domain deletion."""
+        from app.models import IPHistory, DomainStatsHourly, IPSeenHourly
+
         create_resp = client.post(
             "/api/v1/domains",
             headers=auth_headers,
             json={"provider_id": test_provider, "domain_name": "delete.com", "external_id": "1", "config": {}}
         )
         domain_id = create_resp.json()["id"]
+        db.add(IPHistory(domain_id=domain_id, ip_address="1.2.3.4", status="SUCCESS"))
+        db.commit()
 
         response = client.delete(f"/api/v1/domains/{domain_id}", headers=auth_headers)
         assert response.status_code == 200
 
-        # Verify deletion
+        # Verify deletion, including the domain's metrics rollups
         get_resp = client.get("/api/v1/domains", headers=auth_headers)
         assert len(get_resp.json()) == 0
+        assert db.query(DomainStatsHourly).count() == 0
+        assert db.query(IPSeenHourly).count() == 0
 
     def test_delete_nonexistent_domain(self, client: TestClient, auth_headers: dict):
         """Test deleting non-existent domain."""
@@ -219,6 +380,142 @@ class TestDomainDelete:
         assert response.status_code == 404
 
 
+class TestDomainBulk:
+    """Test bulk domain create, update and delete."""
+
+    @pytest.fixture
+    def scheduler(self, monkeypatch, mock_scheduler):
+        monkeypatch.setattr("app.api.v1.endpoints.domains.get_scheduler", lambda: mock_scheduler)
+        return mock_scheduler
+
+    def _domains(self, provider_id: int, count: int, **extra) -> list:
+        return [
+            {"provider_id": provider_id, "domain_name": f"bulk{i}.example.com", "config": {}, **extra}
+            for i in range(count)
+        ]
+
+    def test_bulk_create(self, client: TestClient, auth_headers: dict, test_provider: int, scheduler):
+        """Test creating domains from a JSON array with one scheduler call."""
+        response = client.post(
+            "/api/v1/domains/bulk",
+            headers=auth_headers,
+            json=self._domains(test_provider, 3, cron_schedule="*/5 * * * *")
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["created"] == 3
+        ids = [result["id"] for result in data["results"]]
+        assert [result["index"] for result in data["results"]] == [0, 1, 2]
+
+        listed = client.get("/api/v1/domains", headers=auth_headers).json()
+        assert [domain["id"] for domain in listed] == ids
+        scheduler.add_schedules.assert_called_once_with({domain_id: "*/5 * * * *" for domain_id in ids})
+        scheduler.add_schedule.assert_not_called()
+
+    def test_bulk_create_ndjson(self, client: TestClient, auth_headers: dict, test_provider: int, scheduler):
+        """Test creating domains streamed as NDJSON."""
+        import json
+
+        body = "\n".join(json.dumps(item) for item in self._domains(test_provider, 4)) + "\n"
+        response = client.post(
+            "/api/v1/domains/bulk",
+            headers={**auth_headers, "Content-Type": "application/x-ndjson"},
+            content=body
+        )
+        assert response.status_code == 200
+        assert response.json()["created"] == 4
+        scheduler.add_schedules.assert_not_called()
+
+        response = client.post(
+            "/api/v1/domains/bulk",
+            headers={**auth_headers, "Content-Type": "application/x-ndjson"},
+            content='{"domain_name": "a"}\n{not json\n'
+        )
+        assert response.status_code == 400
+        assert "line 2" in response.json()["detail"]
+
+    def test_bulk_create_is_all_or_nothing(self, client: TestClient, auth_headers: dict, test_provider: int, scheduler):
+        """Test that one invalid item rejects the whole request with per-item errors."""
+        items = self._domains(test_provider, 4)
+        items[1]["provider_id"] = 99999
+        items[2]["cron_schedule"] = "not a cron"
+        del items[3]["domain_name"]
+
+        response = client.post("/api/v1/domains/bulk", headers=auth_headers, json=items)
+        assert response.status_code == 422
+        errors = response.json()["detail"]["errors"]
+        assert [error["index"] for error in errors] == [1, 2, 3]
+        assert errors[0]["error"] == "Provider not found"
+        assert "domain_name" in errors[2]["error"]
+        assert client.get("/api/v1/domains", headers=auth_headers).json() == []
+
+    def test_bulk_create_limits(self, client: TestClient, auth_headers: dict, test_provider: int, monkeypatch):
+        """Test rejection of non-array bodies and oversized requests."""
+        monkeypatch.setattr("app.core.config.DOMAINS_BULK_MAX_ITEMS", 2)
+        assert client.post("/api/v1/domains/bulk", headers=auth_headers, json={"domain_name": "x"}).status_code == 400
+        response = client.post("/api/v1/domains/bulk", headers=auth_headers, json=self._domains(test_provider, 3))
+        assert response.status_code == 413
+
+    def test_bulk_update(self, client: TestClient, auth_headers: dict, test_provider: int, scheduler):
+        """Test updating several domains and their schedules at once."""
+        created = client.post("/api/v1/domains/bulk", headers=auth_headers, json=self._domains(test_provider, 3)).json()
+        first, second, third = [result["id"] for result in created["results"]]
+
+        response = client.put(
+            "/api/v1/domains/bulk",
+            headers=auth_headers,
+            json=[
+                {"id": first, "domain_name": "renamed.example.com"},
+                {"id": second, "cron_schedule": "0 * * * *"},
+                {"id": third, "cron_schedule": ""}
+            ]
+        )
+        assert response.status_code == 200
+        assert response.json()["updated"] == 3
+        domains = {domain["id"]: domain for domain in client.get("/api/v1/domains", headers=auth_headers).json()}
+        assert domains[first]["domain_name"] == "renamed.example.com"
+        assert domains[second]["cron_schedule"] == "0 * * * *"
+        scheduler.add_schedules.assert_called_once_with({second: "0 * * * *"})
+        scheduler.remove_schedules.assert_called_once_with([third])
+
+        # Unknown and repeated ids reject the whole update
+        response = client.put(
+            "/api/v1/domains/bulk",
+            headers=auth_headers,
+            json=[{"id": first, "domain_name": "a"}, {"id": first, "domain_name": "b"}, {"id": 99999}]
+        )
+        assert response.status_code == 422
+        assert [error["index"] for error in response.json()["detail"]["errors"]] == [1, 2]
+        assert client.get("/api/v1/domains", headers=auth_headers).json()[0]["domain_name"] == "renamed.example.com"
+
+    def test_bulk_delete(self, client: TestClient, auth_headers: dict, test_provider: int, scheduler, db):
+        """Test deleting domains with their history and rollups in one request."""
+        from app.models import IPHistory, DomainStatsHourly, IPSeenHourly, IPChangesHourly
+
+        created = client.post("/api/v1/domains/bulk", headers=auth_headers, json=self._domains(test_provider, 3)).json()
+        ids = [result["id"] for result in created["results"]]
+        db.add(IPHistory(domain_id=ids[0], ip_address="1.2.3.4", status="SUCCESS"))
+        db.commit()
+        db.add(IPHistory(domain_id=ids[0], ip_address="5.6.7.8", status="SUCCESS"))
+        db.add(IPHistory(domain_id=ids[2], ip_address="1.2.3.4", status="SUCCESS"))
+        db.commit()
+        assert db.query(IPChangesHourly).filter(IPChangesHourly.domain_id == ids[0]).count() == 1
+
+        response = client.post("/api/v1/domains/bulk/delete", headers=auth_headers, json={"ids": [ids[0], 99999]})
+        assert response.status_code == 422
+        assert len(client.get("/api/v1/domains", headers=auth_headers).json()) == 3
+
+        response = client.post("/api/v1/domains/bulk/delete", headers=auth_headers, json={"ids": ids[:2]})
+        assert response.status_code == 200
+        assert response.json()["deleted"] == 2
+        assert [domain["id"] for domain in client.get("/api/v1/domains", headers=auth_headers).json()] == [ids[2]]
+        assert db.query(IPHistory).count() == 1
+        for model in (DomainStatsHourly, IPSeenHourly, IPChangesHourly):
+            assert {row.domain_id for row in db.query(model)} <= {ids[2]}, model.__name__
+        assert db.query(DomainStatsHourly).filter(DomainStatsHourly.domain_id == ids[2]).count() == 1
+        scheduler.remove_schedules.assert_called_once_with(ids[:2])
+
+
 class TestDomainHistory:
     """Test domain history retrieval."""
 
@@ -235,6 +532,34 @@ class TestDomainHistory:
         assert response.status_code == 200
         assert response.json() == []
 
+    def test_get_domain_history_pages(self, client: TestClient, auth_headers: dict, test_provider: int, db):
+        """Test paging history newest first, including rows with equal timestamps."""
+        from datetime import datetime, timedelta, UTC
+        from app.models import IPHistory
+
+        domain_id = client.post(
+            "/api/v1/domains",
+            headers=auth_headers,
+            json={"provider_id": test_provider, "domain_name": "paged.com", "external_id": "1", "config": {}}
+        ).json()["id"]
+        now = datetime.now(UTC)
+        db.add_all([
+            IPHistory(domain_id=domain_id, ip_address=f"10.0.0.{i}", status="SUCCESS", timestamp=now - timedelta(minutes=i // 2))
+            for i in range(7)
+        ])
+        db.commit()
+
+        first = client.get(f"/api/v1/domains/{domain_id}/history?limit=3", headers=auth_headers)
+        seen = [h["id"] for h in first.json()]
+        next_url = first.headers["Link"].split(";")[0].strip("<>")
+        while next_url:
+            page = client.get(next_url, headers=auth_headers)
+            seen += [h["id"] for h in page.json()]
+            next_url = page.headers.get("Link", "").split(";")[0].strip("<>")
+
+        expected = [h.id for h in db.query(IPHistory).order_by(IPHistory.timestamp.desc(), IPHistory.id.desc())]
+        assert seen == expected
+
     def test_get_history_nonexistent_domain(self, client: TestClient, auth_headers: dict):
         """Test getting history for non-existent domain."""
         response = client.get("/api/v1/domains/999/history", headers=auth_headers)
@@ -242,6 +567,93 @@ class TestDomainHistory:
         assert response.json() == []
 
 
+class TestDomainUpdateAll:
+    """Test updating all domains with streamed results."""
+
+    @pytest.fixture
+    def domains(self, client: TestClient, auth_headers: dict, test_provider: int) -> list:
+        items = [
+            {"provider_id": test_provider, "domain_name": name, "config": {}}
+            for name in ("home.example.com", "office.example.com", "lab.example.org")
+        ]
+        created = client.post("/api/v1/domains/bulk", headers=auth_headers, json=items).json()
+        return [result["id"] for result in created["results"]]
+
+    @pytest.fixture
+    def sink(self, monkeypatch, session_factory):
+        from app.services.history_sink import HistorySink
+
+        sink = HistorySink(session_factory=session_factory, spool_path=None)
+        monkeypatch.setattr("app.api.v1.endpoints.domains.get_history_sink", lambda: sink)
+        monkeypatch.setattr("app.services.ddns_service.SessionLocal", session_factory)
+        return sink
+
+    @pytest.fixture
+    def fetcher(self):
+        from unittest.mock import AsyncMock, patch
+
+        with patch("app.api.v1.endpoints.domains.IPFetcher") as MockFetcher:
+            MockFetcher.return_value.get_current_ip = AsyncMock(return_value="5.6.7.8")
+            yield MockFetcher
+
+    @pytest.fixture
+    def provider_call(self):
+        from unittest.mock import AsyncMock, patch
+
+        with patch("app.services.ddns_service.DynuProvider") as MockProvider:
+            MockProvider.return_value.update_record = AsyncMock(return_value=True)
+            yield MockProvider.return_value.update_record
+
+    def test_update_all_streams_ndjson(self, client: TestClient, auth_headers: dict, domains, sink, fetcher, provider_call):
+        """Test that every domain is updated with one IP fetch and reported per line."""
+        import json
+
+        response = client.post("/api/v1/domains/update_all", headers=auth_headers)
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        lines = [json.loads(line) for line in response.text.splitlines()]
+
+        results, summary = lines[:-1], lines[-1]
+        assert sorted(result["domain_id"] for result in results) == domains
+        assert all(result["type"] == "result" and result["status"] == "SUCCESS" for result in results)
+        assert summary["type"] == "summary"
+        assert (summary["total"], summary["succeeded"], summary["failed"]) == (3, 3, 0)
+        assert summary["ip_address"] == "5.6.7.8"
+        fetcher.return_value.get_current_ip.assert_awaited_once()
+        assert provider_call.await_count == 3
+
+        # History and statuses are written before the stream ends
+        listed = client.get("/api/v1/domains", headers=auth_headers).json()
+        assert {domain["last_known_ip"] for domain in listed} == {"5.6.7.8"}
+
+        # Without force, domains already at the current IP are skipped
+        response = client.post("/api/v1/domains/update_all?force=false", headers=auth_headers)
+        assert json.loads(response.text.splitlines()[-1])["unchanged"] == 3
+        assert provider_call.await_count == 3
+
+    def test_update_all_filters_and_sse(self, client: TestClient, auth_headers: dict, domains, sink, fetcher, provider_call):
+        """Test name filtering and Server-Sent Events output."""
+        response = client.post(
+            "/api/v1/domains/update_all?name=EXAMPLE.COM",
+            headers={**auth_headers, "Accept": "text/event-stream"}
+        )
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = [block.splitlines()[0] for block in response.text.strip().split("\n\n")]
+        assert events == ["event: result", "event: result", "event: summary"]
+
+        response = client.post("/api/v1/domains/update_all?status=failed", headers=auth_headers)
+        assert '"total": 0' in response.text
+
+    def test_update_all_ip_fetch_failure(self, client: TestClient, auth_headers: dict, domains, sink, fetcher, provider_call):
+        """Test that nothing is updated when the IP cannot be fetched."""
+        from app.core.exceptions import IPFetchError
+
+        fetcher.return_value.get_current_ip.side_effect = IPFetchError("All services failed")
+        response = client.post("/api/v1/domains/update_all", headers=auth_headers)
+        assert response.status_code == 502
+        provider_call.assert_not_awaited()
+
+
 class TestDomainManualUpdate:
     """Test manual IP update functionality."""
 
@@ -254,3 +666,49 @@ class TestDomainManualUpdate:
         """Test manual update for non-existent domain."""
         response = client.post("/api/v1/domains/999/update_ip", headers=auth_headers)
         assert response.status_code == 400  # Domain not found error
+
+    def test_manual_update_async(self, client: TestClient, auth_headers: dict, test_provider: int, mock_scheduler, session_factory, monkeypatch):
+        """Test that an async update is queued as a job and its result can be polled."""
+        import asyncio
+        from unittest.mock import AsyncMock, patch
+        from app.services.scheduler import SchedulerService
+
+        monkeypatch.setattr("app.api.v1.endpoints.domains.get_scheduler", lambda: mock_scheduler)
+        monkeypatch.setattr("app.services.scheduler.SessionLocal", session_factory)
+        domain_id = client.post(
+            "/api/v1/domains",
+            headers=auth_headers,
+            json={"provider_id": test_provider, "domain_name": "async.example.com", "external_id": "1", "config": {}}
+        ).json()["id"]
+
+        response = client.post(f"/api/v1/domains/{domain_id}/update_ip?async=true", headers=auth_headers)
+        assert response.status_code == 202
+        job = response.json()
+        assert job["status"] == "queued"
+        assert response.headers["Location"] == f"/api/v1/jobs/{job['id']}"
+        queued_job = mock_scheduler.enqueue_update.call_args.args[0]
+        assert queued_job.id == job["id"]
+
+        # Asking again while it is queued returns the same job
+        again = client.post(f"/api/v1/domains/{domain_id}/update_ip", headers={**auth_headers, "Prefer": "respond-async"})
+        assert again.status_code == 202
+        assert again.json()["id"] == job["id"]
+        assert mock_scheduler.enqueue_update.call_count == 1
+
+        # Run the job as the scheduler would
+        with patch("app.services.ddns_service.IPFetcher") as MockFetcher:
+            MockFetcher.return_value.get_current_ip = AsyncMock(return_value="9.9.9.9")
+            with patch("app.services.ddns_service.DynuProvider") as MockProvider:
+                MockProvider.return_value.update_record = AsyncMock(return_value=True)
+                asyncio.run(SchedulerService._run_update_job(None, queued_job))
+
+        finished = client.get(f"/api/v1/jobs/{job['id']}", headers=auth_headers).json()
+        assert finished["status"] == "succeeded"
+        assert finished["finished_at"] is not None
+        assert client.get("/api/v1/domains", headers=auth_headers).json()[0]["last_known_ip"] == "9.9.9.9"
+        assert job["id"] in [listed["id"] for listed in client.get("/api/v1/jobs", headers=auth_headers).json()]
+
+    def test_manual_update_async_nonexistent_domain(self, client: TestClient, auth_headers: dict):
+        """Test that unknown domains and jobs are not found."""
+        assert client.post("/api/v1/domains/999/update_ip?async=true", headers=auth_headers).status_code == 404
+        assert client.get("/api/v1/jobs/unknown", headers=auth_headers).status_code == 404
@@ -1,4 +1,5 @@
 import pytest
+from sqlalchemy import func
 from fastapi.testclient import TestClient
 from datetime import datetime, timedelta, UTC
 from app.models import Provider, Domain, IPHistory
@@ -133,6 +134,48 @@ class TestMetricsEndpoints:
             assert "min_time" in data[period]
             assert "max_time" in data[period]
     
+    def test_response_time_statistics(self, client: TestClient, auth_headers: dict, test_provider: int, db):
+        """Test response time aggregates and percentiles computed from recorded durations"""
+        domain_id = client.post(
+            "/api/v1/domains",
+            headers=auth_headers,
+            json={"provider_id": test_provider, "domain_name": "timed.example.com", "config": {}}
+        ).json()["id"]
+        now = datetime.now(UTC)
+        db.add_all([
+            IPHistory(
+                domain_id=domain_id,
+                ip_address="10.0.0.1",
+                status="SUCCESS",
+                timestamp=now - timedelta(minutes=10),
+                duration_ms=float(ms),
+                provider_ms=float(ms) / 2
+            )
+            for ms in range(10, 101, 10)
+        ])
+        # Older than 1h, and a row without timings
+        db.add(IPHistory(domain_id=domain_id, ip_address="10.0.0.1", status="SUCCESS",
+                         timestamp=now - timedelta(hours=3), duration_ms=1000.0))
+        db.add(IPHistory(domain_id=domain_id, ip_address="10.0.0.1", status="SUCCESS",
+                         timestamp=now - timedelta(minutes=5)))
+        db.commit()
+
+        data = client.get("/api/v1/metrics/response-time", headers=auth_headers).json()
+
+        last_hour = data["1h"]
+        assert last_hour["count"] == 11
+        assert last_hour["samples"] == 10
+        assert last_hour["avg_time"] == 55.0
+        assert last_hour["min_time"] == 10.0
+        assert last_hour["max_time"] == 100.0
+        assert last_hour["p50_time"] == 50.0
+        assert last_hour["p95_time"] == 100.0
+        assert last_hour["breakdown"]["provider_call"] == 27.5
+        assert last_hour["breakdown"]["db_write"] == 0
+
+        assert data["6h"]["max_time"] == 1000.0
+        assert data["6h"]["p50_time"] == 60.0
+
     def test_ip_changes_metrics(self, client: TestClient, auth_headers: dict, test_domains_with_history):
         """Test GET /metrics/ip-changes endpoint"""
         response = client.get("/api/v1/metrics/ip-changes", headers=auth_headers)
@@ -155,7 +198,48 @@ class TestMetricsEndpoints:
         # domain1 has 2 different IPs, so 1 change
         domain1_data = next(d for d in data["domains"] if d["domain_name"] == "test1.example.com")
         assert domain1_data["changes_last_week"] == 1
-    
+
+    def test_ip_changes_counts_transitions(self, client: TestClient, auth_headers: dict, test_domains_with_history, db):
+        """Test that changes are counted against the IP recorded before, across writes"""
+        domain_id = test_domains_with_history["domain2_id"]
+        now = datetime.now(UTC)
+        # Written in two batches after the fixture's .2.1 entries
+        for batch in ([(25, "192.168.2.9"), (20, "192.168.2.9")], [(10, "192.168.2.1")]):
+            for minutes_ago, ip in batch:
+                db.add(IPHistory(domain_id=domain_id, ip_address=ip, status="SUCCESS", timestamp=now - timedelta(minutes=minutes_ago)))
+            db.commit()
+
+        data = client.get("/api/v1/metrics/ip-changes", headers=auth_headers).json()
+        # .2.1 -> .2.1 -> .2.9 -> .2.9 -> .2.1
+        changes = {d["domain_id"]: d["changes_last_week"] for d in data["domains"]}
+        assert changes[domain_id] == 2
+        assert data["total_changes_last_week"] == 3
+
+    def test_ip_changes_late_arrivals(self, client: TestClient, auth_headers: dict, test_domains_with_history, db):
+        """Test that history arriving out of order is counted by timestamp, not arrival"""
+        domain_id = test_domains_with_history["domain2_id"]
+        now = datetime.now(UTC)
+
+        def add(minutes_ago, ip):
+            db.add(IPHistory(domain_id=domain_id, ip_address=ip, status="SUCCESS", timestamp=now - timedelta(minutes=minutes_ago)))
+            db.commit()
+
+        def changes():
+            data = client.get("/api/v1/metrics/ip-changes", headers=auth_headers).json()
+            return {d["domain_id"]: d["changes_last_week"] for d in data["domains"]}[domain_id]
+
+        add(10, "192.168.2.1")
+        assert changes() == 0
+        # Lands between .2.1 rows: .2.1 -> .2.9 -> .2.1
+        add(20, "192.168.2.9")
+        assert changes() == 2
+        # Lands between .2.9 and .2.1 with the same IP as the later row: the change moves to it
+        add(15, "192.168.2.1")
+        assert changes() == 2
+        # Same IP as both neighbours
+        add(25, "192.168.2.1")
+        assert changes() == 2
+
     def test_provider_stats_metrics(self, client: TestClient, auth_headers: dict, test_domains_with_history):
         """Test GET /metrics/provider-stats endpoint"""
         response = client.get("/api/v1/metrics/provider-stats", headers=auth_headers)
@@ -183,6 +267,37 @@ class TestMetricsEndpoints:
         assert provider_data["updates_24h"] == 4
         assert provider_data["successful_updates_24h"] == 3
         assert provider_data["success_rate_24h"] == 75.0
+
+    def test_provider_stats_per_provider(self, client: TestClient, auth_headers: dict, test_domains_with_history, test_provider: int, db):
+        """Test provider stats with several providers, old history and providers without domains"""
+        from app.core import security
+
+        def add_provider(name):
+            provider = Provider(name=name, type="dynu", credentials_encrypted=security.encrypt_credentials({"t": "t"}), is_enabled=True)
+            db.add(provider)
+            db.commit()
+            return provider
+
+        quiet, idle, empty = add_provider("Quiet"), add_provider("Idle"), add_provider("Empty")
+        quiet_domain = Domain(provider_id=quiet.id, domain_name="quiet.example.com", config={})
+        db.add_all([quiet_domain, Domain(provider_id=idle.id, domain_name="idle.example.com", config={})])
+        db.commit()
+        # Only outside the 24h window
+        db.add(IPHistory(domain_id=quiet_domain.id, ip_address="10.1.1.1", status="SUCCESS", timestamp=datetime.now(UTC) - timedelta(days=3)))
+        db.commit()
+
+        data = client.get("/api/v1/metrics/provider-stats", headers=auth_headers).json()
+        stats = {p["provider_id"]: p for p in data["providers"]}
+        assert data["total_providers"] == 3
+        assert empty.id not in stats
+        assert [p["provider_id"] for p in data["providers"]] == [test_provider, quiet.id, idle.id]
+
+        assert stats[test_provider]["updates_24h"] == 4
+        assert stats[quiet.id]["updates_24h"] == 0
+        assert stats[quiet.id]["success_rate_24h"] == 0
+        assert stats[quiet.id]["last_update_time"] is not None
+        assert stats[idle.id]["total_domains"] == 1
+        assert stats[idle.id]["last_update_time"] is None
     
     def test_uptime_metrics(self, client: TestClient, auth_headers: dict, test_domains_with_history):
         """Test GET /metrics/uptime endpoint"""
@@ -238,6 +353,18 @@ class TestMetricsEndpoints:
         assert data["count"] == 2
         assert len(data["activity"]) == 2
     
+    def test_activity_timeline_cursor(self, client: TestClient, auth_headers: dict, test_domains_with_history):
+        """Test paging the activity timeline with next_cursor"""
+        first = client.get("/api/v1/metrics/activity?limit=3", headers=auth_headers).json()
+        assert first["count"] == 3
+        assert first["next_cursor"]
+
+        rest = client.get(f"/api/v1/metrics/activity?limit=3&cursor={first['next_cursor']}", headers=auth_headers).json()
+        assert rest["count"] == 1
+        assert rest["next_cursor"] is None
+        timestamps = [a["timestamp"] for a in first["activity"] + rest["activity"]]
+        assert timestamps == sorted(timestamps, reverse=True)
+
     def test_metrics_with_no_data(self, client: TestClient, auth_headers: dict):
         """Test metrics endpoints with no data"""
         # Test dashboard with no history
@@ -258,3 +385,452 @@ class TestMetricsEndpoints:
         assert response.status_code == 200
         data = response.json()
         assert data["total_changes_last_week"] == 0
+
+
+class TestMetricsRollups:
+    """Test incremental maintenance of the hourly rollups"""
+
+    @pytest.fixture
+    def provider_with_domains(self, db):
+        """Create a provider with two domains directly in the database"""
+        from app.core import security
+
+        provider = Provider(
+            name="Rollup Provider",
+            type="dynu",
+            credentials_encrypted=security.encrypt_credentials({"token": "t"}),
+            is_enabled=True
+        )
+        db.add(provider)
+        db.commit()
+        domains = [Domain(provider_id=provider.id, domain_name=f"r{i}.example.com", config={}) for i in range(2)]
+        db.add_all(domains)
+        db.commit()
+        return provider, domains
+
+    def _history(self, domain, ip, status, at):
+        return IPHistory(domain_id=domain.id, ip_address=ip, status=status, timestamp=at, message="")
+
+    def test_orm_writes_update_rollups(self, db, provider_with_domains):
+        """Test that history added through the ORM is counted per domain and provider"""
+        from app.models import DomainStatsHourly, ProviderStatsHourly
+        from app.services.rollups import bucket_start
+
+        provider, (first, second) = provider_with_domains
+        hour = bucket_start(datetime.now(UTC)) - timedelta(hours=5)
+        db.add_all([
+            self._history(first, "1.1.1.1", "SUCCESS", hour + timedelta(minutes=1)),
+            self._history(first, "1.1.1.1", "SUCCESS", hour + timedelta(minutes=2)),
+            self._history(second, "1.1.1.1", "FAILED", hour + timedelta(minutes=3)),
+        ])
+        db.commit()
+        # A later write in the same hour is merged into the existing buckets
+        db.add(self._history(first, "2.2.2.2", "SUCCESS", hour + timedelta(minutes=4)))
+        db.commit()
+
+        first_stats = db.query(DomainStatsHourly).filter_by(domain_id=first.id).one()
+        assert (first_stats.attempts, first_stats.successes, first_stats.failures) == (3, 3, 0)
+        assert first_stats.distinct_ips == 2
+
+        provider_stats = db.query(ProviderStatsHourly).filter_by(provider_id=provider.id).one()
+        assert (provider_stats.attempts, provider_stats.successes, provider_stats.failures) == (4, 3, 1)
+        # 1.1.1.1 was reported by both domains but counts once for the provider
+        assert provider_stats.distinct_ips == 2
+        assert bucket_start(provider_stats.last_event_at) == hour
+
+    def test_buffered_writes_update_rollups(self, db, session_factory, provider_with_domains):
+        """Test that rows written in bulk by the history sink are counted"""
+        from app.models import ProviderStatsHourly
+        from app.services.history_sink import HistorySink
+
+        provider, (first, second) = provider_with_domains
+        sink = HistorySink(session_factory=session_factory, spool_path=None)
+        sink.record(first.id, "3.3.3.3", "SUCCESS", last_update_status="SUCCESS")
+        sink.record(second.id, "3.3.3.3", "FAILED", last_update_status="FAILED")
+        sink.flush()
+
+        totals = db.query(ProviderStatsHourly).filter_by(provider_id=provider.id).one()
+        assert (totals.attempts, totals.successes, totals.failures, totals.distinct_ips) == (2, 1, 1, 1)
+
+    def test_sink_flush_with_many_domains(self, db, provider_with_domains, session_factory):
+        """Test that a batch touching more domains than SQLite's expression depth limit is written"""
+        from app.models import IPChangesHourly
+        from app.services.history_sink import HistorySink
+
+        provider, _ = provider_with_domains
+        domains = [Domain(provider_id=provider.id, domain_name=f"many{i}.example.com", config={}) for i in range(1500)]
+        db.add_all(domains)
+        db.commit()
+        db.add_all([self._history(domain, "10.0.0.1", "SUCCESS", datetime.now(UTC) - timedelta(minutes=5)) for domain in domains])
+        db.commit()
+
+        sink = HistorySink(session_factory=session_factory, flush_size=5000, spool_path=None)
+        for domain in domains:
+            sink.record(domain.id, "10.0.0.2", "SUCCESS", last_update_status="SUCCESS", last_known_ip="10.0.0.2")
+        assert sink.flush() == 1500
+        assert sink.depth == 0
+        assert db.query(func.sum(IPChangesHourly.changes)).scalar() == 1500
+
+    def test_rebuild_matches_incremental(self, db, provider_with_domains):
+        """Test that the backfill reproduces the incrementally maintained rollups"""
+        from app.models import DomainStatsHourly, ProviderStatsHourly, IPSeenHourly, IPChangesHourly
+        from app.services.rollups import rebuild_rollups
+
+        provider, (first, second) = provider_with_domains
+        now = datetime.now(UTC)
+        db.add_all([
+            self._history(domain, f"10.0.{i % 3}.1", "SUCCESS" if i % 4 else "FAILED", now - timedelta(minutes=37 * i))
+            for i in range(40)
+            for domain in (first, second)
+        ])
+        db.commit()
+
+        def snapshot():
+            return (
+                sorted((r.domain_id, r.bucket_start, r.attempts, r.successes, r.failures, r.distinct_ips) for r in db.query(DomainStatsHourly)),
+                sorted((r.provider_id, r.bucket_start, r.attempts, r.successes, r.failures, r.distinct_ips) for r in db.query(ProviderStatsHourly)),
+                db.query(IPSeenHourly).count(),
+                sorted((r.domain_id, r.bucket_start, r.changes) for r in db.query(IPChangesHourly))
+            )
+
+        incremental = snapshot()
+        assert incremental[3]
+        assert rebuild_rollups(db, batch_size=7) == 80
+        db.expire_all()
+        assert snapshot() == incremental
+
+    def test_metrics_survive_history_pruning(self, client: TestClient, auth_headers: dict, test_domains_with_history, db):
+        """Test that dashboard counts do not depend on retained raw history"""
+        db.query(IPHistory).delete()
+        db.commit()
+
+        data = client.get("/api/v1/metrics/dashboard", headers=auth_headers).json()
+        assert data["total_updates_24h"] == 4
+        assert data["failed_updates_24h"] == 1
+        assert data["last_update_time"] is not None
+
+
+class TestMetricsSeries:
+    """Test the bucketed update series"""
+
+    @pytest.fixture
+    def series_history(self, test_domains_with_history, db):
+        """Add history three days ago, away from the fixture's recent entries"""
+        from app.services.rollups import bucket_start
+
+        day = bucket_start(datetime.now(UTC) - timedelta(days=3)).replace(hour=0)
+        first, second = test_domains_with_history["domain1_id"], test_domains_with_history["domain2_id"]
+        db.add_all([
+            IPHistory(domain_id=first, ip_address="1.1.1.1", status="SUCCESS", timestamp=day + timedelta(hours=1, minutes=10)),
+            IPHistory(domain_id=second, ip_address="1.1.1.1", status="FAILED", timestamp=day + timedelta(hours=1, minutes=20)),
+            IPHistory(domain_id=first, ip_address="1.1.1.2", status="SUCCESS", timestamp=day + timedelta(hours=26)),
+        ])
+        db.commit()
+        return day, first
+
+    def _series(self, client, auth_headers, **params):
+        return client.get("/api/v1/metrics/series", headers=auth_headers, params=params)
+
+    def test_hourly_series_is_zero_filled(self, client: TestClient, auth_headers: dict, series_history):
+        """Test that every hour in the range gets an entry"""
+        day, _ = series_history
+        data = self._series(
+            client, auth_headers,
+            **{"from": (day + timedelta(minutes=30)).isoformat(), "to": (day + timedelta(hours=3)).isoformat()}
+        ).json()
+
+        assert data["bucket"] == "hour"
+        assert data["from"] == day.isoformat()
+        assert data["to"] == (day + timedelta(hours=4)).isoformat()
+        assert data["timestamps"] == [(day + timedelta(hours=h)).isoformat() for h in range(4)]
+        assert data["updates"] == [0, 2, 0, 0]
+        assert data["successes"] == [0, 1, 0, 0]
+        assert data["failures"] == [0, 1, 0, 0]
+
+    def test_daily_series_and_filters(self, client: TestClient, auth_headers: dict, test_provider: int, series_history):
+        """Test daily buckets for all domains, one domain and one provider"""
+        day, first = series_history
+        window = {"from": day.isoformat(), "to": (day + timedelta(hours=47)).isoformat(), "bucket": "day"}
+
+        data = self._series(client, auth_headers, **window).json()
+        assert data["timestamps"] == [day.isoformat(), (day + timedelta(days=1)).isoformat()]
+        assert data["updates"] == [2, 1]
+        assert data["failures"] == [1, 0]
+
+        assert self._series(client, auth_headers, domain_id=first, **window).json()["updates"] == [1, 1]
+        assert self._series(client, auth_headers, provider_id=test_provider, **window).json()["updates"] == [2, 1]
+        assert self._series(client, auth_headers, provider_id=test_provider + 1, **window).json()["updates"] == [0, 0]
+        assert self._series(client, auth_headers, domain_id=first, provider_id=test_provider + 1, **window).json()["updates"] == [0, 0]
+
+    def test_default_range(self, client: TestClient, auth_headers: dict, test_domains_with_history):
+        """Test that the last 24 hours are returned by default, including recent updates"""
+        data = self._series(client, auth_headers).json()
+        assert len(data["timestamps"]) == 25
+        assert sum(data["updates"]) == 4
+
+    def test_invalid_ranges(self, client: TestClient, auth_headers: dict):
+        """Test that reversed and oversized ranges are rejected"""
+        now = datetime.now(UTC)
+        reversed_range = {"from": now.isoformat(), "to": (now - timedelta(hours=1)).isoformat()}
+        assert self._series(client, auth_headers, **reversed_range).status_code == 400
+        too_long = {"from": (now - timedelta(days=365)).isoformat(), "to": now.isoformat()}
+        assert self._series(client, auth_headers, **too_long).status_code == 400
+        assert self._series(client, auth_headers, bucket="day", **too_long).status_code == 200
+        assert self._series(client, auth_headers, bucket="week").status_code == 422
+
+
+class TestMetricsCache:
+    """Test caching of metrics responses"""
+
+    def test_dashboard_cached_between_writes(self, client: TestClient, auth_headers: dict, test_domains_with_history, db):
+        """Test that repeated requests are served without querying"""
+        from sqlalchemy import event
+        from app.api.v1.endpoints import metrics
+
+        first = client.get("/api/v1/metrics/dashboard", headers=auth_headers).json()
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.get_bind(), "before_cursor_execute", listener)
+        try:
+            second = client.get("/api/v1/metrics/dashboard", headers=auth_headers).json()
+        finally:
+            event.remove(db.get_bind(), "before_cursor_execute", listener)
+
+        assert second == first
+        assert not any("provider_stats_hourly" in statement for statement in statements)
+        assert metrics.metrics_cache.ttl > 0
+
+    def test_dashboard_invalidated_by_history_writes(self, client: TestClient, auth_headers: dict, test_domains_with_history, session_factory):
+        """Test that history written in bulk shows up immediately"""
+        from app.services.history_sink import HistorySink
+
+        before = client.get("/api/v1/metrics/dashboard", headers=auth_headers).json()
+
+        sink = HistorySink(session_factory=session_factory, spool_path=None)
+        sink.record(test_domains_with_history["domain1_id"], "10.9.8.7", "FAILED", last_update_status="FAILED")
+        sink.flush()
+
+        after = client.get("/api/v1/metrics/dashboard", headers=auth_headers).json()
+        assert after["total_updates_24h"] == before["total_updates_24h"] + 1
+        assert after["failed_updates_24h"] == before["failed_updates_24h"] + 1
+        assert after["unique_ips_24h"] == before["unique_ips_24h"] + 1
+
+    def test_dashboard_counts_only_enabled_domains_as_active(self, client: TestClient, auth_headers: dict, test_domains_with_history, db):
+        """Test total and active domain counts across enabled and disabled providers"""
+        from app.core import security
+
+        disabled = Provider(
+            name="Disabled",
+            type="duckdns",
+            credentials_encrypted=security.encrypt_credentials({"token": "t"}),
+            is_enabled=False
+        )
+        db.add(disabled)
+        db.commit()
+        db.add(Domain(provider_id=disabled.id, domain_name="off.example.com", config={}))
+        db.commit()
+
+        data = client.get("/api/v1/metrics/dashboard", headers=auth_headers).json()
+        assert data["total_domains"] == 3
+        assert data["active_domains"] == 2
+        assert {stat["type"]: stat["count"] for stat in data["providers_stats"]} == {"cloudflare": 2, "duckdns": 1}
+
+    def test_conditional_dashboard(self, client: TestClient, auth_headers: dict, test_domains_with_history, db):
+        """Test 304 responses for unchanged metrics and a new ETag after history is written"""
+        etag = client.get("/api/v1/metrics/dashboard", headers=auth_headers).headers["ETag"]
+        assert client.get("/api/v1/metrics/dashboard", headers={**auth_headers, "If-None-Match": etag}).status_code == 304
+
+        db.add(IPHistory(domain_id=test_domains_with_history["domain1_id"], ip_address="10.2.3.4", status="SUCCESS"))
+        db.commit()
+        response = client.get("/api/v1/metrics/dashboard", headers={**auth_headers, "If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+
+    def test_etag_matching(self):
+        """Test weak comparison of If-None-Match values"""
+        from app.api.v1.conditional import etag_matches
+
+        assert etag_matches('W/"a-1"', 'W/"a-1"')
+        assert etag_matches('"a-1"', 'W/"a-1"')
+        assert etag_matches('W/"b-2", W/"a-1"', 'W/"a-1"')
+        assert etag_matches("*", 'W/"a-1"')
+        assert not etag_matches('W/"a-2"', 'W/"a-1"')
+        assert not etag_matches(None, 'W/"a-1"')
+
+    def test_cache_stats_and_parameters(self, client: TestClient, auth_headers: dict, test_domains_with_history):
+        """Test that responses are cached per parameters and hits and misses are counted"""
+        from app.api.v1.endpoints import metrics
+
+        metrics.metrics_cache.clear()
+        for _ in range(3):
+            client.get("/api/v1/metrics/activity?limit=1", headers=auth_headers)
+        limited = client.get("/api/v1/metrics/activity?limit=1", headers=auth_headers).json()
+        full = client.get("/api/v1/metrics/activity", headers=auth_headers).json()
+        assert limited["count"] == 1
+        assert full["count"] == 4
+
+        stats = client.get("/api/v1/metrics/cache", headers=auth_headers).json()
+        assert stats["hits"] == 3
+        assert stats["misses"] == 2
+        assert stats["entries"] == 2
+
+    def test_uptime_scheduler_status_not_cached(self, client: TestClient, auth_headers: dict, mock_scheduler, monkeypatch):
+        """Test that the scheduler status is read live while the totals are cached"""
+        monkeypatch.setattr("app.services.scheduler.get_scheduler", lambda: mock_scheduler)
+        assert client.get("/api/v1/metrics/uptime", headers=auth_headers).json()["scheduler_status"] == "stopped"
+        mock_scheduler.scheduler.running = True
+        assert client.get("/api/v1/metrics/uptime", headers=auth_headers).json()["scheduler_status"] == "running"
+
+    def test_concurrent_misses_compute_once(self):
+        """Test that concurrent requests for the same key wait for one computation"""
+        import threading
+        import time
+        from app.core.cache import VersionedCache
+
+        cache = VersionedCache(ttl=60)
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.05)
+            return "value"
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute("key", (1,), compute))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert results == ["value"] * 8
+        assert len(calls) == 1
+        # A newer version is recomputed
+        assert cache.get_or_compute("key", (2,), lambda: "new") == "new"
+        assert cache.stats()["misses"] == 2
+
+    def test_key_lock_released_after_entry_is_stored(self):
+        """Test that a miss never finds neither the entry nor the lock of a finished computation"""
+        from app.core.cache import VersionedCache
+
+        cache = VersionedCache(ttl=60)
+        entries = cache._entries
+        released = []
+
+        class CheckedLocks(dict):
+            def pop(self, key, *default):
+                released.append(key in entries)
+                return super().pop(key, *default)
+
+        cache._key_locks = CheckedLocks()
+        assert cache.get_or_compute("key", (1,), lambda: "value") == "value"
+        assert released == [True]
+        assert not cache._key_locks
+
+        def failing():
+            raise RuntimeError("boom")
+
+        with pytest.raises(RuntimeError):
+            cache.get_or_compute("other", (1,), failing)
+        assert not cache._key_locks
+
+    def test_cache_evicts_least_recently_used(self):
+        """Test that a bounded cache drops the entries used longest ago"""
+        from app.core.cache import VersionedCache
+
+        cache = VersionedCache(ttl=60, max_entries=2)
+        cache.get_or_compute("a", (1,), lambda: "a")
+        cache.get_or_compute("b", (1,), lambda: "b")
+        cache.get_or_compute("a", (1,), lambda: "unused")
+        cache.get_or_compute("c", (1,), lambda: "c")
+
+        assert cache.stats()["entries"] == 2
+        assert cache.get_or_compute("a", (1,), lambda: "recomputed") == "a"
+        assert cache.get_or_compute("b", (1,), lambda: "recomputed") == "recomputed"
+
+
+class TestPrometheusMetrics:
+    """Test the Prometheus exposition endpoint"""
+
+    def test_prometheus_requires_authentication(self, client: TestClient):
+        """Test that scraping needs a token"""
+        assert client.get("/api/v1/metrics/prometheus").status_code == 401
+
+    def test_prometheus_exposition(self, client: TestClient, auth_headers: dict, db):
+        """Test that the text format is served without database queries"""
+        from sqlalchemy import event
+
+        # The first request caches the verified token
+        client.get("/api/v1/metrics/prometheus", headers=auth_headers)
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.get_bind(), "before_cursor_execute", listener)
+        try:
+            response = client.get("/api/v1/metrics/prometheus", headers=auth_headers)
+        finally:
+            event.remove(db.get_bind(), "before_cursor_execute", listener)
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        for name in ("iphop_history_queue_depth", "iphop_scheduled_jobs", "iphop_db_query_seconds"):
+            assert name in response.text
+        assert statements == []
+
+    def test_prometheus_scrape_token(self, client: TestClient, auth_headers: dict, monkeypatch):
+        """Test that a configured scrape token replaces login tokens"""
+        from app.core import config
+
+        monkeypatch.setattr(config, "METRICS_SCRAPE_TOKEN", "scrape-secret")
+        assert client.get("/api/v1/metrics/prometheus", headers=auth_headers).status_code == 401
+        response = client.get("/api/v1/metrics/prometheus", headers={"Authorization": "Bearer scrape-secret"})
+        assert response.status_code == 200
+
+    def test_scheduler_lag_is_observed(self):
+        """Test that job start delays are recorded per job kind"""
+        from apscheduler.events import JobSubmissionEvent, EVENT_JOB_SUBMITTED
+        from app.core import telemetry
+        from app.services.scheduler import SchedulerService
+
+        def lag_count():
+            return telemetry.registry.get_sample_value("iphop_scheduler_job_lag_seconds_count", {"job": "domain_update"}) or 0
+
+        before = lag_count()
+        scheduled = datetime.now(UTC) - timedelta(seconds=2)
+        SchedulerService._observe_job_event(None, JobSubmissionEvent(EVENT_JOB_SUBMITTED, "domain_7", "default", [scheduled]))
+
+        assert lag_count() == before + 1
+        assert telemetry.registry.get_sample_value("iphop_scheduler_job_lag_seconds_sum", {"job": "domain_update"}) >= 2
+
+
+class TestActivityStream:
+    """Test the Server-Sent Events activity stream"""
+
+    def test_stream_requires_authentication(self, client: TestClient):
+        """Test that streaming needs a token"""
+        assert client.get("/api/v1/metrics/activity/stream").status_code == 401
+
+    @pytest.mark.asyncio
+    async def test_stream_resumes_and_follows(self):
+        """Test that missed events are replayed before live ones, in SSE format"""
+        import json
+        from app.api.v1.endpoints.metrics import _sse_events
+        from app.services.event_bus import EventBus
+
+        class Request:
+            async def is_disconnected(self):
+                return False
+
+        bus = EventBus(buffer_size=10)
+        seen = bus.publish("update", {"domain_name": "a.example.com"})
+        missed = bus.publish("update", {"domain_name": "b.example.com"})
+
+        stream = _sse_events(Request(), bus.subscribe(last_event_id=seen["id"]))
+        replayed = await stream.__anext__()
+        live = bus.publish("update", {"domain_name": "c.example.com"})
+        followed = await stream.__anext__()
+        await stream.aclose()
+
+        assert replayed == f"id: {missed['id']}\nevent: update\ndata: {json.dumps(missed['data'])}\n\n"
+        assert followed.startswith(f"id: {live['id']}\n")
+        assert "c.example.com" in followed
+        assert bus.subscriber_count == 0
@@ -5,6 +5,9 @@ Tests CRUD operations and validation for DNS providers.
 import pytest
 from fastapi.testclient import TestClient
 
+from app.core import security
+from app.models import Provider
+
 
 class TestProviderCreate:
     """Test provider creation."""
@@ -117,6 +120,21 @@ class TestProviderRead:
         assert data[0]["name"] == "P1"
         assert data[1]["name"] == "P2"
 
+    def test_get_providers_with_cursor(self, client: TestClient, auth_headers: dict):
+        """Test paging providers with a cursor."""
+        for i in range(3):
+            client.post(
+                "/api/v1/providers",
+                headers=auth_headers,
+                json={"name": f"P{i}", "type": "dynu", "credentials": {"token": "t"}, "is_enabled": True}
+            )
+
+        first = client.get("/api/v1/providers?limit=2", headers=auth_headers)
+        assert [p["name"] for p in first.json()] == ["P0", "P1"]
+        second = client.get(f"/api/v1/providers?limit=2&cursor={first.headers['X-Next-Cursor']}", headers=auth_headers)
+        assert [p["name"] for p in second.json()] == ["P2"]
+        assert "X-Next-Cursor" not in second.headers
+
     def test_get_providers_unauthenticated(self, client: TestClient):
         """Test getting providers without authentication."""
         response = client.get("/api/v1/providers")
@@ -179,6 +197,21 @@ class TestProviderUpdate:
         )
         assert response.status_code == 200
 
+    def test_update_provider_credentials_drops_cached(self, client: TestClient, auth_headers: dict, db):
+        """Test that replaced credentials don't stay in the decrypted credentials cache."""
+        provider_id = client.post(
+            "/api/v1/providers",
+            headers=auth_headers,
+            json={"name": "Cached", "type": "dynu", "credentials": {"token": "old"}, "is_enabled": True}
+        ).json()["id"]
+        old = db.get(Provider, provider_id).credentials_encrypted
+        assert security.decrypt_credentials(old) == {"token": "old"}
+
+        client.put(f"/api/v1/providers/{provider_id}", headers=auth_headers, json={"credentials": {"token": "new"}})
+        db.expire_all()
+        assert security._credentials_digest(old) not in security.credentials_cache._entries
+        assert security.decrypt_credentials(db.get(Provider, provider_id).credentials_encrypted) == {"token": "new"}
+
     def test_update_nonexistent_provider(self, client: TestClient, auth_headers: dict):
         """Test updating non-existent provider."""
         response = client.put(
@@ -192,14 +225,22 @@ class TestProviderUpdate:
 class TestProviderDelete:
     """Test provider deletion."""
 
-    def test_delete_provider_success(self, client: TestClient, auth_headers: dict):
+    def test_delete_provider_success(self, client: TestClient, auth_headers: dict, db):
         """Test successful provider deletion."""
+        from app.models import Domain, IPHistory, DomainStatsHourly
+
         create_resp = client.post(
             "/api/v1/providers",
             headers=auth_headers,
             json={"name": "ToDelete", "type": "dynu", "credentials": {"token": "t"}, "is_enabled": True}
         )
         provider_id = create_resp.json()["id"]
+        domain = Domain(provider_id=provider_id, domain_name="gone.example.com", config={})
+        db.add(domain)
+        db.commit()
+        db.add(IPHistory(domain_id=domain.id, ip_address="1.2.3.4", status="SUCCESS"))
+        db.commit()
+        db.expire_all()
 
         response = client.delete(f"/api/v1/providers/{provider_id}", headers=auth_headers)
         assert response.status_code == 200
@@ -207,6 +248,8 @@ class TestProviderDelete:
         # Verify deletion
         get_resp = client.get("/api/v1/providers", headers=auth_headers)
         assert len(get_resp.json()) == 0
+        # Its domains' rollups go with them
+        assert db.query(DomainStatsHourly).count() == 0
 
     def test_delete_nonexistent_provider(self, client: TestClient, auth_headers: dict):
         """Test deleting non-existent provider."""
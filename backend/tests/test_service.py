@@ -3,11 +3,14 @@ Comprehensive service layer tests.
 Tests DDNS service, IP fetching, and business logic.
 """
 import pytest
+from datetime import datetime, timedelta, UTC
 from unittest.mock import AsyncMock, Mock, patch
 from sqlalchemy.orm import Session
 
 from app.services.ddns_service import DDNSService
-from app.models import Domain, Provider
+from app.services.history_retention import prune_history, get_retention_policy
+from app.services.history_sink import HistorySink
+from app.models import Domain, Provider, IPHistory
 from app.core.exceptions import IPFetchError
 
 
@@ -67,6 +70,303 @@ class TestDDNSService:
                 assert test_domain_db.last_known_ip == "1.2.3.4"
                 assert test_domain_db.last_update_status == "SUCCESS"
 
+    @pytest.mark.asyncio
+    async def test_manual_update_after_queued_result(self, db: Session, session_factory, test_domain_db: Domain, monkeypatch):
+        """Test that a result still queued on the sink is written before a newer write-through one."""
+        sink = HistorySink(session_factory=session_factory, spool_path=None)
+        sink.record(test_domain_db.id, "1.1.1.1", "SUCCESS", last_update_status="SUCCESS", last_known_ip="1.1.1.1")
+        monkeypatch.setattr("app.services.ddns_service.get_history_sink", lambda: sink)
+
+        with patch("app.services.ddns_service.DynuProvider") as MockProvider:
+            MockProvider.return_value.update_record = AsyncMock(return_value=True)
+            assert await DDNSService(db).update_domain_ip(test_domain_db.id, current_ip="2.2.2.2")
+        sink.flush()
+
+        db.refresh(test_domain_db)
+        assert test_domain_db.last_known_ip == "2.2.2.2"
+        history = db.query(IPHistory).order_by(IPHistory.timestamp, IPHistory.id).all()
+        assert [row.ip_address for row in history] == ["1.1.1.1", "2.2.2.2"]
+
+    @pytest.mark.asyncio
+    async def test_manual_update_commits_once(self, db: Session, session_factory, test_domain_db: Domain, monkeypatch):
+        """Test that a write-through result is one commit and leaves other domains' queued results alone."""
+        from sqlalchemy import event
+
+        sink = HistorySink(session_factory=session_factory, spool_path=None)
+        sink.record(test_domain_db.id + 1000, "1.1.1.1", "SUCCESS")
+        monkeypatch.setattr("app.services.ddns_service.get_history_sink", lambda: sink)
+        commits = []
+        event.listen(db, "after_commit", commits.append)
+
+        with patch("app.services.ddns_service.DynuProvider") as MockProvider:
+            MockProvider.return_value.update_record = AsyncMock(return_value=True)
+            assert await DDNSService(db).update_domain_ip(test_domain_db.id, current_ip="2.2.2.2")
+
+        assert len(commits) == 1
+        assert sink.depth == 1
+        history = db.query(IPHistory).one()
+        assert history.db_write_ms is not None
+
+    @pytest.mark.asyncio
+    async def test_manual_update_queues_behind_unwritten_result(self, db: Session, session_factory, test_domain_db: Domain, monkeypatch):
+        """Test that a write-through result queues behind one the sink could not write yet."""
+        sink = HistorySink(session_factory=session_factory, spool_path=None)
+        sink.record(test_domain_db.id, "1.1.1.1", "SUCCESS", last_update_status="SUCCESS", last_known_ip="1.1.1.1")
+        monkeypatch.setattr("app.services.ddns_service.get_history_sink", lambda: sink)
+        write = sink._write
+        monkeypatch.setattr(sink, "_write", Mock(side_effect=RuntimeError("database unavailable")))
+
+        with patch("app.services.ddns_service.DynuProvider") as MockProvider:
+            MockProvider.return_value.update_record = AsyncMock(return_value=True)
+            assert await DDNSService(db).update_domain_ip(test_domain_db.id, current_ip="2.2.2.2")
+        assert sink.depth == 2
+        assert db.query(IPHistory).count() == 0
+
+        monkeypatch.setattr(sink, "_write", write)
+        assert sink.flush() == 2
+        db.refresh(test_domain_db)
+        assert test_domain_db.last_known_ip == "2.2.2.2"
+
+    @pytest.mark.asyncio
+    async def test_update_domain_ip_records_timings(self, db: Session, test_domain_db: Domain):
+        """Test that each update stores its stage timings on the history row."""
+        service = DDNSService(db)
+
+        with patch("app.services.ddns_service.IPFetcher") as MockFetcher:
+            MockFetcher.return_value.get_current_ip = AsyncMock(return_value="1.2.3.4")
+            with patch("app.services.ddns_service.DynuProvider") as MockProvider:
+                MockProvider.return_value.update_record = AsyncMock(return_value=True)
+                await service.update_domain_ip(test_domain_db.id)
+
+        history = db.query(IPHistory).filter(IPHistory.domain_id == test_domain_db.id).one()
+        for field in ("duration_ms", "ip_fetch_ms", "decrypt_ms", "provider_ms", "db_write_ms"):
+            assert getattr(history, field) is not None, field
+            assert getattr(history, field) >= 0
+        assert history.duration_ms >= history.ip_fetch_ms + history.decrypt_ms + history.provider_ms
+
+    @pytest.mark.asyncio
+    async def test_update_domain_ip_is_instrumented(self, db: Session, test_domain_db: Domain):
+        """Test that updates and provider call latency are counted for Prometheus."""
+        from app.core import telemetry
+
+        def sample(name, **labels):
+            return telemetry.registry.get_sample_value(name, labels) or 0
+
+        before_updates = sample("iphop_updates_total", provider="dynu", status="SUCCESS")
+        before_calls = sample("iphop_provider_call_seconds_count", provider="dynu")
+        service = DDNSService(db)
+
+        with patch("app.services.ddns_service.IPFetcher") as MockFetcher:
+            MockFetcher.return_value.get_current_ip = AsyncMock(return_value="1.2.3.4")
+            with patch("app.services.ddns_service.DynuProvider") as MockProvider:
+                MockProvider.return_value.update_record = AsyncMock(return_value=True)
+                await service.update_domain_ip(test_domain_db.id)
+
+        assert sample("iphop_updates_total", provider="dynu", status="SUCCESS") == before_updates + 1
+        assert sample("iphop_provider_call_seconds_count", provider="dynu") == before_calls + 1
+
+    @pytest.mark.asyncio
+    async def test_update_domain_ip_publishes_event(self, db: Session, test_domain_db: Domain):
+        """Test that every update is published for live activity streams."""
+        from app.services.event_bus import get_event_bus
+
+        subscription = get_event_bus().subscribe()
+        try:
+            with patch("app.services.ddns_service.IPFetcher") as MockFetcher:
+                MockFetcher.return_value.get_current_ip = AsyncMock(return_value="1.2.3.4")
+                with patch("app.services.ddns_service.DynuProvider") as MockProvider:
+                    MockProvider.return_value.update_record = AsyncMock(return_value=False)
+                    await DDNSService(db).update_domain_ip(test_domain_db.id)
+
+            event = await subscription.get(timeout=1)
+        finally:
+            subscription.close()
+
+        assert event["type"] == "update"
+        assert event["data"]["domain_name"] == "test.example.com"
+        assert event["data"]["ip_address"] == "1.2.3.4"
+        assert event["data"]["status"] == "FAILED"
+
+    @pytest.mark.asyncio
+    async def test_event_published_once_written(self, db: Session, session_factory, test_domain_db: Domain):
+        """Test that updates queued on the sink are published only when their history is committed."""
+        from app.services.event_bus import get_event_bus
+
+        sink = HistorySink(session_factory=session_factory, spool_path=None)
+        subscription = get_event_bus().subscribe()
+        try:
+            with patch("app.services.ddns_service.DynuProvider") as MockProvider:
+                MockProvider.return_value.update_record = AsyncMock(return_value=True)
+                await DDNSService(db, sink=sink).update_domain_ip(test_domain_db.id, current_ip="1.2.3.4")
+            assert await subscription.get(timeout=0.05) is None
+
+            sink.flush()
+            event = await subscription.get(timeout=1)
+        finally:
+            subscription.close()
+        assert event["data"]["ip_address"] == "1.2.3.4"
+
+    @pytest.mark.asyncio
+    async def test_event_not_published_when_write_fails(self, db: Session, test_domain_db: Domain, monkeypatch):
+        """Test that a write-through update whose commit fails is not published."""
+        from app.services.event_bus import get_event_bus
+
+        subscription = get_event_bus().subscribe()
+        monkeypatch.setattr(db, "commit", Mock(side_effect=RuntimeError("database unavailable")))
+        try:
+            with patch("app.services.ddns_service.DynuProvider") as MockProvider:
+                MockProvider.return_value.update_record = AsyncMock(return_value=True)
+                with pytest.raises(RuntimeError):
+                    await DDNSService(db).update_domain_ip(test_domain_db.id, current_ip="1.2.3.4")
+            assert await subscription.get(timeout=0.05) is None
+        finally:
+            subscription.close()
+            db.rollback()
+
+    @pytest.mark.asyncio
+    async def test_concurrent_updates_of_a_domain_are_joined(self, db: Session, test_domain_db: Domain):
+        """Test that a second update of a domain waits for the first instead of calling the provider."""
+        import asyncio
+        from app.core import telemetry
+
+        release = asyncio.Event()
+
+        async def update_record(ip, domain_config):
+            await release.wait()
+            return True
+
+        joined_before = telemetry.UPDATES_JOINED._value.get()
+        with patch("app.services.ddns_service.DynuProvider") as MockProvider:
+            MockProvider.return_value.update_record = AsyncMock(side_effect=update_record)
+            first = asyncio.ensure_future(DDNSService(db).update_domain_ip(test_domain_db.id, current_ip="1.2.3.4"))
+            await asyncio.sleep(0)
+            second = asyncio.ensure_future(DDNSService(db).update_domain_ip(test_domain_db.id, current_ip="1.2.3.4"))
+            await asyncio.sleep(0)
+            release.set()
+            assert await asyncio.gather(first, second) == [True, True]
+
+            assert MockProvider.return_value.update_record.await_count == 1
+            assert db.query(IPHistory).count() == 1
+            assert telemetry.UPDATES_JOINED._value.get() == joined_before + 1
+
+            # Once finished, the next update runs on its own
+            assert await DDNSService(db).update_domain_ip(test_domain_db.id, current_ip="1.2.3.4") is True
+            assert MockProvider.return_value.update_record.await_count == 2
+
+    @pytest.mark.asyncio
+    async def test_joined_update_shares_the_error(self, db: Session, test_domain_db: Domain):
+        """Test that callers joining a failing update get its error."""
+        import asyncio
+
+        async def update_record(ip, domain_config):
+            await asyncio.sleep(0.01)
+            raise RuntimeError("provider down")
+
+        with patch("app.services.ddns_service.DynuProvider") as MockProvider:
+            MockProvider.return_value.update_record = update_record
+            results = await asyncio.gather(
+                DDNSService(db).update_domain_ip(test_domain_db.id, current_ip="1.2.3.4"),
+                DDNSService(db).update_domain_ip(test_domain_db.id, current_ip="1.2.3.4"),
+                return_exceptions=True
+            )
+        assert [str(result) for result in results] == ["provider down", "provider down"]
+        assert db.query(IPHistory).count() == 1
+
+    @pytest.mark.asyncio
+    async def test_update_domains_concurrently(self, db: Session, session_factory, test_domain_db: Domain, monkeypatch):
+        """Test that updates run concurrently within the per-provider cap and reuse the given IP."""
+        import asyncio
+
+        monkeypatch.setattr("app.core.config.UPDATE_ALL_CONCURRENCY", 10)
+        monkeypatch.setattr("app.core.config.UPDATE_ALL_PROVIDER_CONCURRENCY", 3)
+        domains = [test_domain_db] + [
+            Domain(provider_id=test_domain_db.provider_id, domain_name=f"c{i}.example.com", config={})
+            for i in range(7)
+        ]
+        db.add_all(domains[1:])
+        domains[2].last_known_ip = "1.2.3.4"
+        db.commit()
+
+        running, peak = 0, 0
+
+        async def update_record(ip, domain_config):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return domain_config.name != "c0.example.com"
+
+        sink = HistorySink(session_factory=session_factory, spool_path=None)
+        service = DDNSService(db, sink=sink, session_factory=session_factory)
+        with patch("app.services.ddns_service.IPFetcher") as MockFetcher:
+            with patch("app.services.ddns_service.DynuProvider") as MockProvider:
+                MockProvider.return_value.update_record = update_record
+                results = [result async for result in service.update_domains(domains, "1.2.3.4", force=False)]
+
+        MockFetcher.assert_not_called()
+        assert peak == 3
+        by_name = {result["domain_name"]: result for result in results}
+        assert len(by_name) == 8
+        assert by_name["c1.example.com"]["status"] == "UNCHANGED"
+        assert by_name["c0.example.com"]["status"] == "FAILED"
+        assert sum(result["status"] == "SUCCESS" for result in results) == 6
+        # Nothing is written until the sink flushes
+        assert db.query(IPHistory).count() == 0
+        assert sink.flush() == 7
+
+        with pytest.raises(ValueError):
+            [result async for result in DDNSService(db).update_domains(domains, "1.2.3.4")]
+
+    @pytest.mark.asyncio
+    async def test_update_domains_outlive_the_caller(self, db: Session, session_factory, test_domain_db: Domain):
+        """Test that started updates finish on their own sessions after the caller stops iterating."""
+        import asyncio
+
+        domains = [test_domain_db] + [
+            Domain(provider_id=test_domain_db.provider_id, domain_name=f"d{i}.example.com", config={})
+            for i in range(3)
+        ]
+        db.add_all(domains[1:])
+        db.commit()
+        ids = [domain.id for domain in domains]
+
+        async def update_record(ip, domain_config):
+            await asyncio.sleep(0.05 if domain_config.name != "d0.example.com" else 0)
+            return True
+
+        sink = HistorySink(session_factory=session_factory, spool_path=None)
+        with patch("app.services.ddns_service.DynuProvider") as MockProvider:
+            MockProvider.return_value.update_record = update_record
+            results = DDNSService(db, sink=sink, session_factory=session_factory).update_domains(domains, "1.2.3.4")
+            assert (await results.__anext__())["domain_name"] == "d0.example.com"
+            # As when the client disconnects: the stream and the request's session are closed
+            await results.aclose()
+            db.close()
+            for _ in range(100):
+                if sink.depth == 4:
+                    break
+                await asyncio.sleep(0.01)
+
+        assert sink.depth == 4
+        assert sink.flush() == 4
+        assert {row.domain_id for row in db.query(IPHistory)} == set(ids)
+
+    @pytest.mark.asyncio
+    async def test_update_domain_ip_fetch_failure_is_recorded(self, db: Session, test_domain_db: Domain):
+        """Test that a failed IP fetch is persisted with the time it took."""
+        service = DDNSService(db)
+
+        with patch("app.services.ddns_service.IPFetcher") as MockFetcher:
+            MockFetcher.return_value.get_current_ip = AsyncMock(side_effect=IPFetchError("All services failed"))
+            with pytest.raises(IPFetchError):
+                await service.update_domain_ip(test_domain_db.id)
+
+        history = db.query(IPHistory).filter(IPHistory.domain_id == test_domain_db.id).one()
+        assert history.status == "FAILED"
+        assert history.ip_fetch_ms is not None
+        assert history.provider_ms is None
+
     @pytest.mark.asyncio
     async def test_update_domain_ip_fetch_failure(self, db: Session, test_domain_db: Domain):
         """Test domain update when IP fetch fails."""
@@ -119,6 +419,448 @@ class TestDDNSService:
             await service.update_domain_ip(test_domain_db.id)
 
 
+class TestHistoryRetention:
+    """Test set-based history retention."""
+
+    @pytest.fixture
+    def provider_db(self, db: Session) -> Provider:
+        """Create a provider to attach domains to."""
+        from app.core import security
+
+        provider = Provider(
+            name="Retention Provider",
+            type="dynu",
+            credentials_encrypted=security.encrypt_credentials({"token": "t"}),
+            is_enabled=True
+        )
+        db.add(provider)
+        db.commit()
+        return provider
+
+    def _add_domain(self, db: Session, provider: Provider, name: str, config: dict = None, entries: int = 0) -> Domain:
+        domain = Domain(provider_id=provider.id, domain_name=name, config=config or {})
+        db.add(domain)
+        db.commit()
+        now = datetime.now(UTC)
+        db.add_all([
+            IPHistory(
+                domain_id=domain.id,
+                ip_address=f"10.0.0.{i}",
+                status="SUCCESS",
+                timestamp=now - timedelta(days=i)
+            )
+            for i in range(entries)
+        ])
+        db.commit()
+        return domain
+
+    def test_retention_policy_defaults(self):
+        """Test global defaults and per-domain overrides."""
+        assert get_retention_policy({}) == (20, 0)
+        assert get_retention_policy(None) == (20, 0)
+        assert get_retention_policy({"history_max_records": 5, "history_max_age_days": 3}) == (5, 3)
+        assert get_retention_policy({"history_max_records": "7"}) == (7, 0)
+
+    def test_retention_policy_invalid_values(self):
+        """Test that values that aren't non-negative integers fall back to the defaults."""
+        assert get_retention_policy({"history_max_records": "lots", "history_max_age_days": 3}) == (20, 3)
+        assert get_retention_policy({"history_max_records": -5, "history_max_age_days": [1]}) == (20, 0)
+        assert get_retention_policy(["not", "a", "dict"]) == (20, 0)
+
+    def test_prune_keeps_newest_records(self, db: Session, provider_db: Provider):
+        """Test that only the newest records per domain are kept."""
+        busy = self._add_domain(db, provider_db, "busy.example.com", entries=25)
+        quiet = self._add_domain(db, provider_db, "quiet.example.com", entries=3)
+
+        deleted = prune_history(db, batch_size=1)
+
+        assert deleted == 5
+        kept = db.query(IPHistory).filter(IPHistory.domain_id == busy.id).all()
+        assert len(kept) == 20
+        # The five oldest entries (days 20-24) are gone
+        assert {h.ip_address for h in kept} == {f"10.0.0.{i}" for i in range(20)}
+        assert db.query(IPHistory).filter(IPHistory.domain_id == quiet.id).count() == 3
+
+    def test_prune_per_domain_overrides(self, db: Session, provider_db: Provider):
+        """Test count and age limits configured on the domain."""
+        by_count = self._add_domain(db, provider_db, "count.example.com", {"history_max_records": 2}, entries=6)
+        by_age = self._add_domain(db, provider_db, "age.example.com", {"history_max_age_days": 2}, entries=6)
+        unlimited = self._add_domain(db, provider_db, "all.example.com", {"history_max_records": 0}, entries=30)
+        invalid = self._add_domain(db, provider_db, "invalid.example.com", {"history_max_records": "many"}, entries=25)
+
+        prune_history(db)
+
+        assert db.query(IPHistory).filter(IPHistory.domain_id == by_count.id).count() == 2
+        # Entries from today and yesterday are younger than two days
+        assert db.query(IPHistory).filter(IPHistory.domain_id == by_age.id).count() == 2
+        assert db.query(IPHistory).filter(IPHistory.domain_id == unlimited.id).count() == 30
+        # An invalid override falls back to the default instead of aborting the prune
+        assert db.query(IPHistory).filter(IPHistory.domain_id == invalid.id).count() == 20
+
+
+class TestHistorySink:
+    """Test the buffered history writer."""
+
+    @pytest.fixture
+    def domain_db(self, db: Session) -> Domain:
+        """Create a domain to record history for."""
+        from app.core import security
+
+        provider = Provider(
+            name="Sink Provider",
+            type="dynu",
+            credentials_encrypted=security.encrypt_credentials({"token": "t"}),
+            is_enabled=True
+        )
+        db.add(provider)
+        db.commit()
+        domain = Domain(provider_id=provider.id, domain_name="sink.example.com", config={})
+        db.add(domain)
+        db.commit()
+        return domain
+
+    def test_record_is_buffered_until_flush(self, db: Session, session_factory, domain_db: Domain):
+        """Test that entries and domain status are written together on flush."""
+        sink = HistorySink(session_factory=session_factory, flush_size=100, spool_path=None)
+
+        sink.record(domain_db.id, "1.2.3.4", "SUCCESS", "ok", last_update_status="SUCCESS", last_known_ip="1.2.3.4")
+        sink.record(domain_db.id, "0.0.0.0", "FAILED", "fetch error")
+
+        assert sink.depth == 2
+        assert sink.pending_ip(domain_db.id) == "1.2.3.4"
+        assert db.query(IPHistory).count() == 0
+
+        assert sink.flush() == 2
+        assert sink.depth == 0
+        assert sink.pending_ip(domain_db.id) is None
+        db.refresh(domain_db)
+        assert domain_db.last_known_ip == "1.2.3.4"
+        assert domain_db.last_update_status == "SUCCESS"
+        assert db.query(IPHistory).count() == 2
+
+    def test_flush_writes_in_bounded_chunks(self, db: Session, session_factory, domain_db: Domain, tmp_path, monkeypatch):
+        """Test that a backlog is written flush_size entries per transaction, keeping what fails queued."""
+        spool = tmp_path / "spool.jsonl"
+        sink = HistorySink(session_factory=session_factory, flush_size=100, spool_path=str(spool))
+        for i in range(5):
+            sink.record(domain_db.id, f"1.2.3.{i}", "SUCCESS", last_update_status="SUCCESS", last_known_ip=f"1.2.3.{i}")
+        sink.flush_size = 2
+
+        write = HistorySink._write
+        calls = []
+
+        def failing_second_chunk(self, db, entries, domain_state):
+            calls.append(len(entries))
+            if len(calls) == 2:
+                raise RuntimeError("database is locked")
+            return write(self, db, entries, domain_state)
+
+        monkeypatch.setattr(HistorySink, "_write", failing_second_chunk)
+        assert sink.flush() == 2
+        assert calls == [2, 2]
+        assert sink.depth == 3
+        assert sink.pending_ip(domain_db.id) == "1.2.3.4"
+        assert len(spool.read_text().splitlines()) == 3
+        assert db.query(IPHistory).count() == 2
+
+        monkeypatch.setattr(HistorySink, "_write", write)
+        assert sink.flush() == 3
+        assert sink.depth == 0
+        assert spool.read_text() == ""
+        assert sorted(h.ip_address for h in db.query(IPHistory)) == [f"1.2.3.{i}" for i in range(5)]
+        db.refresh(domain_db)
+        assert domain_db.last_known_ip == "1.2.3.4"
+
+    def test_db_write_ms_is_shared_by_the_batch(self, db: Session, session_factory, domain_db: Domain, monkeypatch):
+        """Test that the batch's status write time is split between the domains it updated."""
+        from types import SimpleNamespace
+        from app.services import history_sink
+
+        other = Domain(provider_id=domain_db.provider_id, domain_name="other.example.com", config={})
+        db.add(other)
+        db.commit()
+        clock = iter([1.0, 1.010])
+        monkeypatch.setattr(history_sink, "time", SimpleNamespace(perf_counter=lambda: next(clock)))
+        sink = HistorySink(session_factory=session_factory, flush_size=100, spool_path=None)
+
+        sink.record(domain_db.id, "1.2.3.4", "SUCCESS", "ok", last_update_status="SUCCESS", last_known_ip="1.2.3.4")
+        sink.record(other.id, "0.0.0.0", "FAILED", "error", last_update_status="FAILED")
+        sink.record(other.id, "0.0.0.0", "FAILED", "no status change")
+        sink.flush()
+
+        rows = db.query(IPHistory).order_by(IPHistory.id).all()
+        assert [row.db_write_ms for row in rows] == [pytest.approx(5.0), pytest.approx(5.0), None]
+
+    def test_flush_on_size_threshold(self, db: Session, session_factory, domain_db: Domain):
+        """Test that reaching the batch size triggers a flush."""
+        sink = HistorySink(session_factory=session_factory, flush_size=3, spool_path=None)
+
+        for i in range(3):
+            sink.record(domain_db.id, f"1.1.1.{i}", "SUCCESS", last_update_status="SUCCESS", last_known_ip=f"1.1.1.{i}")
+
+        assert sink.depth == 0
+        assert db.query(IPHistory).count() == 3
+        db.refresh(domain_db)
+        assert domain_db.last_known_ip == "1.1.1.2"
+
+    def test_entries_for_deleted_domain_are_dropped(self, db: Session, session_factory, domain_db: Domain):
+        """Test that a flush skips domains removed while entries were queued."""
+        sink = HistorySink(session_factory=session_factory, spool_path=None)
+        sink.record(domain_db.id, "1.2.3.4", "SUCCESS", last_update_status="SUCCESS")
+        sink.record(999, "1.2.3.4", "SUCCESS", last_update_status="SUCCESS")
+
+        assert sink.flush() == 1
+
+    def test_journal_replay_after_crash(self, db: Session, session_factory, domain_db: Domain, tmp_path):
+        """Test that journaled entries are written by the next process."""
+        spool_path = str(tmp_path / "history_spool.jsonl")
+        crashed = HistorySink(session_factory=session_factory, spool_path=spool_path)
+        crashed.record(domain_db.id, "5.6.7.8", "SUCCESS", last_update_status="SUCCESS", last_known_ip="5.6.7.8")
+        # No flush: the process dies with the entry only in memory and in the journal
+
+        restarted = HistorySink(session_factory=session_factory, spool_path=spool_path)
+        assert restarted.replay_spool() == 1
+
+        assert db.query(IPHistory).count() == 1
+        db.refresh(domain_db)
+        assert domain_db.last_known_ip == "5.6.7.8"
+        with open(spool_path) as spool:
+            assert spool.read() == ""
+
+    @pytest.mark.asyncio
+    async def test_service_queues_results_on_sink(self, db: Session, session_factory, domain_db: Domain):
+        """Test that DDNSService defers writes to the sink when given one."""
+        sink = HistorySink(session_factory=session_factory, spool_path=None)
+        service = DDNSService(db, sink=sink)
+
+        with patch("app.services.ddns_service.IPFetcher") as MockFetcher:
+            MockFetcher.return_value.get_current_ip = AsyncMock(return_value="9.9.9.9")
+            with patch("app.services.ddns_service.DynuProvider") as MockProvider:
+                MockProvider.return_value.update_record = AsyncMock(return_value=True)
+                assert await service.update_domain_ip(domain_db.id) is True
+
+        assert db.query(IPHistory).count() == 0
+        assert sink.pending_ip(domain_db.id) == "9.9.9.9"
+
+        sink.flush()
+        db.refresh(domain_db)
+        assert domain_db.last_known_ip == "9.9.9.9"
+        assert domain_db.last_update_status == "SUCCESS"
+
+
+class TestEventBus:
+    """Test the in-process event bus behind the live activity stream."""
+
+    @pytest.mark.asyncio
+    async def test_subscribers_receive_published_events(self):
+        """Test delivery to subscribers, including from other threads."""
+        import threading
+        from app.services.event_bus import EventBus
+
+        bus = EventBus(buffer_size=10)
+        subscription = bus.subscribe()
+        bus.publish("update", {"n": 1})
+        publisher = threading.Thread(target=bus.publish, args=("update", {"n": 2}))
+        publisher.start()
+        publisher.join()
+
+        first = await subscription.get(timeout=1)
+        second = await subscription.get(timeout=1)
+        assert [first["data"]["n"], second["data"]["n"]] == [1, 2]
+        assert second["sequence"] == first["sequence"] + 1
+        assert second["id"] == f"{bus.boot_id}-{second['sequence']}"
+        assert await subscription.get(timeout=0.01) is None
+
+        subscription.close()
+        assert bus.subscriber_count == 0
+
+    @pytest.mark.asyncio
+    async def test_resume_from_ring_buffer(self):
+        """Test that reconnecting subscribers get the buffered events after their last id."""
+        from app.services.event_bus import EventBus
+
+        bus = EventBus(buffer_size=3)
+        ids = [bus.publish("update", {"n": n})["id"] for n in range(5)]
+
+        resumed = bus.subscribe(last_event_id=ids[2])
+        assert [event["id"] for event in resumed.backlog] == ids[3:]
+        # Older than the buffer: everything still buffered is replayed
+        stale = bus.subscribe(last_event_id=ids[0])
+        assert [event["id"] for event in stale.backlog] == ids[2:]
+        assert bus.subscribe().backlog == []
+
+    @pytest.mark.asyncio
+    async def test_resume_after_restart(self):
+        """Test that ids issued before a restart replay the whole buffer instead of skipping events."""
+        from app.services.event_bus import EventBus
+
+        before = EventBus(buffer_size=10)
+        seen = [before.publish("update", {"n": n})["id"] for n in range(5)]
+        after = EventBus(buffer_size=10)
+        ids = [after.publish("update", {"n": n})["id"] for n in range(2)]
+
+        assert [event["id"] for event in after.subscribe(last_event_id=seen[-1]).backlog] == ids
+        assert [event["id"] for event in after.subscribe(last_event_id="12").backlog] == ids
+
+    @pytest.mark.asyncio
+    async def test_slow_subscriber_overflows(self):
+        """Test that a subscriber that stops reading is flagged instead of growing unbounded."""
+        import asyncio
+        from app.services.event_bus import EventBus
+
+        bus = EventBus(buffer_size=10, max_pending=2)
+        subscription = bus.subscribe()
+        for n in range(3):
+            bus.publish("update", {"n": n})
+        await asyncio.sleep(0)
+
+        assert subscription.overflowed
+
+
+class TestSchedulerBatch:
+    """Test registering and removing many domain schedules at once."""
+
+    @pytest.mark.asyncio
+    async def test_add_and_remove_schedules(self):
+        """Test that a batch adds every valid job while pausing job processing once."""
+        from apscheduler.events import EVENT_SCHEDULER_PAUSED, EVENT_SCHEDULER_RESUMED
+        from apscheduler.schedulers.base import STATE_RUNNING
+        from app.services.scheduler import SchedulerService
+
+        service = SchedulerService()
+        try:
+            events = []
+            service.scheduler.add_listener(lambda event: events.append(event.code), EVENT_SCHEDULER_PAUSED | EVENT_SCHEDULER_RESUMED)
+
+            results = service.add_schedules({1: "*/5 * * * *", 2: "0 * * * *", 3: "not a cron"})
+            assert results == {1: True, 2: True, 3: False}
+            assert {job.id for job in service.scheduler.get_jobs()} == {"domain_1", "domain_2"}
+            assert events == [EVENT_SCHEDULER_PAUSED, EVENT_SCHEDULER_RESUMED]
+            assert service.scheduler.state == STATE_RUNNING
+
+            assert service.remove_schedules([1, 3]) == 1
+            assert [job.id for job in service.scheduler.get_jobs()] == ["domain_2"]
+        finally:
+            service.shutdown()
+
+
+    @pytest.mark.asyncio
+    async def test_sync_schedules(self, db, session_factory, monkeypatch):
+        """Test that schedules changed in the database, not through this instance, are reconciled."""
+        from app.models import Domain, Provider
+        from app.services.scheduler import SchedulerService
+
+        monkeypatch.setattr("app.services.scheduler.SessionLocal", session_factory)
+        provider = Provider(name="Sync", type="duckdns", credentials_encrypted="x")
+        db.add(provider)
+        db.flush()
+        kept = Domain(provider_id=provider.id, domain_name="kept.com", cron_schedule="*/5 * * * *")
+        changed = Domain(provider_id=provider.id, domain_name="changed.com", cron_schedule="0 * * * *")
+        db.add_all([kept, changed])
+        db.commit()
+
+        service = SchedulerService()
+        try:
+            service.add_schedules({kept.id: "*/5 * * * *", changed.id: "*/10 * * * *", 999: "*/5 * * * *"})
+            service.sync_schedules()
+            assert {job.id for job in service.scheduler.get_jobs()} == {f"domain_{kept.id}", f"domain_{changed.id}"}
+            assert service._crons[changed.id] == "0 * * * *"
+        finally:
+            service.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_sync_schedules_removes_cleared(self, db, session_factory, monkeypatch):
+        """Test that schedules cleared or made invalid in the database are removed."""
+        from app.models import Domain, Provider
+        from app.services.scheduler import SchedulerService
+
+        monkeypatch.setattr("app.services.scheduler.SessionLocal", session_factory)
+        provider = Provider(name="Sync", type="duckdns", credentials_encrypted="x")
+        db.add(provider)
+        db.flush()
+        cleared = Domain(provider_id=provider.id, domain_name="cleared.com", cron_schedule="*/5 * * * *")
+        invalid = Domain(provider_id=provider.id, domain_name="invalid.com", cron_schedule="*/5 * * * *")
+        db.add_all([cleared, invalid])
+        db.commit()
+
+        service = SchedulerService()
+        try:
+            service.add_schedules({cleared.id: "*/5 * * * *", invalid.id: "*/5 * * * *"})
+            cleared.cron_schedule = ""
+            invalid.cron_schedule = "not a cron"
+            db.commit()
+            service.sync_schedules()
+            assert service.scheduler.get_jobs() == []
+            assert service._crons == {}
+        finally:
+            service.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_scheduling_disabled(self, monkeypatch):
+        """Test that an instance with SCHEDULER_ENABLED off only flushes history."""
+        from app.core import config
+        from app.services.scheduler import SchedulerService
+
+        monkeypatch.setattr(config, "SCHEDULER_ENABLED", False)
+        service = SchedulerService()
+        try:
+            assert service.add_schedules({1: "*/5 * * * *"}) == {1: True}
+            assert service.add_schedule(2, "*/5 * * * *") is True
+            service.add_maintenance_jobs()
+            assert [job.id for job in service.scheduler.get_jobs()] == ["history_flush"]
+        finally:
+            service.shutdown()
+
+class TestUpdateJobs:
+    """Test the registry and execution of requested update jobs."""
+
+    def test_registry_coalesces_and_is_bounded(self):
+        """Test one active job per domain, eviction of finished jobs and refusal when full."""
+        from app.services.jobs import JobQueueFull, JobRegistry
+
+        registry = JobRegistry(max_jobs=2)
+        first, created = registry.create(1)
+        assert created
+        assert registry.create(1) == (first, False)
+
+        registry.start(first)
+        registry.finish(first, True, "done")
+        assert first.status == "succeeded"
+        second, created = registry.create(1)
+        assert created and second.id != first.id
+
+        third, _ = registry.create(2)
+        # The finished job made room
+        assert registry.get(first.id) is None
+        assert [job.id for job in registry.list()] == [third.id, second.id]
+        with pytest.raises(JobQueueFull):
+            registry.create(3)
+
+    @pytest.mark.asyncio
+    async def test_scheduler_runs_queued_job(self, session_factory, monkeypatch):
+        """Test that queued jobs run on the scheduler and record failures."""
+        import asyncio
+        from app.services.jobs import JobRegistry
+        from app.services.scheduler import SchedulerService
+
+        registry = JobRegistry()
+        monkeypatch.setattr("app.services.scheduler.get_job_registry", lambda: registry)
+        monkeypatch.setattr("app.services.scheduler.SessionLocal", session_factory)
+        service = SchedulerService()
+        try:
+            job, _ = registry.create(12345)
+            service.enqueue_update(job)
+            for _ in range(100):
+                if not job.active:
+                    break
+                await asyncio.sleep(0.01)
+            assert job.status == "failed"
+            assert job.message == "Domain not found"
+            assert job.started_at is not None
+        finally:
+            service.shutdown()
+
+
 class TestIPFetcher:
     """Test IP fetcher functionality."""
 
@@ -140,6 +882,24 @@ class TestIPFetcher:
             
             assert ip == "8.8.8.8"
 
+    @pytest.mark.asyncio
+    async def test_ip_fetcher_latency_per_service(self):
+        """Test that each lookup attempt is timed under its service host."""
+        from app.core import telemetry
+        from app.core.ip_fetcher import IPFetcher
+
+        def attempts(result):
+            labels = {"service": "checkip.amazonaws.com", "result": result}
+            return telemetry.registry.get_sample_value("iphop_ip_fetch_seconds_count", labels) or 0
+
+        before = attempts("success")
+        with patch("httpx.AsyncClient") as MockClient:
+            mock_response = Mock(text="8.8.8.8", raise_for_status=Mock())
+            MockClient.return_value.__aenter__.return_value.get = AsyncMock(return_value=mock_response)
+            await IPFetcher().get_current_ip()
+
+        assert attempts("success") == before + 1
+
     @pytest.mark.asyncio
     async def test_ip_fetcher_all_services_fail(self):
         """Test when all IP services fail."""
@@ -3,9 +3,10 @@ System endpoint and security tests.
 Tests system status, security utilities, and edge cases.
 """
 import pytest
+from unittest.mock import MagicMock, Mock
 from fastapi.testclient import TestClient
 
-from app.core import security
+from app.core import config, security
 
 
 class TestSystemEndpoints:
@@ -43,6 +44,51 @@ class TestSecurityUtilities:
         assert security.verify_password(password, hashed) is True
         assert security.verify_password("Wrong123!", hashed) is False
 
+    def test_sliding_window_limiter(self):
+        """Test that attempts are allowed again once they leave the window."""
+        import time
+        from app.core.throttle import SlidingWindowLimiter
+
+        limiter = SlidingWindowLimiter(limit=2, window=0.2)
+        assert limiter.attempt("key") == 0
+        assert limiter.attempt("key") == 0
+        assert 0 < limiter.attempt("key") <= 0.2
+        assert limiter.attempt("other") == 0
+        limiter.refund("key")
+        assert limiter.attempt("key") == 0
+        time.sleep(0.25)
+        assert limiter.attempt("key") == 0
+
+    def test_password_pool_bounded(self):
+        """Test that password tasks beyond the pool and its queue are refused."""
+        import asyncio
+        import threading
+        from app.core import security
+
+        started, release = threading.Event(), threading.Event()
+
+        def slow_hash():
+            started.set()
+            release.wait(5)
+            return "hash"
+
+        async def run():
+            slots = security._password_slots
+            security._password_slots = threading.BoundedSemaphore(1)
+            try:
+                first = asyncio.ensure_future(security.run_password_task(slow_hash))
+                await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+                with pytest.raises(security.PasswordHasherBusy):
+                    await security.run_password_task(slow_hash)
+                release.set()
+                assert await first == "hash"
+                # The slot is free again
+                assert await security.run_password_task(lambda: "again") == "again"
+            finally:
+                security._password_slots = slots
+
+        asyncio.run(run())
+
     def test_encrypt_decrypt_credentials(self):
         """Test credential encryption and decryption."""
         original = {"token": "secret_token_123", "api_key": "key456"}
@@ -54,6 +100,33 @@ class TestSecurityUtilities:
         decrypted = security.decrypt_credentials(encrypted)
         assert decrypted == original
 
+    def test_decrypted_credentials_cached(self, monkeypatch):
+        """Test that credentials are decrypted once and callers get their own copy."""
+        decrypt = MagicMock(wraps=security._decrypt_credentials)
+        monkeypatch.setattr(security, "_decrypt_credentials", decrypt)
+        encrypted = security.encrypt_credentials({"token": "cached", "extra": {"zone": "a"}})
+
+        first = security.decrypt_credentials(encrypted)
+        first["extra"]["zone"] = "changed"
+        assert security.decrypt_credentials(encrypted) == {"token": "cached", "extra": {"zone": "a"}}
+        assert decrypt.call_count == 1
+
+        security.forget_credentials(encrypted)
+        security.decrypt_credentials(encrypted)
+        assert decrypt.call_count == 2
+
+    def test_decrypted_credentials_cache_disabled(self, monkeypatch):
+        """Test that nothing is cached with CREDENTIALS_CACHE_ENABLED off."""
+        monkeypatch.setattr(config, "CREDENTIALS_CACHE_ENABLED", False)
+        decrypt = MagicMock(wraps=security._decrypt_credentials)
+        monkeypatch.setattr(security, "_decrypt_credentials", decrypt)
+        encrypted = security.encrypt_credentials({"token": "uncached"})
+
+        security.decrypt_credentials(encrypted)
+        security.decrypt_credentials(encrypted)
+        assert decrypt.call_count == 2
+        assert security._credentials_digest(encrypted) not in security.credentials_cache._entries
+
     def test_jwt_creation_and_verification(self):
         """Test JWT token creation and verification."""
         subject = "testuser"
@@ -217,3 +290,198 @@ class TestDatabaseIntegrity:
         # Verify relationship
         assert domain.provider.name == "Test"
         assert provider.domains[0].domain_name == "test.com"
+
+
+class TestResponseEncoding:
+    """Test JSON rendering and response compression."""
+
+    @pytest.fixture
+    def many_domains(self, db):
+        from app.models import Domain, Provider
+
+        provider = Provider(
+            name="Bulk",
+            type="dynu",
+            credentials_encrypted=security.encrypt_credentials({"token": "t"}),
+            is_enabled=True
+        )
+        db.add(provider)
+        db.commit()
+        db.add_all([
+            Domain(provider_id=provider.id, domain_name=f"host{i}.example.com", config={}, cron_schedule="*/5 * * * *")
+            for i in range(50)
+        ])
+        db.commit()
+
+    def test_large_response_is_gzipped(self, client: TestClient, auth_headers: dict, many_domains):
+        """Test gzip encoding of a large list when the client accepts it."""
+        response = client.get("/api/v1/domains", headers={**auth_headers, "Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert "Accept-Encoding" in response.headers["Vary"]
+        assert len(response.json()) == 50
+
+        response = client.get("/api/v1/domains", headers={**auth_headers, "Accept-Encoding": "identity"})
+        assert "Content-Encoding" not in response.headers
+        assert len(response.json()) == 50
+
+    def test_large_response_prefers_brotli(self, client: TestClient, auth_headers: dict, many_domains):
+        """Test that Brotli is preferred when the client accepts it."""
+        response = client.get("/api/v1/domains", headers={**auth_headers, "Accept-Encoding": "gzip, br"})
+        assert response.headers["Content-Encoding"] == "br"
+        assert len(response.json()) == 50
+
+        response = client.get("/api/v1/domains", headers={**auth_headers, "Accept-Encoding": "gzip, br;q=0"})
+        assert response.headers["Content-Encoding"] == "gzip"
+
+    def test_small_response_is_not_compressed(self, client: TestClient):
+        """Test that responses under the minimum size are sent as is."""
+        response = client.get("/", headers={"Accept-Encoding": "gzip, br"})
+        assert response.status_code == 200
+        assert "Content-Encoding" not in response.headers
+
+    def test_compressed_metrics_keep_etag(self, client: TestClient, auth_headers: dict, many_domains):
+        """Test that dict responses rendered directly keep their caching headers."""
+        response = client.get("/api/v1/metrics/ip-changes", headers={**auth_headers, "Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert response.headers["ETag"]
+        assert len(response.json()["domains"]) == 50
+
+    def test_dumps_encodes_database_values(self):
+        """Test JSON rendering of values aggregates and timestamps come back as."""
+        import json
+        from datetime import datetime, timezone
+        from decimal import Decimal
+        from app.api.v1.responses import dumps
+
+        content = {
+            "total": Decimal("12"),
+            "rate": Decimal("0.25"),
+            "at": datetime(2025, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+            "name": "é"
+        }
+        assert json.loads(dumps(content)) == {
+            "total": 12,
+            "rate": 0.25,
+            "at": "2025-01-02T03:04:05+00:00",
+            "name": "é"
+        }
+
+
+@pytest.fixture
+def old_key(monkeypatch):
+    """An old encryption key still configured alongside ENCRYPTION_KEY."""
+    from cryptography.fernet import Fernet, MultiFernet
+
+    old = Fernet(Fernet.generate_key())
+    monkeypatch.setattr(security, "ENCRYPTION_OLD_KEYS", ["old"])
+    monkeypatch.setattr(security, "fernet", MultiFernet([security.primary_fernet, old]))
+    return old
+
+
+class TestKeyRotation:
+    """Test re-encrypting provider credentials after an encryption key change."""
+
+    def add_providers(self, db, cipher, count: int):
+        import json
+        from app.models import Provider
+
+        for i in range(count):
+            encrypted = cipher.encrypt(json.dumps({"token": f"token-{i}"}).encode()).decode()
+            db.add(Provider(name=f"Provider {i}", type="duckdns", credentials_encrypted=encrypted))
+        db.commit()
+
+    def test_old_key_still_decrypts(self, old_key):
+        """Test that credentials under an old key are readable and flagged for re-encryption."""
+        encrypted = old_key.encrypt(b'{"token": "old"}').decode()
+        assert security.decrypt_credentials(encrypted) == {"token": "old"}
+        assert security.needs_reencryption(encrypted) is True
+        assert security.needs_reencryption(security.encrypt_credentials({"token": "new"})) is False
+
+    def test_reencrypt_in_batches(self, db, old_key):
+        """Test that every provider ends up under the current key, and a second run skips them."""
+        from app.models import Provider
+        from app.services.key_rotation import KeyRotation, reencrypt_providers
+
+        self.add_providers(db, old_key, 5)
+        db.add(Provider(name="Current", type="duckdns", credentials_encrypted=security.encrypt_credentials({"token": "current"})))
+        db.commit()
+
+        rotation = reencrypt_providers(db, KeyRotation(), batch_size=2)
+        assert (rotation.total, rotation.processed, rotation.reencrypted, rotation.failed) == (6, 6, 5, 0)
+        db.expire_all()
+        for provider in db.query(Provider).order_by(Provider.id):
+            assert security.needs_reencryption(provider.credentials_encrypted) is False
+        first = db.query(Provider).order_by(Provider.id).first()
+        assert security.primary_fernet.decrypt(first.credentials_encrypted.encode()) == b'{"token": "token-0"}'
+
+        again = reencrypt_providers(db, KeyRotation(), batch_size=2)
+        assert (again.processed, again.reencrypted) == (6, 0)
+
+    def test_undecryptable_credentials_left_alone(self, db, old_key):
+        """Test that credentials under an unknown key are counted as failed and kept."""
+        from cryptography.fernet import Fernet
+        from app.models import Provider
+        from app.services.key_rotation import KeyRotation, reencrypt_providers
+
+        self.add_providers(db, Fernet(Fernet.generate_key()), 1)
+        unknown = db.query(Provider).one().credentials_encrypted
+
+        rotation = reencrypt_providers(db, KeyRotation())
+        assert (rotation.reencrypted, rotation.failed) == (0, 1)
+        db.expire_all()
+        assert db.query(Provider).one().credentials_encrypted == unknown
+
+    def test_concurrent_change_wins(self, db, old_key, monkeypatch):
+        """Test that credentials changed after being read are not overwritten."""
+        from app.models import Provider
+        from app.services import key_rotation
+
+        self.add_providers(db, old_key, 1)
+        provider = db.query(Provider).one()
+        edited = security.encrypt_credentials({"token": "edited"})
+        reencrypt = security.reencrypt_credentials
+
+        def edit_meanwhile(encrypted_str):
+            db.query(Provider).filter(Provider.id == provider.id).update({"credentials_encrypted": edited})
+            return reencrypt(encrypted_str)
+
+        monkeypatch.setattr(security, "reencrypt_credentials", edit_meanwhile)
+        rotation = key_rotation.reencrypt_providers(db, key_rotation.KeyRotation())
+        assert rotation.reencrypted == 0
+        db.expire_all()
+        assert db.query(Provider).one().credentials_encrypted == edited
+
+    def test_start_and_report_progress(self, client: TestClient, auth_headers: dict, db, old_key, monkeypatch):
+        """Test starting a rotation through the API and following its progress."""
+        from app.services import key_rotation
+        from app.services.scheduler import SchedulerService
+
+        self.add_providers(db, old_key, 3)
+        rotation = key_rotation.KeyRotation()
+        monkeypatch.setattr(key_rotation, "key_rotation", rotation)
+        # A scheduler service whose APScheduler only records the jobs it is given
+        scheduler = SchedulerService.__new__(SchedulerService)
+        scheduler.scheduler = Mock()
+        monkeypatch.setattr("app.api.v1.endpoints.system.get_scheduler", lambda: scheduler)
+
+        response = client.post("/api/v1/system/key-rotation", headers=auth_headers)
+        assert response.status_code == 202
+        assert response.json()["status"] == "running"
+        assert scheduler.scheduler.add_job.call_args.kwargs["id"] == "key_rotation"
+        assert client.post("/api/v1/system/key-rotation", headers=auth_headers).status_code == 409
+
+        # Run the job the scheduler was given, on the test database
+        monkeypatch.setattr(key_rotation, "SessionLocal", lambda: db)
+        key_rotation.run_key_rotation(*scheduler.scheduler.add_job.call_args.kwargs["args"])
+        data = client.get("/api/v1/system/key-rotation", headers=auth_headers).json()
+        assert data["status"] == "completed"
+        assert (data["total"], data["processed"], data["reencrypted"], data["failed"]) == (3, 3, 3, 0)
+        assert data["old_keys"] == 1
+
+    def test_key_rotation_requires_auth(self, client: TestClient):
+        """Test that key rotation endpoints require authentication."""
+        client.cookies.clear()
+        assert client.get("/api/v1/system/key-rotation").status_code == 401
+        assert client.post("/api/v1/system/key-rotation").status_code == 401
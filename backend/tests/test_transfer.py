@@ -0,0 +1,181 @@
+"""
+Configuration export and import tests.
+Tests the NDJSON format, credential re-encryption, upserts and rejected imports.
+"""
+import json
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core import config, security
+from app.models import Domain, Provider
+
+EXPORT_KEY = "correct horse battery"
+
+
+@pytest.fixture
+def configured(client: TestClient, auth_headers: dict, monkeypatch, mock_scheduler) -> dict:
+    """A provider with five domains, two of them scheduled, exported in batches of two."""
+    monkeypatch.setattr(config, "TRANSFER_BATCH_SIZE", 2)
+    monkeypatch.setattr("app.api.v1.endpoints.transfer.get_scheduler", lambda: mock_scheduler)
+    monkeypatch.setattr("app.api.v1.endpoints.domains.get_scheduler", lambda: mock_scheduler)
+    provider = client.post(
+        "/api/v1/providers",
+        headers=auth_headers,
+        json={"name": "Main", "type": "duckdns", "credentials": {"token": "s3cret-token"}}
+    ).json()
+    for i in range(5):
+        client.post(
+            "/api/v1/domains",
+            headers=auth_headers,
+            json={
+                "provider_id": provider["id"],
+                "domain_name": f"host{i}.example.com",
+                "config": {"ttl": 60 + i},
+                "cron_schedule": "*/5 * * * *" if i < 2 else None
+            }
+        )
+    return provider
+
+
+def export(client: TestClient, auth_headers: dict) -> bytes:
+    response = client.get("/api/v1/export", headers={**auth_headers, "X-Export-Key": EXPORT_KEY})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    return response.content
+
+
+def import_(client: TestClient, auth_headers: dict, body: bytes, key: str = EXPORT_KEY):
+    return client.post(
+        "/api/v1/import",
+        headers={**auth_headers, "X-Export-Key": key, "Content-Type": "application/x-ndjson"},
+        content=body
+    )
+
+
+class TestExport:
+    """Test GET /export."""
+
+    def test_export_format(self, client: TestClient, auth_headers: dict, configured: dict):
+        """Test the header, provider, domain and footer lines."""
+        lines = [json.loads(line) for line in export(client, auth_headers).splitlines()]
+
+        assert [line["kind"] for line in lines] == ["header", "provider"] + ["domain"] * 5 + ["footer"]
+        assert lines[0]["format"] == "ip-hop-export"
+        assert lines[1]["name"] == "Main"
+        assert "s3cret-token" not in lines[1]["credentials"]
+        assert [line["domain_name"] for line in lines[2:7]] == [f"host{i}.example.com" for i in range(5)]
+        assert lines[2]["config"] == {"ttl": 60}
+        assert lines[2]["cron_schedule"] == "*/5 * * * *"
+        assert lines[-1] == {"kind": "footer", "providers": 1, "domains": 5}
+
+    def test_export_requires_key(self, client: TestClient, auth_headers: dict):
+        """Test that a missing or short export key is rejected."""
+        assert client.get("/api/v1/export", headers=auth_headers).status_code == 400
+        assert client.get("/api/v1/export", headers={**auth_headers, "X-Export-Key": "short"}).status_code == 400
+
+    def test_export_unauthenticated(self, client: TestClient):
+        """Test that exporting requires authentication."""
+        assert client.get("/api/v1/export", headers={"X-Export-Key": EXPORT_KEY}).status_code == 401
+
+
+class TestImport:
+    """Test POST /import."""
+
+    def test_import_recreates_configuration(self, client: TestClient, auth_headers: dict, configured: dict, db, mock_scheduler):
+        """Test restoring an export after everything was deleted."""
+        body = export(client, auth_headers)
+        client.delete(f"/api/v1/providers/{configured['id']}", headers=auth_headers)
+        assert db.query(Domain).count() == 0
+
+        response = import_(client, auth_headers, body)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["providers"] == {"created": 1, "updated": 0}
+        assert data["domains"] == {"created": 5, "updated": 0}
+        assert data["scheduled"] == 2
+
+        provider = db.query(Provider).one()
+        assert security.decrypt_credentials(provider.credentials_encrypted) == {"token": "s3cret-token"}
+        domains = db.query(Domain).order_by(Domain.id).all()
+        assert [domain.domain_name for domain in domains] == [f"host{i}.example.com" for i in range(5)]
+        assert all(domain.provider_id == provider.id for domain in domains)
+        assert domains[4].config == {"ttl": 64}
+        mock_scheduler.add_schedules.assert_called_with({domains[0].id: "*/5 * * * *", domains[1].id: "*/5 * * * *"})
+
+    def test_import_updates_existing(self, client: TestClient, auth_headers: dict, configured: dict, db, mock_scheduler):
+        """Test that matching providers and domains are updated rather than duplicated."""
+        lines = [json.loads(line) for line in export(client, auth_headers).splitlines()]
+        lines[2]["cron_schedule"] = None
+        lines[3]["config"] = {"ttl": 300}
+        body = "\n".join(json.dumps(line) for line in lines).encode()
+
+        data = import_(client, auth_headers, body).json()
+        assert data["providers"] == {"created": 0, "updated": 1}
+        assert data["domains"] == {"created": 0, "updated": 5}
+        assert data["scheduled"] == 1
+
+        db.expire_all()
+        assert db.query(Domain).count() == 5
+        first, second = db.query(Domain).order_by(Domain.id).limit(2).all()
+        assert first.cron_schedule is None
+        assert second.config == {"ttl": 300}
+        assert first.id in mock_scheduler.remove_schedules.call_args[0][0]
+
+    def test_import_staged_before_writing(self, client: TestClient, auth_headers: dict, configured: dict, db, monkeypatch):
+        """Test that nothing touches the database until the whole upload has been read."""
+        from app.api.v1.endpoints import transfer
+
+        body = export(client, auth_headers)
+        db.commit()
+        write = transfer._Importer.write
+        states = []
+
+        def checked_write(self, session):
+            states.append((session.in_transaction(), self.received))
+            return write(self, session)
+
+        monkeypatch.setattr(transfer._Importer, "write", checked_write)
+        assert import_(client, auth_headers, body).status_code == 200
+        assert states == [(False, 5)]
+
+    def test_import_wrong_key(self, client: TestClient, auth_headers: dict, configured: dict, db):
+        """Test that credentials can't be imported with another key."""
+        body = export(client, auth_headers)
+        client.delete(f"/api/v1/providers/{configured['id']}", headers=auth_headers)
+
+        response = import_(client, auth_headers, body, key="another passphrase")
+        assert response.status_code == 400
+        assert db.query(Provider).count() == 0
+
+    def test_import_incomplete(self, client: TestClient, auth_headers: dict, configured: dict, db):
+        """Test that a truncated export is rejected without importing anything."""
+        body = export(client, auth_headers)
+        client.delete(f"/api/v1/providers/{configured['id']}", headers=auth_headers)
+
+        truncated = b"\n".join(body.splitlines()[:-2])
+        response = import_(client, auth_headers, truncated)
+        assert response.status_code == 422
+        assert response.json()["detail"]["error"] == "The export is incomplete"
+        assert db.query(Provider).count() == 0
+        assert db.query(Domain).count() == 0
+
+    def test_import_invalid_line(self, client: TestClient, auth_headers: dict, configured: dict, db):
+        """Test that an invalid line rejects the import and is reported by number."""
+        lines = export(client, auth_headers).splitlines()
+        client.delete(f"/api/v1/providers/{configured['id']}", headers=auth_headers)
+
+        domain = json.loads(lines[6])
+        domain["cron_schedule"] = "not a cron"
+        lines[6] = json.dumps(domain).encode()
+        response = import_(client, auth_headers, b"\n".join(lines))
+        assert response.status_code == 422
+        assert response.json()["detail"]["line"] == 7
+        assert "Invalid cron expression" in response.json()["detail"]["error"]
+        assert db.query(Domain).count() == 0
+
+    def test_import_requires_header(self, client: TestClient, auth_headers: dict):
+        """Test that bodies other than an export are rejected."""
+        response = import_(client, auth_headers, b'{"kind": "domain", "domain_name": "a.com"}\n')
+        assert response.status_code == 422
+        assert response.json()["detail"]["line"] == 1
+        assert import_(client, auth_headers, b"").status_code == 400